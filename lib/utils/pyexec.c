@@ -53,6 +53,7 @@ STATIC bool repl_display_debugging_info = 0;
 #define EXEC_FLAG_SOURCE_IS_RAW_CODE (8)
 #define EXEC_FLAG_SOURCE_IS_VSTR (16)
 #define EXEC_FLAG_SOURCE_IS_FILENAME (32)
+#define EXEC_FLAG_SOURCE_IS_READER (64)
 
 // parses, compiles and executes the code in the lexer
 // frees the lexer before returning
@@ -83,6 +84,8 @@ STATIC int parse_compile_execute(const void *source, mp_parse_input_kind_t input
                 lex = mp_lexer_new_from_str_len(MP_QSTR__lt_stdin_gt_, vstr->buf, vstr->len, 0);
             } else if (exec_flags & EXEC_FLAG_SOURCE_IS_FILENAME) {
                 lex = mp_lexer_new_from_file(source);
+            } else if (exec_flags & EXEC_FLAG_SOURCE_IS_READER) {
+                lex = mp_lexer_new(MP_QSTR__lt_stdin_gt_, *(mp_reader_t*)source);
             } else {
                 lex = (mp_lexer_t*)source;
             }
@@ -151,6 +154,101 @@ STATIC int parse_compile_execute(const void *source, mp_parse_input_kind_t input
 }
 
 #if MICROPY_ENABLE_COMPILER
+#if !MICROPY_REPL_EVENT_DRIVEN
+
+// Raw-paste mode: The raw REPL compiles the code while it is received (entered by CTRL-E, "A", CTRL-A).
+// The host may only send as many bytes as the device granted by flow control:
+// The device announces a window size, then sends 0x01 each time a window was consumed.
+// The port can configure the size of its stdin buffer.
+#ifndef MICROPY_REPL_STDIN_BUFFER_MAX
+#define MICROPY_REPL_STDIN_BUFFER_MAX (256)
+#endif
+
+typedef struct _mp_reader_stdin_t {
+    bool eof;
+    uint16_t window_max;
+    uint16_t window_remain;
+} mp_reader_stdin_t;
+
+STATIC mp_uint_t mp_reader_stdin_readbyte(void *data) {
+    mp_reader_stdin_t *reader = (mp_reader_stdin_t*)data;
+
+    if (reader->eof) {
+        return MP_READER_EOF;
+    }
+
+    int c = mp_hal_stdin_rx_chr();
+
+    if (c == CHAR_CTRL_C || c == CHAR_CTRL_D) {
+        reader->eof = true;
+        mp_hal_stdout_tx_strn("\x04", 1); // indicate end to host
+        if (c == CHAR_CTRL_C) {
+            #if MICROPY_KBD_EXCEPTION
+            MP_STATE_VM(mp_kbd_exception).traceback_data = NULL;
+            nlr_raise(MP_OBJ_FROM_PTR(&MP_STATE_VM(mp_kbd_exception)));
+            #else
+            nlr_raise(mp_obj_new_exception(&mp_type_KeyboardInterrupt));
+            #endif
+        }
+        return MP_READER_EOF;
+    }
+
+    if (--reader->window_remain == 0) {
+        mp_hal_stdout_tx_strn("\x01", 1); // indicate window available to host
+        reader->window_remain = reader->window_max;
+    }
+
+    return c;
+}
+
+STATIC void mp_reader_stdin_close(void *data) {
+    mp_reader_stdin_t *reader = (mp_reader_stdin_t*)data;
+    if (!reader->eof) {
+        // compilation failed: discard the rest of the code
+        reader->eof = true;
+        mp_hal_stdout_tx_strn("\x04", 1); // indicate end to host
+        for (;;) {
+            int c = mp_hal_stdin_rx_chr();
+            if (c == CHAR_CTRL_C || c == CHAR_CTRL_D) {
+                break;
+            }
+        }
+    }
+}
+
+STATIC void mp_reader_new_stdin(mp_reader_t *reader, mp_reader_stdin_t *reader_stdin, uint16_t buf_max) {
+    // The window is half of the buffer: Announcing the window size grants the first window,
+    // the 0x01 grants the second one.
+    size_t window = buf_max / 2;
+    char reply[3] = { window & 0xff, window >> 8, 0x01 };
+    mp_hal_stdout_tx_strn(reply, sizeof(reply));
+
+    reader_stdin->eof = false;
+    reader_stdin->window_max = window;
+    reader_stdin->window_remain = window;
+    reader->data = reader_stdin;
+    reader->readbyte = mp_reader_stdin_readbyte;
+    reader->close = mp_reader_stdin_close;
+}
+
+STATIC int do_reader_stdin(int c) {
+    if (c != 'A') {
+        // unsupported command
+        mp_hal_stdout_tx_strn("R\x00", 2);
+        return 0;
+    }
+
+    // indicate reception of command
+    mp_hal_stdout_tx_strn("R\x01", 2);
+
+    mp_reader_t reader;
+    mp_reader_stdin_t reader_stdin;
+    mp_reader_new_stdin(&reader, &reader_stdin, MICROPY_REPL_STDIN_BUFFER_MAX);
+    return parse_compile_execute(&reader, MP_PARSE_FILE_INPUT, EXEC_FLAG_PRINT_EOF | EXEC_FLAG_SOURCE_IS_READER);
+}
+
+#endif // !MICROPY_REPL_EVENT_DRIVEN
+
 #if MICROPY_REPL_EVENT_DRIVEN
 
 typedef struct _repl_t {
@@ -181,6 +279,12 @@ void pyexec_event_repl_init(void) {
 
 STATIC int pyexec_raw_repl_process_char(int c) {
     if (c == CHAR_CTRL_A) {
+        if (MP_STATE_VM(repl_line)->len == 2 && MP_STATE_VM(repl_line)->buf[0] == CHAR_CTRL_E) {
+            // raw-paste mode would block the event loop: the host falls back to the raw REPL
+            mp_hal_stdout_tx_strn("R\x00", 2);
+            vstr_reset(MP_STATE_VM(repl_line));
+            return 0;
+        }
         // reset raw REPL
         mp_hal_stdout_tx_str("raw REPL; CTRL-B to exit\r\n");
         goto reset;
@@ -332,6 +436,18 @@ raw_repl_reset:
         for (;;) {
             int c = mp_hal_stdin_rx_chr();
             if (c == CHAR_CTRL_A) {
+                if (line.len == 2 && line.buf[0] == CHAR_CTRL_E) {
+                    // raw-paste mode: CTRL-E, the command and CTRL-A.
+                    // A device without raw-paste mode just resets the raw REPL.
+                    int ret = do_reader_stdin(line.buf[1]);
+                    if (ret & PYEXEC_FORCED_EXIT) {
+                        vstr_clear(&line);
+                        return ret;
+                    }
+                    vstr_reset(&line);
+                    mp_hal_stdout_tx_str(">");
+                    continue;
+                }
                 // reset raw REPL
                 goto raw_repl_reset;
             } else if (c == CHAR_CTRL_B) {
@@ -9,14 +9,15 @@
 #include "py/mphal.h"
 #include "modesp.h"
 
-void IRAM_ATTR esp_neopixel_write(uint8_t pin, uint8_t *pixels, uint32_t numBytes, uint8_t timing) {
+// lut: NULL or 256 bytes which are looked up for every byte (brightness/gamma)
+void IRAM_ATTR esp_neopixel_write(uint8_t pin, uint8_t *pixels, uint32_t numBytes, uint8_t timing, const uint8_t *lut) {
     uint8_t *p, *end, pix, mask;
     uint32_t t, time0, time1, period, c, startTime, pinMask;
 
     pinMask   = 1 << pin;
     p         =  pixels;
     end       =  p + numBytes;
-    pix       = *p++;
+    pix       = lut ? lut[*p++] : *p++;
     mask      = 0x80;
     startTime = 0;
 
@@ -44,7 +45,7 @@ void IRAM_ATTR esp_neopixel_write(uint8_t pin, uint8_t *pixels, uint32_t numByte
         GPIO_REG_WRITE(GPIO_OUT_W1TC_REG, pinMask);                 // Set low
         if (!(mask >>= 1)) {                                        // Next bit/byte
             if(p >= end) break;
-            pix  = *p++;
+            pix  = lut ? lut[*p++] : *p++;         // The lookup fits into the low phase
             mask = 0x80;
         }
     }
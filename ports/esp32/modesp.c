@@ -113,14 +113,24 @@ STATIC mp_obj_t esp_gpio_matrix_out(size_t n_args, const mp_obj_t *args) {
 }
 STATIC MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(esp_gpio_matrix_out_obj, 4, 4, esp_gpio_matrix_out);
 
-STATIC mp_obj_t esp_neopixel_write_(mp_obj_t pin, mp_obj_t buf, mp_obj_t timing) {
+STATIC mp_obj_t esp_neopixel_write_(size_t n_args, const mp_obj_t *args) {
     mp_buffer_info_t bufinfo;
-    mp_get_buffer_raise(buf, &bufinfo, MP_BUFFER_READ);
-    esp_neopixel_write(mp_hal_get_pin_obj(pin),
-        (uint8_t*)bufinfo.buf, bufinfo.len, mp_obj_get_int(timing));
+    mp_get_buffer_raise(args[1], &bufinfo, MP_BUFFER_READ);
+    // Hans: Optional lookup table applied while writing, see neopixel.NeoPixel.lut()
+    const uint8_t *lut = NULL;
+    if (n_args > 3 && args[3] != mp_const_none) {
+        mp_buffer_info_t lutinfo;
+        mp_get_buffer_raise(args[3], &lutinfo, MP_BUFFER_READ);
+        if (lutinfo.len != 256) {
+            mp_raise_ValueError("lut must have 256 bytes");
+        }
+        lut = (const uint8_t*)lutinfo.buf;
+    }
+    esp_neopixel_write(mp_hal_get_pin_obj(args[0]),
+        (uint8_t*)bufinfo.buf, bufinfo.len, mp_obj_get_int(args[2]), lut);
     return mp_const_none;
 }
-STATIC MP_DEFINE_CONST_FUN_OBJ_3(esp_neopixel_write_obj, esp_neopixel_write_);
+STATIC MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(esp_neopixel_write_obj, 3, 4, esp_neopixel_write_);
 
 STATIC const mp_rom_map_elem_t esp_module_globals_table[] = {
     { MP_ROM_QSTR(MP_QSTR___name__), MP_ROM_QSTR(MP_QSTR_esp) },
@@ -1,5 +1,7 @@
 import gc
 import uos
+import hw_boot_profile
+hw_boot_profile.checkpoint('_boot.py')
 from flashbdev import bdev
 
 try:
@@ -10,3 +12,4 @@ except OSError:
     vfs = inisetup.setup()
 
 gc.collect()
+hw_boot_profile.checkpoint('mount')
@@ -4,19 +4,30 @@
 
 
 import machine
-import hw_utils
+import hw_lazy
+import hw_boot_profile
+hw_boot_profile.checkpoint('boot.py')
 
-# Register some useful commands
-# setRtcRamSSID = hw_update_ota.setRtcRamSSID
-# checkForNewSwAndReboot = hw_utils.Command(hw_update_ota.checkForNewSwAndRebootRepl)
-# updateAndReboot = hw_utils.Command(hw_update_ota.updateAndReboot)
-formatAndReboot = hw_utils.Command(hw_utils.formatAndReboot)
-deleteVERSION_TXTandReboot = hw_utils.Command(hw_utils.deleteVERSION_TXTandReboot)
-reboot = hw_utils.Command(machine.reset)
-print_mem_usage = hw_utils.Command(hw_utils.print_mem_usage)
+# Imported on first use
+hw_utils = hw_lazy.LazyModule('hw_utils')
+
+# Register some useful commands: The modules are imported when a command is called
+# setRtcRamSSID = hw_lazy.LazyModule('hw_update_ota').setRtcRamSSID
+# checkForNewSwAndReboot = hw_lazy.Command('hw_update_ota.checkForNewSwAndRebootRepl')
+# updateAndReboot = hw_lazy.Command('hw_update_ota.updateAndReboot')
+formatAndReboot = hw_lazy.Command('hw_utils.formatAndReboot')
+deleteVERSION_TXTandReboot = hw_lazy.Command('hw_utils.deleteVERSION_TXTandReboot')
+reboot = hw_lazy.Command(machine.reset)
+print_mem_usage = hw_lazy.Command('hw_utils.print_mem_usage')
+printBootProfile = hw_lazy.Command(hw_boot_profile.printTable)
 
 # The following line will not return if a update is available
+# Waking up from deepsleep, see portable_firmware_constants.bBOOT_DEEPSLEEP_FAST
 hw_utils.bootCheckUpdate()
+hw_boot_profile.checkpoint('bootCheckUpdate')
 
 hw_utils.print_mem_usage()
 print('end of boot.py')
+# Opt-in, see hw_boot_profile.enable()
+hw_boot_profile.checkpoint('end of boot.py')
+hw_boot_profile.save()
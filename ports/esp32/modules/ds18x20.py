@@ -1 +0,0 @@
-../../esp8266/modules/ds18x20.py
\ No newline at end of file
@@ -0,0 +1,81 @@
+# DS18x20 temperature sensor driver for MicroPython.
+# MIT license; Copyright (c) 2016 Damien P. George
+
+from micropython import const
+
+_CONVERT = const(0x44)
+_RD_SCRATCH = const(0xbe)
+_WR_SCRATCH = const(0x4e)
+
+class DS18X20:
+    def __init__(self, onewire):
+        self.ow = onewire
+        self.buf = bytearray(9)
+
+    def scan(self):
+        return [rom for rom in self.ow.scan() if rom[0] == 0x10 or rom[0] == 0x28]
+
+    def scan_cached(self, roms=None):
+        # roms: The list returned by a previous call, kept by the caller
+        # (for example over deepsleep): The search is skipped.
+        # An empty list is scanned again: A sensor may not answer yet during power up
+        if not roms:
+            roms = [bytes(rom) for rom in self.scan()]
+        return roms
+
+    def convert_temp(self):
+        self.ow.reset(True)
+        self.ow.writebyte(self.ow.SKIP_ROM)
+        self.ow.writebyte(_CONVERT)
+
+    def _read_scratch(self, rom):
+        # Returns False on a CRC error
+        self.ow.reset(True)
+        self.ow.select_rom(rom)
+        self.ow.writebyte(_RD_SCRATCH)
+        self.ow.readinto(self.buf)
+        return self.ow.crc8(self.buf) == 0
+
+    def read_scratch(self, rom):
+        if not self._read_scratch(rom):
+            raise Exception('CRC error')
+        return self.buf
+
+    def write_scratch(self, rom, buf):
+        self.ow.reset(True)
+        self.ow.select_rom(rom)
+        self.ow.writebyte(_WR_SCRATCH)
+        self.ow.write(buf)
+
+    def read_temp(self, rom):
+        return self._temp(rom, self.read_scratch(rom))
+
+    def _temp(self, rom, buf):
+        if rom[0] == 0x10:
+            if buf[1]:
+                t = buf[0] >> 1 | 0x80
+                t = -((~t + 1) & 0xff)
+            else:
+                t = buf[0] >> 1
+            return t - 0.25 + (buf[7] - buf[6]) / buf[7]
+        else:
+            t = buf[1] << 8 | buf[0]
+            if t & 0x8000: # sign bit set
+                t = -((t ^ 0xffff) + 1)
+            return t / 16
+
+    def is_ready(self):
+        # The sensors answer 0 to a read slot while converting.
+        # Parasite powered sensors don't: Wait 750ms for them.
+        return self.ow.readbit() == 1
+
+    def read_temps(self, roms):
+        # Reads the scratchpads of all sensors after one convert_temp().
+        # Returns a list of temperatures, None for a sensor with a CRC error.
+        temps = []
+        for rom in roms:
+            if self._read_scratch(rom):
+                temps.append(self._temp(rom, self.buf))
+            else:
+                temps.append(None)
+        return temps
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+'''
+Opt-in profiler for the boot phases.
+
+checkpoint() records (strName, utime.ticks_us(), gc.mem_alloc()).
+utime.ticks_us() counts from the reset: The first checkpoint shows the
+latency from the cold boot to the start of '_boot.py'.
+
+The profiler is enabled by a magic word in the RTC SLOW memory at ADDR_PROFILE.
+If it is disabled, checkpoint() only compares a boolean and hw_rtc_mem is not imported.
+
+Testing:
+import hw_boot_profile
+hw_boot_profile.enable()
+
+import machine
+machine.reset()
+
+import hw_boot_profile
+hw_boot_profile.printTable()
+
+ASSERT: A table with the phases of the last boot must be displayed!
+'''
+
+import gc
+import utime
+import machine
+
+# The last word of the RTC SLOW memory, behind the areas of hw_rtc_mem
+ADDR_PROFILE = 0x50001FFC
+
+# Below 2**30: Comparing it doesn't allocate a long int
+PROFILE_MAGIC = 0x0B00710F
+
+# Key in the RtcMem-dictionary: The checkpoints of the last boot
+strRTC_PROFILE = 'bootProfile'
+
+bEnabled = machine.mem32[ADDR_PROFILE] == PROFILE_MAGIC
+
+# (strName, iTicks_us, iMemAlloc)
+listCheckpoints = []
+
+def enable(bEnable=True):
+  '''The profiler is active from the next boot on.'''
+  machine.mem32[ADDR_PROFILE] = PROFILE_MAGIC if bEnable else 0
+
+def checkpoint(strName):
+  if bEnabled:
+    listCheckpoints.append((strName, utime.ticks_us(), gc.mem_alloc()))
+
+def importModule(strModule):
+  '''
+    Imports a module and records its import time.
+    Use this for the imports following 'boot.py'.
+  '''
+  objModule = __import__(strModule)
+  checkpoint('import ' + strModule)
+  return objModule
+
+def save():
+  '''Stores the checkpoints in the RtcMem: They survive the next reboot.'''
+  if bEnabled:
+    import hw_rtc_mem
+    hw_rtc_mem.objRtcMem.updateRtcMemDict(strRTC_PROFILE, listCheckpoints)
+
+def readProfile():
+  '''Returns the checkpoints stored by save() or None.'''
+  import hw_rtc_mem
+  return hw_rtc_mem.objRtcMem.readRtcMemDict().get(strRTC_PROFILE, None)
+
+def formatTable(listProfile):
+  '''
+    Every phase ends with a checkpoint:
+    time since reset, duration of the phase, heap allocated by the phase.
+  '''
+  listLines = ['%-24s %10s %10s %8s' % ('phase', 'reset_us', 'phase_us', 'alloc')]
+  iTicksPrev = 0
+  iAllocPrev = 0
+  for strName, iTicks_us, iMemAlloc in listProfile:
+    listLines.append('%-24s %10d %10d %8d' % (strName, iTicks_us, utime.ticks_diff(iTicks_us, iTicksPrev), iMemAlloc - iAllocPrev))
+    iTicksPrev = iTicks_us
+    iAllocPrev = iMemAlloc
+  return '\n'.join(listLines)
+
+def printTable(listProfile=None):
+  '''Prints the checkpoints of this boot if recorded, else the stored ones.'''
+  if listProfile == None:
+    listProfile = listCheckpoints or readProfile()
+  if not listProfile:
+    print('No boot profile: hw_boot_profile.enable() and reboot')
+    return
+  print(formatTable(listProfile))
+
+def upload(wlan, objSession=None):
+  '''
+    Posts the stored table as text.
+    Returns False on error, None if there is nothing to upload.
+  '''
+  if not bEnabled:
+    return None
+  listProfile = readProfile()
+  if not listProfile:
+    return None
+  import hw_utils
+  if objSession == None:
+    import hw_urequests
+    objSession = hw_urequests
+  try:
+    hw_utils.feedWatchdog()
+    r = objSession.post(hw_utils.getBootProfileUrl(wlan), data=formatTable(listProfile), headers={'Content-Type': 'text/plain'})
+    r.close()
+  except OSError as e:
+    print('FAILED boot profile %s' % e)
+    return False
+  return r.status_code == 200
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+'''
+Proxies which import a module or create an object on first use.
+
+Waking up from deepsleep, only a measurement is needed:
+The network modules and the Gpio/PWM setup would only cost RAM and time.
+
+Example:
+hw_urequests = hw_lazy.LazyModule('hw_urequests')
+r = hw_urequests.get(strUrl)  # 'hw_urequests' is imported now
+'''
+
+class LazyModule:
+  def __init__(self, strModule):
+    self.__strModule = strModule
+    self.__objModule = None
+
+  def __getattr__(self, strName):
+    # Only called if 'strName' is not an attribute of the proxy
+    if self.__objModule == None:
+      self.__objModule = __import__(self.__strModule)
+    return getattr(self.__objModule, strName)
+
+  def __repr__(self):
+    return '<lazy module %s>' % self.__strModule
+
+
+class LazyObject:
+  def __init__(self, funcFactory):
+    self.__funcFactory = funcFactory
+    self.__obj = None
+
+  def __getattr__(self, strName):
+    if self.__obj == None:
+      self.__obj = self.__funcFactory()
+    return getattr(self.__obj, strName)
+
+
+#
+# Repl-Command
+#
+class Command:
+  '''
+    func: A function or 'module.function'.
+    The module is imported when the command is called the first time.
+  '''
+  def __init__(self, func):
+    self.__func = func
+
+  def __repr__(self):
+    if isinstance(self.__func, str):
+      strModule, strFunction = self.__func.rsplit('.', 1)
+      self.__func = getattr(__import__(strModule), strFunction)
+    return self.__func()
+
+  def __call__(self):
+    return self.__repr__()
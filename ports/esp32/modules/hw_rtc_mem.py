@@ -3,7 +3,7 @@
 '''
 The RTC has memory which survives warm reboots.
 
-These functions allow to write a string in this memory.
+These functions allow to write a string or a dictionary in this memory.
 
 See:
 https://www.espressif.com/sites/default/files/documentation/esp32_technical_reference_manual_en.pdf
@@ -13,6 +13,27 @@ Page 25
 
 https://github.com/micropython/micropython/pull/4046
 
+Layout of the dictionary area at ADDR:
+  uint32 length of the payload
+  uint32 crc32 of the payload
+  payload
+
+A dictionary is stored as a binary TLV-payload: A tag byte followed by the value.
+  'N': None
+  'T', 'F': True, False
+  'i': int32
+  'q': int64
+  'f': float
+  's', 'b': uint16 length, utf-8/bytes
+  'l', 't': uint16 count, items of the list/tuple
+  'd': uint16 count, key and value of every item
+
+Layout of the telemetry ring buffer at ADDR_RING:
+  uint32 magic, uint16 index of the oldest record, uint16 count, uint16 sequence, uint16 padding
+  records: see RING_RECORD
+
+The last word of the RTC SLOW memory is the magic word of the boot profiler, see hw_boot_profile.ADDR_PROFILE.
+
 
 Tesing:
 import hw_rtc_mem
@@ -28,26 +49,207 @@ ASSERT; The dictionary above must be displayed!
 
 '''
 
-import machine
+import utime
 import uctypes
+import ustruct
+import ubinascii
 
-MAGIC = 0x3F2A8C1D
 ADDR = 0x50000000
-OFFSET_STRING_BYTES = 4
-OFFSET_MAGIC_BYTES = 8
+SIZE = 0x1800
+ADDR_RING = ADDR + SIZE
+SIZE_RING = 0x7FC
+OFFSET_LENGTH_BYTES = 0
+OFFSET_CRC_BYTES = 4
+OFFSET_PAYLOAD_BYTES = 8
 ENCODING = 'utf-8'
 
+TAG_NONE = ord('N')
+TAG_TRUE = ord('T')
+TAG_FALSE = ord('F')
+TAG_INT32 = ord('i')
+TAG_INT64 = ord('q')
+TAG_FLOAT = ord('f')
+TAG_STR = ord('s')
+TAG_BYTES = ord('b')
+TAG_LIST = ord('l')
+TAG_TUPLE = ord('t')
+TAG_DICT = ord('d')
+
+def _sizeOf(value):
+  '''
+    Returns the number of bytes 'value' occupies when encoded.
+  '''
+  if (value is None) or (value is True) or (value is False):
+    return 1
+  if isinstance(value, int):
+    if -0x80000000 <= value <= 0x7FFFFFFF:
+      return 5
+    return 9
+  if isinstance(value, float):
+    return 5
+  if isinstance(value, str):
+    return 3 + len(value.encode(ENCODING))
+  if isinstance(value, (bytes, bytearray)):
+    return 3 + len(value)
+  if isinstance(value, (list, tuple)):
+    iSize = 3
+    for item in value:
+      iSize += _sizeOf(item)
+    return iSize
+  if isinstance(value, dict):
+    iSize = 3
+    for key in value:
+      iSize += _sizeOf(key) + _sizeOf(value[key])
+    return iSize
+  raise TypeError('RTC-Mem: Unsupported type %s' % type(value))
+
+def _encode(mem, i, value):
+  '''
+    Encodes 'value' at offset 'i' of 'mem'.
+    Returns the offset behind the value.
+  '''
+  if value is None:
+    mem[i] = TAG_NONE
+    return i + 1
+  if value is True:
+    mem[i] = TAG_TRUE
+    return i + 1
+  if value is False:
+    mem[i] = TAG_FALSE
+    return i + 1
+  if isinstance(value, int):
+    if -0x80000000 <= value <= 0x7FFFFFFF:
+      mem[i] = TAG_INT32
+      ustruct.pack_into('<i', mem, i + 1, value)
+      return i + 5
+    mem[i] = TAG_INT64
+    ustruct.pack_into('<q', mem, i + 1, value)
+    return i + 9
+  if isinstance(value, float):
+    mem[i] = TAG_FLOAT
+    ustruct.pack_into('<f', mem, i + 1, value)
+    return i + 5
+  if isinstance(value, str):
+    value = value.encode(ENCODING)
+    mem[i] = TAG_STR
+  elif isinstance(value, (bytes, bytearray)):
+    mem[i] = TAG_BYTES
+  elif isinstance(value, (list, tuple)):
+    mem[i] = TAG_TUPLE if isinstance(value, tuple) else TAG_LIST
+    ustruct.pack_into('<H', mem, i + 1, len(value))
+    i += 3
+    for item in value:
+      i = _encode(mem, i, item)
+    return i
+  elif isinstance(value, dict):
+    mem[i] = TAG_DICT
+    ustruct.pack_into('<H', mem, i + 1, len(value))
+    i += 3
+    for key in value:
+      i = _encode(mem, i, key)
+      i = _encode(mem, i, value[key])
+    return i
+  else:
+    raise TypeError('RTC-Mem: Unsupported type %s' % type(value))
+  # str and bytes
+  l = len(value)
+  ustruct.pack_into('<H', mem, i + 1, l)
+  mem[i + 3:i + 3 + l] = value
+  return i + 3 + l
+
+def _skip(mem, i):
+  '''
+    Returns the offset behind the value at offset 'i' without decoding it.
+  '''
+  tag = mem[i]
+  if tag in (TAG_NONE, TAG_TRUE, TAG_FALSE):
+    return i + 1
+  if tag in (TAG_INT32, TAG_FLOAT):
+    return i + 5
+  if tag == TAG_INT64:
+    return i + 9
+  l = ustruct.unpack_from('<H', mem, i + 1)[0]
+  i += 3
+  if tag in (TAG_STR, TAG_BYTES):
+    return i + l
+  if tag == TAG_DICT:
+    l *= 2
+  elif tag not in (TAG_LIST, TAG_TUPLE):
+    raise ValueError('RTC-Mem: Unknown tag %d' % tag)
+  for _ in range(l):
+    i = _skip(mem, i)
+  return i
+
+def _decode(mem, i):
+  '''
+    Returns the value at offset 'i' and the offset behind the value.
+  '''
+  tag = mem[i]
+  if tag == TAG_NONE:
+    return None, i + 1
+  if tag == TAG_TRUE:
+    return True, i + 1
+  if tag == TAG_FALSE:
+    return False, i + 1
+  if tag == TAG_INT32:
+    return ustruct.unpack_from('<i', mem, i + 1)[0], i + 5
+  if tag == TAG_INT64:
+    return ustruct.unpack_from('<q', mem, i + 1)[0], i + 9
+  if tag == TAG_FLOAT:
+    return ustruct.unpack_from('<f', mem, i + 1)[0], i + 5
+  l = ustruct.unpack_from('<H', mem, i + 1)[0]
+  i += 3
+  if tag == TAG_STR:
+    return str(mem[i:i + l], ENCODING), i + l
+  if tag == TAG_BYTES:
+    return bytes(mem[i:i + l]), i + l
+  if tag in (TAG_LIST, TAG_TUPLE):
+    listValues = []
+    for _ in range(l):
+      value, i = _decode(mem, i)
+      listValues.append(value)
+    if tag == TAG_TUPLE:
+      return tuple(listValues), i
+    return listValues, i
+  if tag == TAG_DICT:
+    d = {}
+    for _ in range(l):
+      key, i = _decode(mem, i)
+      d[key], i = _decode(mem, i)
+    return d, i
+  raise ValueError('RTC-Mem: Unknown tag %d' % tag)
+
 class RtcMem:
+  def __init__(self, mem):
+    self.mem = mem
+    self.mv = memoryview(mem)
+
+  def __writeHeader(self, l):
+    ustruct.pack_into('<II', self.mem, OFFSET_LENGTH_BYTES, l, self.__crc(l))
+
+  def __crc(self, l):
+    return ubinascii.crc32(self.mv[OFFSET_PAYLOAD_BYTES:OFFSET_PAYLOAD_BYTES+l])
+
+  def __readLength(self):
+    '''
+      Returns the length of the payload or None if the memory is invalid.
+    '''
+    l, iCrc = ustruct.unpack_from('<II', self.mem, OFFSET_LENGTH_BYTES)
+    if (l<=0) or (l>len(self.mem)-OFFSET_PAYLOAD_BYTES):
+      print('RTC-Mem UNITIALIZED (wrong size).')
+      return None
+    if self.__crc(l) != iCrc:
+      print('RTC-Mem UNITIALIZED (crc dismatch)')
+      return None
+    return l
+
   def writeRtcMemBytes(self, b):
     '''
-      Writes a string into the slow memory.
+      Writes bytes into the slow memory.
     '''
     l = len(b)
-    l_aligned4 = l + 4 - l%4
-    machine.mem32[ADDR+0] = l
-    machine.mem32[ADDR+l_aligned4+OFFSET_MAGIC_BYTES] = MAGIC
-    mem = uctypes.bytearray_at(ADDR+OFFSET_STRING_BYTES, l)
-    mem[:l] = b
+    self.mem[OFFSET_PAYLOAD_BYTES:OFFSET_PAYLOAD_BYTES+l] = b
+    self.__writeHeader(l)
 
   def writeRtcMem(self, s):
     '''
@@ -59,16 +261,10 @@ class RtcMem:
     '''
       Reads a tyes from the slow memory.
     '''
-    l = machine.mem32[ADDR+0]
-    if (l<=0) or (l>0x2000-OFFSET_MAGIC_BYTES):
-      print('RTC-Mem UNITIALIZED (wrong size).')
+    l = self.__readLength()
+    if l is None:
       return default
-    l_aligned4 = l + 4 - l%4
-    if machine.mem32[ADDR+l_aligned4+OFFSET_MAGIC_BYTES] != MAGIC:
-      print('RTC-Mem UNITIALIZED (magic number dismatch)')
-      return default
-    mem = uctypes.bytearray_at(ADDR+OFFSET_STRING_BYTES, l)
-    return bytes(mem)
+    return bytes(self.mv[OFFSET_PAYLOAD_BYTES:OFFSET_PAYLOAD_BYTES+l])
 
   def readRtcMem(self, default=''):
     '''
@@ -80,11 +276,136 @@ class RtcMem:
     return b.decode(ENCODING)
 
   def writeRtcMemDict(self, d):
-    self.writeRtcMem(str(d))
+    '''
+      Encodes the dictionary directly into the slow memory.
+    '''
+    if OFFSET_PAYLOAD_BYTES + _sizeOf(d) > len(self.mem):
+      raise ValueError('RTC-Mem: Dictionary too big')
+    l = _encode(self.mem, OFFSET_PAYLOAD_BYTES, d) - OFFSET_PAYLOAD_BYTES
+    self.__writeHeader(l)
 
   def readRtcMemDict(self):
-    s = self.readRtcMem(default='{}')
-    d = eval(s)
+    l = self.__readLength()
+    if (l is None) or (self.mem[OFFSET_PAYLOAD_BYTES] != TAG_DICT):
+      return {}
+    d, _ = _decode(self.mem, OFFSET_PAYLOAD_BYTES)
     return d
 
-objRtcMem = RtcMem()
\ No newline at end of file
+  def updateRtcMemDict(self, key, value):
+    '''
+      Sets one value in the dictionary.
+      If the encoded value keeps its size, it is overwritten in place:
+      Only the value and the crc are written.
+    '''
+    l = self.__readLength()
+    if (l is not None) and (self.mem[OFFSET_PAYLOAD_BYTES] == TAG_DICT):
+      iCount = ustruct.unpack_from('<H', self.mem, OFFSET_PAYLOAD_BYTES+1)[0]
+      i = OFFSET_PAYLOAD_BYTES + 3
+      for _ in range(iCount):
+        key_, iValue = _decode(self.mem, i)
+        i = _skip(self.mem, iValue)
+        if key_ == key:
+          if i - iValue == _sizeOf(value):
+            _encode(self.mem, iValue, value)
+            self.__writeHeader(l)
+            return
+          break
+    d = self.readRtcMemDict()
+    d[key] = value
+    self.writeRtcMemDict(d)
+
+objRtcMem = RtcMem(uctypes.bytearray_at(ADDR, SIZE))
+
+#
+# Telemetry ring buffer
+#
+RING_MAGIC = b'RING'
+RING_OFFSET_FIRST = 4
+RING_OFFSET_COUNT = 6
+RING_OFFSET_SEQUENCE = 8
+RING_OFFSET_RECORDS = 12
+# time [s], ticks [ms], mem_free, machine.reset_cause(), event, sequence
+RING_RECORD = '<IIIBBH'
+RING_RECORD_SIZE = 16
+
+# The events: What was going on when the record was written
+EVENT_BOOT = 0
+EVENT_OTA_START = 1
+EVENT_OTA_RESUME = 2
+EVENT_OTA_SUCCESS = 3
+EVENT_OTA_FAILED = 4
+EVENT_OTA_FORMAT = 5
+EVENT_WLAN_FAILED = 6
+
+class RtcRing:
+  '''
+    Fixed size records in the slow memory.
+    If the buffer is full, the oldest record is overwritten.
+    append() doesn't allocate memory on the heap.
+  '''
+  def __init__(self, mem):
+    self.mem = mem
+    self.iCapacity = (len(mem) - RING_OFFSET_RECORDS) // RING_RECORD_SIZE
+
+  def __readU16(self, i):
+    return self.mem[i] | (self.mem[i+1] << 8)
+
+  def __writeU16(self, i, v):
+    self.mem[i] = v & 0xFF
+    self.mem[i+1] = v >> 8
+
+  def isValid(self):
+    for i in range(4):
+      if self.mem[i] != RING_MAGIC[i]:
+        return False
+    return (self.__readU16(RING_OFFSET_FIRST) < self.iCapacity) and (self.__readU16(RING_OFFSET_COUNT) <= self.iCapacity)
+
+  def clear(self):
+    self.mem[0:4] = RING_MAGIC
+    self.__writeU16(RING_OFFSET_FIRST, 0)
+    self.__writeU16(RING_OFFSET_COUNT, 0)
+    self.__writeU16(RING_OFFSET_SEQUENCE, 0)
+
+  def count(self):
+    if not self.isValid():
+      return 0
+    return self.__readU16(RING_OFFSET_COUNT)
+
+  def append(self, iResetCause, iEvent, iMemFree):
+    if not self.isValid():
+      self.clear()
+    iFirst = self.__readU16(RING_OFFSET_FIRST)
+    iCount = self.__readU16(RING_OFFSET_COUNT)
+    iSequence = (self.__readU16(RING_OFFSET_SEQUENCE) + 1) & 0xFFFF
+    iIndex = (iFirst + iCount) % self.iCapacity
+    if iCount == self.iCapacity:
+      # Overwrite the oldest record
+      self.__writeU16(RING_OFFSET_FIRST, (iFirst + 1) % self.iCapacity)
+    else:
+      self.__writeU16(RING_OFFSET_COUNT, iCount + 1)
+    ustruct.pack_into(RING_RECORD, self.mem, RING_OFFSET_RECORDS + iIndex*RING_RECORD_SIZE, utime.time(), utime.ticks_ms(), iMemFree, iResetCause, iEvent, iSequence)
+    self.__writeU16(RING_OFFSET_SEQUENCE, iSequence)
+
+  def readBatch(self, iMax):
+    '''
+      Returns the oldest records as bytes. Use remove() after they have been processed.
+    '''
+    iFirst = self.__readU16(RING_OFFSET_FIRST)
+    iCount = min(self.count(), iMax)
+    b = bytearray(iCount * RING_RECORD_SIZE)
+    for i in range(iCount):
+      iOffset = RING_OFFSET_RECORDS + ((iFirst + i) % self.iCapacity) * RING_RECORD_SIZE
+      b[i*RING_RECORD_SIZE:(i+1)*RING_RECORD_SIZE] = self.mem[iOffset:iOffset+RING_RECORD_SIZE]
+    return b
+
+  def remove(self, iCount):
+    '''
+      Removes the oldest records.
+    '''
+    iCount = min(self.count(), iCount)
+    if iCount == 0:
+      return
+    self.__writeU16(RING_OFFSET_FIRST, (self.__readU16(RING_OFFSET_FIRST) + iCount) % self.iCapacity)
+    self.__writeU16(RING_OFFSET_COUNT, self.__readU16(RING_OFFSET_COUNT) - iCount)
+
+objRtcRing = RtcRing(uctypes.bytearray_at(ADDR_RING, SIZE_RING))
@@ -5,6 +5,7 @@ import utime
 import network
 import hw_utils
 import hw_urequests
+import hw_boot_profile
 import portable_firmware_constants
 
 def setRtcRamSSID(strWlanSsid, strWlanPw):
@@ -31,78 +32,510 @@ def getRtcRamSSID():
   strWlanPw = d.get(portable_firmware_constants.strWLAN_PW, None)
   return strWlanSsid, strWlanPw
 
+#
+# Resume an interrupted update
+#
+# After every extracted file, the offset of the next tar-header is stored in the RtcMem.
+# After a reboot, the download continues there using a 'Range:' request.
+strRTC_OTA_OFFSET = 'otaOffset'
+strRTC_OTA_MEMBER = 'otaMember'
+strRTC_OTA_SIZE = 'otaSize'
 
-def update(strUrl):
+def readResumeState():
+  '''
+    Returns (iOffset, strMember, iSize) of an interrupted update.
+    Returns None if there is nothing to resume.
+  '''
+  if hw_utils.bPowerOnBoot:
+    # On power on, the RtcMem is invalid.
+    return None
+  import hw_rtc_mem
+  d = hw_rtc_mem.objRtcMem.readRtcMemDict()
+  iOffset = d.get(strRTC_OTA_OFFSET, None)
+  if iOffset == None:
+    return None
+  return iOffset, d.get(strRTC_OTA_MEMBER, None), d.get(strRTC_OTA_SIZE, None)
+
+def writeResumeState(iOffset, strMember, iSize):
+  import hw_rtc_mem
+  # Values which keep their size are overwritten in place
+  hw_rtc_mem.objRtcMem.updateRtcMemDict(strRTC_OTA_SIZE, iSize)
+  hw_rtc_mem.objRtcMem.updateRtcMemDict(strRTC_OTA_MEMBER, strMember)
+  hw_rtc_mem.objRtcMem.updateRtcMemDict(strRTC_OTA_OFFSET, iOffset)
+
+def clearResumeState():
+  if readResumeState() == None:
+    return
+  import hw_rtc_mem
+  d = hw_rtc_mem.objRtcMem.readRtcMemDict()
+  for strKey in (strRTC_OTA_OFFSET, strRTC_OTA_MEMBER, strRTC_OTA_SIZE):
+    d.pop(strKey, None)
+  hw_rtc_mem.objRtcMem.writeRtcMemDict(d)
+
+def isUpdateResumable():
+  return readResumeState() != None
+
+class CountingStream:
+  '''
+    Wraps the http-stream and counts the bytes consumed by the tar-parser.
+  '''
+  def __init__(self, f, iOffset=0):
+    self.f = f
+    self.iOffset = iOffset
+
+  def read(self, iSize):
+    b = self.f.read(iSize)
+    self.iOffset += len(b)
+    return b
+
+  def readinto(self, buf, iSize=None):
+    if iSize == None:
+      iSize = self.f.readinto(buf)
+    else:
+      iSize = self.f.readinto(buf, iSize)
+    self.iOffset += iSize
+    return iSize
+
+def getTarSize(r, iOffset):
+  '''
+    Returns the size of the tarball or None.
+    206: 'Content-Range: bytes 4096-8191/8192'
+    200: 'Content-Length: 8192'
+  '''
+  try:
+    if r.status_code == 206:
+      strStart, strTotal = r.headers['content-range'].split(' ', 1)[1].split('/', 1)
+      if int(strStart.split('-', 1)[0]) != iOffset:
+        return None
+      return int(strTotal)
+    return int(r.headers['content-length'])
+  except (KeyError, IndexError, ValueError):
+    return None
+
+def getTarSizeGzip(r):
+  '''
+    Returns the size of the uncompressed tarball or None.
+    'X-Tar-Length: 8192'
+  '''
+  try:
+    return int(r.headers[portable_firmware_constants.strHTTP_HEADER_TAR_LENGTH.lower()])
+  except (KeyError, ValueError):
+    return None
+
+# Forked from https://github.com/micropython/micropython/blob/master/tools/upip.py#L74
+# Expects *file* name
+def makedirs(name, mode=0o777):
+  import errno
+  ret = False
+  s = ""
+  comps = name.rstrip("/").split("/")[:-1]
+  if len(comps) == 0:
+    # There is not top-directory
+    return True
+  if comps[0] == "":
+    s = "/"
+  for c in comps:
+    if s and s[-1] != "/":
+      s += "/"
+    s += c
+    try:
+      uos.mkdir(s)
+      ret = True
+    except OSError as e:
+      if e.args[0] != errno.EEXIST and e.args[0] != errno.EISDIR:
+        raise
+      ret = False
+  return ret
+
+def update(strUrl, bResume=False, objSession=hw_urequests):
   '''
     Returns True: If a new software was installed.
     Returns False: If there is no new software.
     On error: reboot
+
+    bResume: Continue an interrupted update at the offset stored in the RtcMem.
+    objSession: hw_urequests or a hw_urequests.Session to reuse the connection
   '''
-  import errno
   import upip
   import upip_utarfile
   
-  # Forked from https://github.com/micropython/micropython/blob/master/tools/upip.py#L74
-  # Expects *file* name
-  def _makedirs(name, mode=0o777):
-    ret = False
-    s = ""
-    comps = name.rstrip("/").split("/")[:-1]
-    if len(comps) == 0:
-      # There is not top-directory
-      return True
-    if comps[0] == "":
-      s = "/"
-    for c in comps:
-      if s and s[-1] != "/":
-        s += "/"
-      s += c
-      try:
-        uos.mkdir(s)
-        ret = True
-      except OSError as e:
-        if e.args[0] != errno.EEXIST and e.args[0] != errno.EISDIR:
-          raise
-        ret = False
-    return ret
+  iOffset, strMember, iSizeResume = 0, None, None
+  if bResume:
+    tupleState = readResumeState()
+    if tupleState != None:
+      iOffset, strMember, iSizeResume = tupleState
+  else:
+    clearResumeState()
+
+  import hw_rtc_mem
+  dictHeaders = {}
+  if iOffset > 0:
+    hw_utils.logTelemetry(hw_rtc_mem.EVENT_OTA_RESUME)
+    print('Resume after "%s" at offset %d' % (strMember, iOffset))
+    dictHeaders['Range'] = 'bytes=%d-' % iOffset
+  else:
+    # A compressed download is resumed uncompressed: 'Range:' would refer to the compressed bytes
+    dictHeaders['Accept-Encoding'] = portable_firmware_constants.strHTTP_ENCODING_GZIP
+    hw_utils.logTelemetry(hw_rtc_mem.EVENT_OTA_START)
 
   print('HTTP-Get ' + strUrl)
   try:
     hw_utils.feedWatchdog()
-    r = hw_urequests.get(strUrl)
-    if r.status_code != 200:
-      hw_utils.reboot('FAILED %d %s' % (r.status_code, r.reason))
+    r = objSession.get(strUrl, headers=dictHeaders)
+    if r.status_code not in (200, 206):
       r.close()
+      hw_utils.logTelemetry(hw_rtc_mem.EVENT_OTA_FAILED)
+      hw_utils.reboot('FAILED %d %s' % (r.status_code, r.reason))
   except OSError as e:
+    hw_utils.logTelemetry(hw_rtc_mem.EVENT_OTA_FAILED)
     hw_utils.reboot('FAILED %s' % e)
 
-  tar = upip_utarfile.TarFile(fileobj=r.raw)
-  for info in tar:
-    if info.type != upip_utarfile.REGTYPE:
-      continue
-    print('  extracting ' + info.name)
-    hw_utils.feedWatchdog()
-    _makedirs(info.name)
-    subf = tar.extractfile(info)
-    upip.save_file(info.name, subf)
+  if r.status_code == 200:
+    # The server ignored 'Range:': Start from the beginning
+    iOffset = 0
+  bGzip = r.headers.get('content-encoding', None) == portable_firmware_constants.strHTTP_ENCODING_GZIP
+  if bGzip:
+    # The offsets in the RtcMem refer to the uncompressed tarball
+    iSize = getTarSizeGzip(r)
+  else:
+    iSize = getTarSize(r, iOffset)
+  if (iOffset > 0) and ((iSize == None) or (iSize != iSizeResume)):
+    # The tarball on the server changed in the meantime
+    r.close()
+    clearResumeState()
+    hw_utils.formatAndReboot()
+
+  try:
+    fRaw = r.raw
+    if bGzip:
+      # Decompress while streaming: Only the window is allocated.
+      # r.raw is a socket or a stream object of hw_urequests.
+      import uzlib
+      print('Content-Encoding: gzip')
+      fRaw = uzlib.DecompIO(r.raw, 16 + portable_firmware_constants.iHTTP_GZIP_WBITS)
+    f = CountingStream(fRaw, iOffset)
+    tar = upip_utarfile.TarFile(fileobj=f)
+    for info in tar:
+      if info.type != upip_utarfile.REGTYPE:
+        continue
+      print('  extracting ' + info.name)
+      hw_utils.feedWatchdog()
+      makedirs(info.name)
+      # The header has been consumed: This is where the next header starts
+      iOffsetNext = f.iOffset + upip_utarfile.roundup(info.size, 512)
+      subf = tar.extractfile(info)
+      upip.save_file(info.name, subf)
+      if iSize != None:
+        writeResumeState(iOffsetNext, info.name, iSize)
+  except OSError as e:
+    r.close()
+    hw_utils.logTelemetry(hw_rtc_mem.EVENT_OTA_FAILED)
+    hw_utils.reboot('FAILED %s: Update will be resumed' % e)
   r.close()
+  clearResumeState()
+  hw_utils.logTelemetry(hw_rtc_mem.EVENT_OTA_SUCCESS)
 
   print('Successful update!')
   return True
 
-def connect(wlan, strSsid, strPassword):
+#
+# Delta update: Only download the files which changed
+#
+# The manifest contains a line '<sha256> <size> <filename>' for every file.
+# A copy of the last installed manifest is stored in 'MANIFEST.TXT'.
+def parseManifest(strManifest):
+  '''
+    Returns a dictionary: filename -> (sha256, size)
+  '''
+  dictManifest = {}
+  for strLine in strManifest.split('\n'):
+    strLine = strLine.strip()
+    if strLine == '':
+      continue
+    strSha256, strSize, strFilename = strLine.split(' ', 2)
+    dictManifest[strFilename] = (strSha256, int(strSize))
+  return dictManifest
+
+def readManifest():
+  strManifest = hw_utils.readFile(portable_firmware_constants.strFILENAME_MANIFEST, default='')
+  return parseManifest(strManifest)
+
+def hashFile(strFilename, buf):
+  '''
+    Returns the sha256 of the file or None if the file does not exist.
+  '''
+  import uhashlib
+  import ubinascii
+  h = uhashlib.sha256()
+  try:
+    with open(strFilename, 'rb') as fIn:
+      while True:
+        iSize = fIn.readinto(buf)
+        if not iSize:
+          break
+        h.update(memoryview(buf)[:iSize])
+  except OSError:
+    return None
+  return ubinascii.hexlify(h.digest()).decode()
+
+def removeFile(strFilename):
+  try:
+    uos.remove(strFilename)
+  except OSError:
+    pass
+
+def downloadFile(strUrl, strFilename, strSha256, iSize, buf, objSession=hw_urequests):
+  '''
+    Download into a temporary file and verify size and sha256.
+    Returns True if the file was replaced.
+  '''
+  import uhashlib
+  import ubinascii
   hw_utils.feedWatchdog()
-  wlan.connect(strSsid, strPassword)
-  for _ in range(10):
+  r = objSession.get(strUrl)
+  if r.status_code != 200:
+    print('FAILED %d %s' % (r.status_code, r.reason))
+    r.close()
+    return False
+  strFilenameTmp = strFilename + '.tmp'
+  h = uhashlib.sha256()
+  iSizeReceived = 0
+  try:
+    makedirs(strFilename)
+    with open(strFilenameTmp, 'wb') as fOut:
+      while True:
+        hw_utils.feedWatchdog()
+        iRead = r.raw.readinto(buf)
+        if not iRead:
+          break
+        mv = memoryview(buf)[:iRead]
+        h.update(mv)
+        fOut.write(mv)
+        iSizeReceived += iRead
+  finally:
+    r.close()
+  if (iSizeReceived != iSize) or (ubinascii.hexlify(h.digest()).decode() != strSha256):
+    print('FAILED verification of %s' % strFilename)
+    removeFile(strFilenameTmp)
+    return False
+  # FAT: rename() fails if the destination exists
+  removeFile(strFilename)
+  uos.rename(strFilenameTmp, strFilename)
+  return True
+
+def isFileChanged(strFilename, tupleEntry, dictManifestNode, buf):
+  if dictManifestNode.get(strFilename, None) == tupleEntry:
+    return False
+  if (strFilename not in dictManifestNode) and (hashFile(strFilename, buf) == tupleEntry[0]):
+    # There is no manifest entry, but the file is unchanged
+    return False
+  return True
+
+def getStagingFilename(strFilename):
+  return '%s/%s' % (portable_firmware_constants.strDIRECTORY_STAGING, strFilename)
+
+def removeTree(strDirectory):
+  for strName in uos.listdir(strDirectory):
+    strPath = '%s/%s' % (strDirectory, strName)
+    if uos.stat(strPath)[0] & 0x4000:
+      removeTree(strPath)
+    else:
+      uos.remove(strPath)
+  uos.rmdir(strDirectory)
+
+def stageUpdate(wlan, strManifest, dictManifest, objSession=hw_urequests):
+  '''
+    Downloads the changed files into the staging directory.
+    The active files are not touched.
+    Returns True if all files have been staged and verified.
+  '''
+  dictManifestNode = readManifest()
+  buf = bytearray(512)
+  for strFilename, tupleEntry in dictManifest.items():
+    strFilenameStaging = getStagingFilename(strFilename)
+    if not isFileChanged(strFilename, tupleEntry, dictManifestNode, buf):
+      # A copy staged by an interrupted update to another version would be activated
+      removeFile(strFilenameStaging)
+      continue
+    if hashFile(strFilenameStaging, buf) == tupleEntry[0]:
+      # Staged by an interrupted update
+      continue
+    print('  staging ' + strFilename)
+    if not downloadFile(hw_utils.getFileUrl(wlan, strFilename), strFilenameStaging, tupleEntry[0], tupleEntry[1], buf, objSession):
+      return False
+  # The manifest marks the staging directory as complete
+  with open(getStagingFilename(portable_firmware_constants.strFILENAME_MANIFEST), 'w') as fOut:
+    fOut.write(strManifest)
+  return True
+
+def activateStaged():
+  '''
+    Moves the staged files into place. VERSION.TXT is moved last.
+    May be called again if it was interrupted.
+    Returns False if there is no complete staging directory.
+  '''
+  strFILENAME_VERSION = portable_firmware_constants.strFILENAME_VERSION
+  strFILENAME_MANIFEST = portable_firmware_constants.strFILENAME_MANIFEST
+  strManifest = hw_utils.readFile(getStagingFilename(strFILENAME_MANIFEST), default=None)
+  if strManifest == None:
+    return False
+  dictManifest = parseManifest(strManifest)
+  dictManifestNode = readManifest()
+
+  def moveStaged(strFilename):
+    strFilenameStaging = getStagingFilename(strFilename)
+    try:
+      uos.stat(strFilenameStaging)
+    except OSError:
+      # Unchanged or already moved
+      return False
+    makedirs(strFilename)
+    # FAT: rename() fails if the destination exists
+    removeFile(strFilename)
+    uos.rename(strFilenameStaging, strFilename)
+    return True
+
+  print('Activating staged update')
+  bNewVersion = hw_utils.isStagedFile(strFILENAME_VERSION)
+  if bNewVersion:
+    # Without VERSION.TXT, an interrupted activation will be finished during the next boot
+    removeFile(strFILENAME_VERSION)
+  for strFilename in dictManifest:
+    if strFilename != strFILENAME_VERSION:
+      hw_utils.feedWatchdog()
+      moveStaged(strFilename)
+  for strFilename in dictManifestNode:
+    if strFilename not in dictManifest:
+      print('  removing ' + strFilename)
+      removeFile(strFilename)
+  moveStaged(strFILENAME_VERSION)
+  # The manifest is moved after VERSION.TXT: It marks an activation which was not finished
+  moveStaged(strFILENAME_MANIFEST)
+  removeTree(portable_firmware_constants.strDIRECTORY_STAGING)
+  return True
+
+def updateDelta(wlan, objSession=hw_urequests):
+  '''
+    Returns True: If the new software was installed.
+    Returns False: On error. The old software is still intact.
+      The staged files will be reused by the next attempt.
+    Returns None: If the server doesn't provide a manifest.
+      The filesystem has to be formatted in this case.
+  '''
+  strUrl = hw_utils.getManifestUrl(wlan)
+  print('HTTP-Get ' + strUrl)
+  try:
+    hw_utils.feedWatchdog()
+    r = objSession.get(strUrl)
+    if r.status_code != 200:
+      print('FAILED %d %s' % (r.status_code, r.reason))
+      r.close()
+      if r.status_code == 404:
+        return None
+      return False
+    strManifest = r.text
+    r.close()
+  except OSError as e:
+    print('FAILED %s' % e)
+    return False
+
+  dictManifest = parseManifest(strManifest)
+  if portable_firmware_constants.strFILENAME_VERSION not in dictManifest:
+    print('FAILED: %s missing in the manifest' % portable_firmware_constants.strFILENAME_VERSION)
+    return None
+
+  try:
+    if not stageUpdate(wlan, strManifest, dictManifest, objSession):
+      return False
+    activateStaged()
+  except OSError as e:
+    print('FAILED %s' % e)
+    return False
+
+  print('Successful delta update!')
+  return True
+
+#
+# Telemetry
+#
+iTELEMETRY_BATCH = 16
+
+def uploadTelemetry(wlan, objSession=hw_urequests):
+  '''
+    Uploads the records of the ring buffer in batches.
+    A batch is removed from the ring buffer after the server confirmed it.
+    Returns False on error.
+  '''
+  import hw_rtc_mem
+  objRing = hw_rtc_mem.objRtcRing
+  strUrl = hw_utils.getTelemetryUrl(wlan)
+  while objRing.count() > 0:
+    b = objRing.readBatch(iTELEMETRY_BATCH)
+    try:
+      hw_utils.feedWatchdog()
+      r = objSession.post(strUrl, data=b, headers={'Content-Type': 'application/octet-stream'})
+      r.close()
+    except OSError as e:
+      print('FAILED telemetry %s' % e)
+      return False
+    if r.status_code != 200:
+      print('FAILED telemetry %d %s' % (r.status_code, r.reason))
+      return False
+    objRing.remove(len(b) // hw_rtc_mem.RING_RECORD_SIZE)
+  return True
+
+def uploadReports(wlan, objSession=hw_urequests):
+  '''
+    Uploads the telemetry and the boot profile after connecting.
+    objSession: The session of the caller, the uploads share its connection
+  '''
+  uploadTelemetry(wlan, objSession)
+  hw_boot_profile.upload(wlan, objSession)
+
+#
+# Fast reconnect
+#
+# Key in the RtcMem-dictionary: (strSsid, bssid, iChannel, tupleIfconfig) of the last connection.
+# bssid is None and iChannel 0 if the wlan was not scanned.
+strRTC_WLAN = 'wlanCache'
+
+def readWlanCache(strSsid):
+  if hw_utils.bPowerOnBoot:
+    # On power on, the RtcMem is invalid.
+    return None
+  import hw_rtc_mem
+  tupleCache = hw_rtc_mem.objRtcMem.readRtcMemDict().get(strRTC_WLAN, None)
+  if (tupleCache == None) or (tupleCache[0] != strSsid):
+    return None
+  return tupleCache
+
+def writeWlanCache(tupleCache):
+  import hw_rtc_mem
+  hw_rtc_mem.objRtcMem.updateRtcMemDict(strRTC_WLAN, tupleCache)
+
+def connect(wlan, strSsid, strPassword, bssid=None, iChannel=0, iTimeout_ms=10000):
+  hw_utils.feedWatchdog()
+  if bssid == None:
+    wlan.connect(strSsid, strPassword)
+  else:
+    wlan.connect(strSsid, strPassword, bssid=bssid, channel=iChannel)
+  # Poll often at the beginning: A directed connect takes only some 100ms
+  iSleep_ms = 10
+  iStart_ms = utime.ticks_ms()
+  while utime.ticks_diff(utime.ticks_ms(), iStart_ms) < iTimeout_ms:
     # Do not use self.delay_ms(): Light sleep will kill the wlan!
     hw_utils.feedWatchdog()
-    utime.sleep_ms(1000)
     if wlan.isconnected():
-      print('connected!')
+      print('connected after %d ms!' % utime.ticks_diff(utime.ticks_ms(), iStart_ms))
       return True
+    utime.sleep_ms(iSleep_ms)
+    iSleep_ms = min(2*iSleep_ms, 500)
   return False
 
 def scanSsid(wlan, strSsid, iScanTime_ms=1500, iChannel=0):
+  '''
+    Returns the scan result (ssid, bssid, channel, RSSI, authmode, hidden) or None.
+  '''
   # wlan.scan(scan_time_ms, channel)
   # scan_time_ms > 0: Active scan
   # scan_time_ms < 0: Passive scan
@@ -119,9 +552,28 @@ def scanSsid(wlan, strSsid, iScanTime_ms=1500, iChannel=0):
   for listWlan in listWlans:
     strSsid_ = listWlan[0].decode()
     if strSsid_ == strSsid:
-      return True
-  return False
+      return listWlan
+  return None
     
+def connectCached(wlan, strWlanSsid, strWlanPw):
+  '''
+    Connect using the bssid, channel and ip-configuration of the last connection.
+    Returns False if there is no cache or the connection failed.
+  '''
+  tupleCache = readWlanCache(strWlanSsid)
+  if tupleCache == None:
+    return False
+  _, bssid, iChannel, tupleIfconfig = tupleCache
+  print('Connecting to %s/%s (cached, channel %d)' % (strWlanSsid, strWlanPw, iChannel))
+  # A static ip-configuration avoids the DHCP-roundtrip
+  wlan.ifconfig(tupleIfconfig)
+  if connect(wlan, strWlanSsid, strWlanPw, bssid, iChannel, iTimeout_ms=portable_firmware_constants.iWLAN_CachedTimeout_ms):
+    return True
+  print('Connecting using the cache failed')
+  wlan.disconnect()
+  wlan.ifconfig('dhcp')
+  return False
+
 def connectWlanReboot(bScanSsid=False):
   hw_utils.feedWatchdog()
   wlan = network.WLAN(network.STA_IF)
@@ -130,23 +582,37 @@ def connectWlanReboot(bScanSsid=False):
   strWlanSsid, strWlanPw = getRtcRamSSID()
   iChannel = portable_firmware_constants.iWLAN_Channel
 
+  hw_utils.objGpio.pwmLedWlanConnected()
+  if connectCached(wlan, strWlanSsid, strWlanPw):
+    return wlan
+
+  bssid = None
   if bScanSsid:
     hw_utils.objGpio.pwmLedWlanScan()
-    if not scanSsid(wlan, strWlanSsid, portable_firmware_constants.iWLAN_ScanTime_ms, iChannel):
+    listWlan = scanSsid(wlan, strWlanSsid, portable_firmware_constants.iWLAN_ScanTime_ms, iChannel)
+    if listWlan == None:
       hw_utils.reboot('Scan failed for wlan "%s"' % strWlanSsid)
+    bssid, iChannel = listWlan[1], listWlan[2]
 
   print('Connecting to %s/%s' % (strWlanSsid, strWlanPw))
   hw_utils.objGpio.pwmLedWlanConnected()
-  bConnected = connect(wlan, strWlanSsid, strWlanPw)
+  bConnected = connect(wlan, strWlanSsid, strWlanPw, bssid, iChannel)
   if not bConnected:
+    import hw_rtc_mem
+    hw_utils.logTelemetry(hw_rtc_mem.EVENT_WLAN_FAILED)
     hw_utils.reboot('Could not connect to wlan "%s/%s" on channel %d' % (strWlanSsid, strWlanPw, iChannel))
+  writeWlanCache((strWlanSsid, bssid, iChannel, wlan.ifconfig()))
   return wlan
 
-def updateAndReboot(bScanSsid=False):
+def updateAndReboot(bScanSsid=False, bResume=False):
   wlan = connectWlanReboot(bScanSsid)
+  # The uploads and the download share the connection
+  objSession = hw_urequests.Session()
+  uploadReports(wlan, objSession)
 
   strUrl = hw_utils.getDownloadUrl(wlan)
-  bSoftwareUpdated = update(strUrl)
+  bSoftwareUpdated = update(strUrl, bResume=bResume, objSession=objSession)
+  objSession.close()
   hw_utils.feedWatchdog()
   wlan.active(False)
 
@@ -158,9 +624,20 @@ def updateAndReboot(bScanSsid=False):
   
 def checkForNewSwAndRebootRepl(bScanSsid=False):
   wlan = connectWlanReboot(bScanSsid)
-  bNewSwVersion = hw_utils.checkIfNewSwVersion(wlan)
+  # The uploads, the version check and the delta update share the connection
+  objSession = hw_urequests.Session()
+  uploadReports(wlan, objSession)
+  bNewSwVersion = hw_utils.checkIfNewSwVersion(wlan, objSession)
+  if bNewSwVersion:
+    bUpdated = updateDelta(wlan, objSession)
+    objSession.close()
+    wlan.active(False)
+    if bUpdated:
+      hw_utils.reboot('SUCCESS: Successful delta update. Reboot')
+    if bUpdated == None:
+      hw_utils.formatAndReboot()
+    print('Update failed: Keep the old software')
+  objSession.close()
   hw_utils.feedWatchdog()
   wlan.active(False)
-  if bNewSwVersion:
-    hw_utils.formatAndReboot()
   hw_utils.objGpio.setLed(False)
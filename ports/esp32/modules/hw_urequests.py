@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-import sys
+import uio
 import usocket
 import hw_utils
 
@@ -35,9 +35,140 @@ class Response:
         import ujson
         return ujson.loads(self.content)
 
+    def readinto(self, buf):
+        """
+        Reads the next part of the body into a buffer owned by the caller.
+        Returns the number of bytes read, 0 at the end of the body.
+        """
+        return self.raw.readinto(buf)
+
+    def iter_content(self, buf):
+        """
+        Yields memoryviews into 'buf' until the body is consumed.
+        The data has to be processed before the next iteration refills 'buf'.
+        """
+        mv = memoryview(buf)
+        try:
+            while True:
+                n = self.raw.readinto(buf)
+                if not n:
+                    break
+                yield mv[:n]
+        finally:
+            self.close()
+
+
+class BodyReader(uio.IOBase):
+    """
+    Reads a 'Content-Length' delimited body from a keep-alive connection.
+    When the body was read completely, close() hands the socket back to the session.
+    A stream object: uzlib.DecompIO may read from it.
+    """
+
+    def __init__(self, s, length, release=None):
+        self.s = s
+        self.remaining = length
+        self.release = release
+
+    def read(self, sz=-1):
+        if sz < 0 or sz > self.remaining:
+            sz = self.remaining
+        if sz == 0:
+            return b""
+        data = self.s.read(sz)
+        self.remaining -= len(data)
+        return data
+
+    def readinto(self, buf, sz=-1):
+        if sz < 0 or sz > len(buf):
+            sz = len(buf)
+        if sz > self.remaining:
+            sz = self.remaining
+        if sz == 0:
+            return 0
+        n = self.s.readinto(memoryview(buf)[:sz])
+        self.remaining -= n
+        return n
+
+    def close(self):
+        if self.s is None:
+            return
+        if self.remaining == 0 and self.release is not None:
+            self.release(self.s)
+        else:
+            self.s.close()
+        self.s = None
+
+
+class ChunkedReader(uio.IOBase):
+    """
+    Decodes a body with 'Transfer-Encoding: chunked' while it is read.
+    When the last chunk was read, close() hands the socket back to the session.
+    A stream object: uzlib.DecompIO may read from it.
+    """
+
+    def __init__(self, s, release=None):
+        self.s = s
+        self.chunk = 0
+        self.eof = False
+        self.release = release
+
+    def _next_chunk(self):
+        # Returns False at the end of the body
+        if self.chunk == 0 and not self.eof:
+            l = self.s.readline()
+            self.chunk = int(l.split(b";", 1)[0], 16)
+            if self.chunk == 0:
+                # Skip the trailer
+                while True:
+                    l = self.s.readline()
+                    if not l or l == b"\r\n":
+                        break
+                self.eof = True
+        return not self.eof
+
+    def _end_chunk(self, n):
+        self.chunk -= n
+        if self.chunk == 0:
+            # Each chunk is terminated by CRLF
+            self.s.readline()
+
+    def read(self, sz=-1):
+        if sz < 0:
+            l = []
+            while self._next_chunk():
+                l.append(self.read(self.chunk))
+            return b"".join(l)
+        if not self._next_chunk():
+            return b""
+        data = self.s.read(min(sz, self.chunk))
+        self._end_chunk(len(data))
+        return data
+
+    def readinto(self, buf, sz=-1):
+        if sz < 0 or sz > len(buf):
+            sz = len(buf)
+        if not self._next_chunk():
+            return 0
+        n = self.s.readinto(memoryview(buf)[:min(sz, self.chunk)])
+        if not n:
+            raise OSError("Unexpected end of chunked body")
+        self._end_chunk(n)
+        return n
+
+    def close(self):
+        if self.s is None:
+            return
+        if self.eof and self.release is not None:
+            self.release(self.s)
+        else:
+            self.s.close()
+        self.s = None
+
+
 iBufferSize = 1024
 
-def request(method, url, data=None, json=None, headers={}, stream=None, streamlen=None):
+def _split_url(url):
     try:
         proto, dummy, host, path = url.split("/", 3)
     except ValueError:
@@ -46,7 +177,6 @@ def request(method, url, data=None, json=None, headers={}, stream=None, streamle
     if proto == "http:":
         port = 80
     elif proto == "https:":
-        import ussl
         port = 443
     else:
         raise ValueError("Unsupported protocol: " + proto)
@@ -54,77 +184,245 @@ def request(method, url, data=None, json=None, headers={}, stream=None, streamle
     if ":" in host:
         host, port = host.split(":", 1)
         port = int(port)
+    return proto, host, port, path
 
-    ai = usocket.getaddrinfo(host, port, 0, usocket.SOCK_STREAM)
-    ai = ai[0]
-
+def _connect(proto, host, ai):
     s = usocket.socket(ai[0], ai[1], ai[2])
     try:
         s.connect(ai[-1])
         s.settimeout(4.0)
         if proto == "https:":
+            import ussl
             s = ussl.wrap_socket(s, server_hostname=host)
-        s.write(b"%s /%s HTTP/1.0\r\n" % (method, path))
-        if not "Host" in headers:
-            s.write(b"Host: %s\r\n" % host)
-        # Iterate over keys to avoid tuple alloc
-        for k in headers:
-            s.write(k)
-            s.write(b": ")
-            s.write(headers[k])
-            s.write(b"\r\n")
-        if json is not None:
-            assert data is None
-            import ujson
-            data = ujson.dumps(json)
-            s.write(b"Content-Type: application/json\r\n")
-        if data:
-            s.write(b"Content-Length: %d\r\n" % len(data))
-        if streamlen:
-            s.write(b"Content-Length: %d\r\n" % streamlen)
+    except OSError:
+        s.close()
+        raise
+    return s
+
+def _send_stream(s, stream, chunksize, progress):
+    """
+    Sends the stream using one preallocated buffer.
+    progress(sent) is called after every chunk.
+    """
+    buf = bytearray(chunksize)
+    mv = memoryview(buf)
+    readinto = getattr(stream, "readinto", None)
+    sent = 0
+    while True:
+        if readinto is None:
+            # The stream doesn't support readinto(): This allocates every chunk
+            junk = stream.read(chunksize)
+            n = len(junk)
+            if n:
+                s.write(junk)
+        else:
+            n = readinto(buf)
+            if n:
+                s.write(mv[:n])
+        if not n:
+            break
+        sent += n
+        hw_utils.feedWatchdog()
+        if progress is not None:
+            progress(sent)
+
+def _open_stream(stream, streamlen):
+    """
+    'stream' may be a filename: The file is sent like sendfile() does.
+    Returns (stream, streamlen, bClose).
+    """
+    if not isinstance(stream, str):
+        return stream, streamlen, False
+    if streamlen is None:
+        import uos
+        streamlen = uos.stat(stream)[6]
+    return open(stream, "rb"), streamlen, True
+
+def _send_request(s, method, host, path, data, json, headers, stream, streamlen, chunksize, progress, version):
+    """
+    Writes the request and reads the status line and the headers.
+    Returns (status, reason, headers).
+    """
+    s.write(b"%s /%s %s\r\n" % (method, path, version))
+    if not "Host" in headers:
+        s.write(b"Host: %s\r\n" % host)
+    # Iterate over keys to avoid tuple alloc
+    for k in headers:
+        s.write(k)
+        s.write(b": ")
+        s.write(headers[k])
         s.write(b"\r\n")
-        if data:
-            s.write(data)
-        if stream:
-          # print('******* streamlen: %d' % streamlen)
-          while True:
-            junk = stream.read(iBufferSize)
-            # print('******* junk: %d' % len(junk))
-            if len(junk) == 0:
-              break
-            # print('******* junk bytes: %d' % len(bytes(junk, 'ansi')))
-            sys.stdout.write('.')
-            # hw_hal.feedWatchdog()
-            s.write(junk)
-            hw_utils.feedWatchdog()
-            # utime.sleep_ms(20)
+    if json is not None:
+        assert data is None
+        import ujson
+        data = ujson.dumps(json)
+        s.write(b"Content-Type: application/json\r\n")
+    if data:
+        s.write(b"Content-Length: %d\r\n" % len(data))
+    if streamlen:
+        s.write(b"Content-Length: %d\r\n" % streamlen)
+    s.write(b"\r\n")
+    if data:
+        s.write(data)
+    if stream:
+        _send_stream(s, stream, chunksize, progress)
+    l = s.readline()
+    #print(l)
+    l = l.split(None, 2)
+    status = int(l[1])
+    reason = ""
+    if len(l) > 2:
+        reason = l[2].rstrip()
+    resp_headers = {}
+    while True:
         l = s.readline()
+        if not l or l == b"\r\n":
+            break
         #print(l)
-        l = l.split(None, 2)
-        status = int(l[1])
-        reason = ""
-        if len(l) > 2:
-            reason = l[2].rstrip()
-        while True:
-            l = s.readline()
-            if not l or l == b"\r\n":
-                break
-            #print(l)
-            if l.startswith(b"Transfer-Encoding:"):
-                if b"chunked" in l:
-                    raise ValueError("Unsupported " + l)
-            elif l.startswith(b"Location:") and not 200 <= status <= 299:
-                raise NotImplementedError("Redirects not yet supported")
+        if l.startswith(b"Location:") and not 200 <= status <= 299:
+            raise NotImplementedError("Redirects not yet supported")
+        # Header names are case insensitive: Store them in lower case
+        k, v = l.split(b":", 1)
+        resp_headers[str(k, "utf-8").lower()] = str(v, "utf-8").strip()
+    return status, reason, resp_headers
+
+def _is_chunked(resp_headers):
+    return "chunked" in resp_headers.get("transfer-encoding", "").lower()
+
+def request(method, url, data=None, json=None, headers={}, stream=None, streamlen=None, chunksize=iBufferSize, progress=None):
+    """
+    stream: A file-like object or a filename to upload.
+    chunksize: The size of the buffer used to upload the stream.
+    progress: Called with the number of bytes uploaded after every chunk.
+    """
+    proto, host, port, path = _split_url(url)
+
+    ai = usocket.getaddrinfo(host, port, 0, usocket.SOCK_STREAM)
+    ai = ai[0]
+
+    stream, streamlen, close_stream = _open_stream(stream, streamlen)
+    s = _connect(proto, host, ai)
+    try:
+        status, reason, resp_headers = _send_request(s, method, host, path, data, json, headers, stream, streamlen, chunksize, progress, b"HTTP/1.0")
     except OSError:
         s.close()
         raise
+    finally:
+        if close_stream:
+            stream.close()
+
+    raw = s
+    if _is_chunked(resp_headers):
+        raw = ChunkedReader(s)
 
-    resp = Response(s)
+    resp = Response(raw)
     resp.status_code = status
     resp.reason = reason
+    resp.headers = resp_headers
     return resp
 
 
+class Session:
+    """
+    Keeps connections alive (HTTP/1.1) and caches the resolved addresses.
+
+    The body of a response has to be read completely (or the response closed
+    after reading it) before the connection may be reused by the next request.
+    Responses without 'Content-Length' close the connection.
+    """
+
+    def __init__(self):
+        self._addrs = {}
+        self._socks = {}
+
+    def _getaddrinfo(self, host, port):
+        key = (host, port)
+        ai = self._addrs.get(key, None)
+        if ai is None:
+            ai = usocket.getaddrinfo(host, port, 0, usocket.SOCK_STREAM)[0]
+            self._addrs[key] = ai
+        return ai
+
+    def request(self, method, url, data=None, json=None, headers={}, stream=None, streamlen=None, chunksize=iBufferSize, progress=None):
+        proto, host, port, path = _split_url(url)
+        key = (proto, host, port)
+
+        stream, streamlen, close_stream = _open_stream(stream, streamlen)
+        try:
+            s, status, reason, resp_headers = self._send_request(key, method, host, path, data, json, headers, stream, streamlen, chunksize, progress)
+        finally:
+            if close_stream:
+                stream.close()
+
+        length = resp_headers.get("content-length", None)
+        if method == "HEAD" or status in (204, 304):
+            length = 0
+        release = None
+        if resp_headers.get("connection", "").lower() != "close":
+            release = lambda s: self._release(key, s)
+        if length is None and _is_chunked(resp_headers):
+            raw = ChunkedReader(s, release)
+        elif length is None:
+            # The body ends when the server closes the connection
+            raw = s
+        else:
+            raw = BodyReader(s, int(length), release)
+
+        resp = Response(raw)
+        resp.status_code = status
+        resp.reason = reason
+        resp.headers = resp_headers
+        return resp
+
+    def _send_request(self, key, method, host, path, data, json, headers, stream, streamlen, chunksize, progress):
+        proto, host, port = key
+        s = self._socks.pop(key, None)
+        reused = s is not None
+        while True:
+            if s is None:
+                s = _connect(proto, host, self._getaddrinfo(host, port))
+            try:
+                status, reason, resp_headers = _send_request(s, method, host, path, data, json, headers, stream, streamlen, chunksize, progress, b"HTTP/1.1")
+                return s, status, reason, resp_headers
+            except (OSError, IndexError):
+                # IndexError: The status line was empty
+                s.close()
+                s = None
+                if not reused or stream:
+                    raise
+                # The server closed the idle connection: Retry once on a new connection
+                reused = False
+
+    def _release(self, key, s):
+        old = self._socks.pop(key, None)
+        if old is not None:
+            old.close()
+        self._socks[key] = s
+
+    def close(self):
+        for key in self._socks:
+            self._socks[key].close()
+        self._socks = {}
+
+    def head(self, url, **kw):
+        return self.request("HEAD", url, **kw)
+
+    def get(self, url, **kw):
+        return self.request("GET", url, **kw)
+
+    def post(self, url, **kw):
+        return self.request("POST", url, **kw)
+
+    def put(self, url, **kw):
+        return self.request("PUT", url, **kw)
+
+    def patch(self, url, **kw):
+        return self.request("PATCH", url, **kw)
+
+    def delete(self, url, **kw):
+        return self.request("DELETE", url, **kw)
+
+
 def head(url, **kw):
     return request("HEAD", url, **kw)
 
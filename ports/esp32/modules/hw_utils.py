@@ -3,9 +3,14 @@
 import gc
 import uos
 import utime
-import hw_urequests
 import machine
+import hw_lazy
 import portable_firmware_constants
+import hw_boot_profile
+hw_boot_profile.checkpoint('hw_utils imports')
+
+# Imported on first use: Not needed if there is no network
+hw_urequests = hw_lazy.LazyModule('hw_urequests')
 
 strMAC = ''.join(['%02X'%i for i in machine.unique_id()])
 
@@ -45,6 +50,7 @@ def __getSwVersion():
   return readFile(portable_firmware_constants.strFILENAME_VERSION, default='none').strip()
 
 strSwVersion = __getSwVersion()
+hw_boot_profile.checkpoint('VERSION.TXT')
 
 #
 # LED and Button
@@ -94,7 +100,8 @@ class Gpio:
     '''Returns True if the Button is pressed.'''
     return self.pin_button.value() == 0
 
-objGpio = Gpio()
+# The PWM is configured on first use
+objGpio = hw_lazy.LazyObject(Gpio)
 
 
 #
@@ -115,6 +122,19 @@ def isFilesystemEmpty():
 def isUpdateFinished():
   return portable_firmware_constants.strFILENAME_VERSION in uos.listdir()
 
+def isStagedFile(strFilename):
+  try:
+    uos.stat('%s/%s' % (portable_firmware_constants.strDIRECTORY_STAGING, strFilename))
+    return True
+  except OSError:
+    return False
+
+def isStagedUpdateComplete():
+  '''
+    The manifest in the staging directory marks a staged update which was not activated.
+  '''
+  return isStagedFile(portable_firmware_constants.strFILENAME_MANIFEST)
+
 def deleteVERSION_TXTandReboot():
   '''Delete VERSION.TXT so that the filesystem will be formatted during next boot'''
   uos.remove(portable_firmware_constants.strFILENAME_VERSION)
@@ -122,6 +142,8 @@ def deleteVERSION_TXTandReboot():
 
 def formatAndReboot():
   '''Destroy the filesystem so that it will be formatted during next boot'''
+  import hw_rtc_mem
+  logTelemetry(hw_rtc_mem.EVENT_OTA_FORMAT)
   gc.collect()
   objGpio.pwmLedReboot()
   # This will trigger a format of the filesystem and the creation of booty.py.
@@ -130,12 +152,31 @@ def formatAndReboot():
   inisetup.setup()
   reboot('Reboot after format filesystem')
 
+def __activateStagedUpdate():
+  if isStagedUpdateComplete():
+    print('Staged update was not activated: Activate')
+    activateWatchdog()
+    import hw_update_ota
+    hw_update_ota.activateStaged()
+    reboot('SUCCESS: Staged update activated. Reboot')
+
 def bootCheckUpdate():
   '''
     This method is called from 'boot.py' always after boot.
 
     May reboot several times to format the filesystem and do the update.
+    See portable_firmware_constants.bBOOT_DEEPSLEEP_FAST.
   '''
+  import hw_rtc_mem
+  if bPowerOnBoot:
+    # On power on, the RtcMem is invalid.
+    hw_rtc_mem.objRtcRing.clear()
+  logTelemetry(hw_rtc_mem.EVENT_BOOT)
+
+  if portable_firmware_constants.bBOOT_DEEPSLEEP_FAST and (machine.reset_cause() == machine.DEEPSLEEP_RESET):
+    __activateStagedUpdate()
+    return
+
   objGpio.setLed(False)
 
   if objGpio.isButtonPressed() and bPowerOnBoot:
@@ -150,9 +191,15 @@ def bootCheckUpdate():
     import hw_update_ota
     hw_update_ota.updateAndReboot()
 
+  __activateStagedUpdate()
+
   if not isUpdateFinished():
-    print('Update was not finished. Format')
     activateWatchdog()
+    import hw_update_ota
+    if hw_update_ota.isUpdateResumable():
+      print('Update was not finished. Resume')
+      hw_update_ota.updateAndReboot(bResume=True)
+    print('Update was not finished. Format')
     formatAndReboot()
 
   objGpio.setLed(False)
@@ -171,38 +218,81 @@ def getDownloadUrl(wlan):
   return __getUrl(wlan, portable_firmware_constants.strHTTP_PATH_SOFTWAREUPDATE)
 
 def getVersionCheckUrl(wlan):
-  return __getUrl(wlan, portable_firmware_constants.strHTTP_PATH_VERSIONCHECK)
+  return __getUrl(wlan, portable_firmware_constants.strHTTP_PATH_VERSIONCHECK) + strUrlArgsVersionCheck
 
-def __getUrl(wlan, strFunction):
-  return '%s%s?%s=%s&%s=%s' % (getServer(wlan), strFunction, portable_firmware_constants.strHTTP_ARG_MAC, strMAC, portable_firmware_constants.strHTTP_ARG_VERSION, strSwVersion)
+def getTelemetryUrl(wlan):
+  return __getUrl(wlan, portable_firmware_constants.strHTTP_PATH_TELEMETRY)
+
+def getManifestUrl(wlan):
+  return __getUrl(wlan, portable_firmware_constants.strHTTP_PATH_MANIFEST)
+
+def getBootProfileUrl(wlan):
+  return __getUrl(wlan, portable_firmware_constants.strHTTP_PATH_BOOTPROFILE)
 
-def getSwVersionGit(wlan):
+def getFileUrl(wlan, strFilename):
+  return '%s&%s=%s' % (getDownloadUrl(wlan), portable_firmware_constants.strHTTP_ARG_FILENAME, strFilename)
+
+# The arguments don't change: Format them only once
+strUrlArgs = '?%s=%s&%s=%s' % (portable_firmware_constants.strHTTP_ARG_MAC, strMAC, portable_firmware_constants.strHTTP_ARG_VERSION, strSwVersion)
+strUrlArgsVersionCheck = '&%s=%s' % (portable_firmware_constants.strHTTP_ARG_ENCODING, portable_firmware_constants.strHTTP_ENCODING_GZIP)
+
+def __getUrl(wlan, strFunction):
+  return getServer(wlan) + strFunction + strUrlArgs
+
+# Key in the RtcMem-dictionary: (strSwVersion, strETag, strSwVersionGit) of the last version check
+strRTC_VERSIONCHECK = 'versionCheck'
+
+def __readVersionCheck():
+  if bPowerOnBoot:
+    # On power on, the RtcMem is invalid.
+    return None
+  import hw_rtc_mem
+  tupleCheck = hw_rtc_mem.objRtcMem.readRtcMemDict().get(strRTC_VERSIONCHECK, None)
+  if (tupleCheck == None) or (tupleCheck[0] != strSwVersion):
+    return None
+  return tupleCheck
+
+def getSwVersionGit(wlan, objSession=hw_urequests):
   '''
     returns verions: On success
     returns None: on failure
+
+    objSession: hw_urequests or a hw_urequests.Session to reuse the connection
   '''
   strUrl = getVersionCheckUrl(wlan)
   print('HTTP-Get ' + strUrl)
+  # If the version didn't change, the server only answers '304 Not Modified'
+  tupleCheck = __readVersionCheck()
+  dictHeaders = {}
+  if tupleCheck != None:
+    dictHeaders['If-None-Match'] = tupleCheck[1]
   try:
     feedWatchdog()
-    r = hw_urequests.get(strUrl)
+    r = objSession.get(strUrl, headers=dictHeaders)
+    if (r.status_code == 304) and (tupleCheck != None):
+      r.close()
+      return tupleCheck[2]
     if r.status_code != 200:
       print('FAILED %d %s' % (r.status_code, r.reason))
       r.close()
       return None
     strSwVersionGit = r.text
+    strETag = r.headers.get('etag', None)
     r.close()
+    if strETag != None:
+      import hw_rtc_mem
+      hw_rtc_mem.objRtcMem.updateRtcMemDict(strRTC_VERSIONCHECK, (strSwVersion, strETag, strSwVersionGit))
     return strSwVersionGit
   except OSError as e:
     print('FAILED %s' % e)
   return None
 
-def checkIfNewSwVersion(wlan):
+def checkIfNewSwVersion(wlan, objSession=hw_urequests):
   '''
     returns True: The version changed
     returns False: Same version or error
   '''
-  strSwVersionGit = getSwVersionGit(wlan)
+  strSwVersionGit = getSwVersionGit(wlan, objSession)
   if strSwVersionGit != None:
     print('Software version node: %s' % strSwVersion)
     print('Software version git:  %s' % strSwVersionGit)
@@ -221,17 +311,65 @@ def print_mem_usage(msg=''):
   a=gc.mem_alloc()
   print('mem_usage {}+{}={} {}'.format(f, a, f+a, msg))
 
-
 #
-# Repl-Command
+# Telemetry
 #
-class Command:
-  def __init__(self, func):
-    self.__func = func
+def logTelemetry(iEvent):
+  '''
+    Appends a record to the ring buffer in the RtcMem.
+    See hw_rtc_mem.EVENT_XXX
+  '''
+  import hw_rtc_mem
+  hw_rtc_mem.objRtcRing.append(machine.reset_cause(), iEvent, gc.mem_free())
 
-  def __repr__(self):
-    return self.__func()
+#
+# State of the drivers which survives deepsleep
+#
+# Keys in the RtcMem-dictionary
+strRTC_NTP = 'ntpState'
+strRTC_DS18X20_ROMS = 'ds18x20Roms'
+
+def readRtcMemValue(strKey):
+  if bPowerOnBoot:
+    # On power on, the RtcMem is invalid.
+    return None
+  import hw_rtc_mem
+  return hw_rtc_mem.objRtcMem.readRtcMemDict().get(strKey, None)
+
+def settimeNtp(iSamples=4):
+  '''
+    Sets the RTC using ntptime.settime_precise().
+    The offset and the drift are kept in the RtcMem.
+    Returns the state (offset_us, drift_ppm, sync_us).
+  '''
+  import ntptime
+  import hw_rtc_mem
+  tupleState = ntptime.settime_precise(iSamples, readRtcMemValue(strRTC_NTP))
+  hw_rtc_mem.objRtcMem.updateRtcMemDict(strRTC_NTP, tupleState)
+  return tupleState
+
+def getNtpResyncInterval_s(iMaxError_us=10000, iDefault_s=3600):
+  '''See ntptime.resync_interval_s(), using the drift in the RtcMem.'''
+  import ntptime
+  tupleState = readRtcMemValue(strRTC_NTP)
+  if tupleState == None:
+    return iDefault_s
+  return ntptime.resync_interval_s(iMaxError_us, iDefault_s, tupleState)
+
+def scanDs18x20(objDs18x20):
+  '''
+    Returns the ROMs of the sensors. They are kept in the RtcMem:
+    Waking up from deepsleep skips the search.
+  '''
+  listRoms = readRtcMemValue(strRTC_DS18X20_ROMS)
+  listRomsScanned = objDs18x20.scan_cached(listRoms)
+  if listRomsScanned != listRoms:
+    import hw_rtc_mem
+    hw_rtc_mem.objRtcMem.updateRtcMemDict(strRTC_DS18X20_ROMS, listRomsScanned)
+  return listRomsScanned
 
-  def __call__(self):
-    return self.__repr__()
 
+#
+# Repl-Command
+#
+Command = hw_lazy.Command
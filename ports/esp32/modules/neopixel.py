@@ -14,20 +14,59 @@ class NeoPixel:
         self.buf = bytearray(n * bpp)
         self.pin.init(pin.OUT)
         self.timing = timing
+        self._lut = None
+
+    def _slice(self, index):
+        # Returns the byte range of a slice of pixels
+        r = range(self.n)[index]
+        if len(r) > 1 and r[1] != r[0] + 1:
+            raise ValueError("slice step must be 1")
+        start = r[0] * self.bpp if len(r) else 0
+        return start, start + len(r) * self.bpp
 
     def __setitem__(self, index, val):
+        if isinstance(index, slice):
+            # 'val' is a buffer in the byte order of the strip (see ORDER)
+            start, stop = self._slice(index)
+            memoryview(self.buf)[start:stop] = val
+            return
         offset = index * self.bpp
         for i in range(self.bpp):
             self.buf[offset + self.ORDER[i]] = val[i]
 
     def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop = self._slice(index)
+            return self.buf[start:stop]
         offset = index * self.bpp
         return tuple(self.buf[offset + self.ORDER[i]]
                      for i in range(self.bpp))
 
     def fill(self, color):
-        for i in range(self.n):
-            self[i] = color
+        if self.n == 0:
+            return
+        self[0] = color
+        # Replicate the first pixel, doubling the copied part every step
+        mv = memoryview(self.buf)
+        length = len(self.buf)
+        filled = self.bpp
+        while filled < length:
+            n = min(filled, length - filled)
+            mv[filled:filled + n] = mv[0:n]
+            filled += n
+
+    def lut(self, brightness=1.0, gamma=1.0):
+        # Brightness and gamma are applied while writing: The buffer keeps the colors
+        if brightness == 1.0 and gamma == 1.0:
+            self._lut = None
+            return
+        lut = bytearray(256)
+        for i in range(256):
+            lut[i] = min(255, int(((i / 255) ** gamma) * brightness * 255 + 0.5))
+        self._lut = lut
 
     def write(self):
-        neopixel_write(self.pin, self.buf, self.timing)
+        if self._lut is None:
+            neopixel_write(self.pin, self.buf, self.timing)
+        else:
+            neopixel_write(self.pin, self.buf, self.timing, self._lut)
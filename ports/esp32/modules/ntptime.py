@@ -1 +0,0 @@
-../../esp8266/modules/ntptime.py
\ No newline at end of file
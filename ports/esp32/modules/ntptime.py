@@ -0,0 +1,138 @@
+try:
+    import usocket as socket
+except:
+    import socket
+try:
+    import ustruct as struct
+except:
+    import struct
+
+# (date(2000, 1, 1) - date(1900, 1, 1)).days * 24*60*60
+NTP_DELTA = 3155673600
+
+host = "pool.ntp.org"
+
+def time():
+    NTP_QUERY = bytearray(48)
+    NTP_QUERY[0] = 0x1b
+    addr = socket.getaddrinfo(host, 123)[0][-1]
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.settimeout(1)
+    res = s.sendto(NTP_QUERY, addr)
+    msg = s.recv(48)
+    s.close()
+    val = struct.unpack("!I", msg[40:44])[0]
+    return val - NTP_DELTA
+
+# There's currently no timezone support in MicroPython, so
+# utime.localtime() will return UTC time (as if it was .gmtime())
+def settime():
+    t = time()
+    import machine
+    import utime
+    tm = utime.localtime(t)
+    tm = tm[0:3] + (0,) + tm[3:6] + (0,)
+    machine.RTC().datetime(tm)
+
+#
+# Precision mode: Several queries, round trip compensation, sub-second RTC
+#
+# Offset [us] of the RTC against the server, measured by the last settime_precise()
+offset_us = None
+# Drift [ppm] of the RTC, estimated from the offsets of the last two settime_precise()
+drift_ppm = None
+# RTC [us since 2000] after the last settime_precise()
+_sync_us = None
+
+def _ntp_us(msg, i):
+    # 64 bit NTP timestamp: seconds since 1900 and a 32 bit fraction
+    sec, frac = struct.unpack("!II", msg[i:i + 8])
+    return (sec - NTP_DELTA) * 1000000 + ((frac * 1000000) >> 32)
+
+def _rtc_us():
+    import machine
+    import utime
+    tm = machine.RTC().datetime()
+    return utime.mktime((tm[0], tm[1], tm[2], tm[4], tm[5], tm[6], 0, 0)) * 1000000 + tm[7]
+
+def time_precise(samples=4):
+    """
+    Sends 'samples' queries and keeps the one with the smallest round trip delay.
+    Returns (server_us, ticks_us, delay_us):
+    server_us: The time of the server [us since 2000] at utime.ticks_us() == ticks_us
+    delay_us: The network delay of the sample
+    """
+    import utime
+    NTP_QUERY = bytearray(48)
+    NTP_QUERY[0] = 0x1b
+    addr = socket.getaddrinfo(host, 123)[0][-1]
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.settimeout(1)
+    best = None
+    try:
+        for i in range(samples):
+            t1 = utime.ticks_us()
+            # Transmit timestamp: The server returns it as originate timestamp
+            struct.pack_into("!II", NTP_QUERY, 40, i, t1)
+            try:
+                s.sendto(NTP_QUERY, addr)
+                while True:
+                    msg = s.recv(48)
+                    # Drop late answers to a query which timed out
+                    if msg[24:32] == NTP_QUERY[40:48]:
+                        break
+            except OSError:
+                continue
+            t4 = utime.ticks_us()
+            if len(msg) < 48 or msg[1] == 0:
+                # Stratum 0: Kiss-o'-Death
+                continue
+            # Receive and transmit timestamp of the server
+            t2 = _ntp_us(msg, 32)
+            t3 = _ntp_us(msg, 40)
+            delay = utime.ticks_diff(t4, t1) - (t3 - t2)
+            if delay < 0:
+                continue
+            if best is None or delay < best[2]:
+                # The answer needed half of the delay to arrive
+                best = (t3 + delay // 2, t4, delay)
+    finally:
+        s.close()
+    if best is None:
+        raise OSError("No NTP answer")
+    return best
+
+def settime_precise(samples=4, state=None):
+    """
+    Sets the RTC with sub-second accuracy.
+    Updates offset_us and drift_ppm. Returns the state (offset_us, drift_ppm, sync_us).
+    state: The state returned by the previous call, if the caller kept it
+    (for example over deepsleep). Default: The state of this module.
+    """
+    global offset_us, drift_ppm, _sync_us
+    import machine
+    import utime
+    if state is not None:
+        offset_us, drift_ppm, _sync_us = state
+    server_us, ticks, delay = time_precise(samples)
+    local_us = _rtc_us()
+    server_us += utime.ticks_diff(utime.ticks_us(), ticks)
+    offset_us = server_us - local_us
+    if _sync_us is not None and local_us > _sync_us:
+        drift_ppm = offset_us * 1000000 / (local_us - _sync_us)
+    t, us = divmod(server_us, 1000000)
+    tm = utime.localtime(t)
+    machine.RTC().datetime(tm[0:3] + (0,) + tm[3:6] + (us,))
+    _sync_us = server_us
+    return offset_us, drift_ppm, _sync_us
+
+def resync_interval_s(max_error_us=10000, default_s=3600, state=None):
+    """
+    Seconds until the RTC drifted by 'max_error_us'.
+    Returns 'default_s' as long as the drift is unknown.
+    state: See settime_precise(). Default: The state of this module.
+    """
+    drift = drift_ppm if state is None else state[1]
+    if not drift:
+        return default_s
+    return max_error_us / abs(drift)
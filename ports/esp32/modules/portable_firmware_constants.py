@@ -11,18 +11,40 @@
 
 strHTTP_PATH_SOFTWAREUPDATE = '/softwareupdate'
 strHTTP_PATH_VERSIONCHECK = '/versioncheck'
+# Returns a line '<sha256> <size> <filename>' for every file of the software
+strHTTP_PATH_MANIFEST = '/manifest'
+# POST: Records of the telemetry ring buffer, see hw_rtc_mem.RING_RECORD
+strHTTP_PATH_TELEMETRY = '/telemetry'
+# POST: Text table of the boot phases, see hw_boot_profile
+strHTTP_PATH_BOOTPROFILE = '/bootprofile'
 
 strHTTP_ARG_MAC = 'mac'
 strHTTP_ARG_VERSION = 'version'
 strHTTP_ARG_FILENAME = 'filename'
+# The encodings the node accepts for the software update, for example 'gzip'
+strHTTP_ARG_ENCODING = 'encoding'
+
+strHTTP_ENCODING_GZIP = 'gzip'
+# The server has to compress using this window size: The node allocates 2**iHTTP_GZIP_WBITS bytes
+iHTTP_GZIP_WBITS = 12
+# The size of the uncompressed tarball, sent with a compressed software update: The download may be resumed uncompressed
+strHTTP_HEADER_TAR_LENGTH = 'X-Tar-Length'
 
 strFILENAME_VERSION = 'VERSION.TXT'
+strFILENAME_MANIFEST = 'MANIFEST.TXT'
+# The delta update downloads into this directory before the files are activated
+strDIRECTORY_STAGING = 'staging'
+# Waking up from deepsleep, boot.py only logs the boot and activates a staged update:
+# The button, an empty filesystem and an unfinished update are not checked, the LED is not touched.
+bBOOT_DEEPSLEEP_FAST = False
 
 # See: https://github.com/tempstabilizer2018group/temp_stabilizer_2018/blob/master/software_rpi/rpi_root/etc/hostapd/hostapd.conf
 strWLAN_SSID = 'TempStabilizer2018'
 strWLAN_PW = 'wmm_enabled'
 iWLAN_ScanTime_ms = 1500
 iWLAN_Channel = 0 # All channels
+# Connecting with the cached bssid/channel/ip: Timeout before falling back to a normal connect
+iWLAN_CachedTimeout_ms = 3000
 
 # Reboot: slow blink, sharp
 iLedReboot_pwm_hz = 2
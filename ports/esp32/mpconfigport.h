@@ -129,7 +129,7 @@
 #define MICROPY_PY_UHASHLIB_SHA256          (1)
 #define MICROPY_PY_UCRYPTOLIB               (0)  // Hans
 #define MICROPY_PY_UBINASCII                (1)  // Hans - Didn't work
-#define MICROPY_PY_UBINASCII_CRC32          (0)  // Hans
+#define MICROPY_PY_UBINASCII_CRC32          (1)  // Hans: Used by hw_rtc_mem
 #define MICROPY_PY_URANDOM                  (1)
 #define MICROPY_PY_URANDOM_EXTRA_FUNCS      (1)
 #define MICROPY_PY_OS_DUPTERM               (1)
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Simulates a fleet of nodes polling the software update server.
+
+Every node does what hw_update_ota.checkForNewSwAndRebootRepl() does:
+  - GET /versioncheck with 'If-None-Match' from the previous round
+  - If the version changed: The delta update (/manifest and the changed files)
+    or the full update (/softwareupdate, gzip)
+  - POST /telemetry
+One connection per node is kept alive like hw_urequests.Session.
+
+Usage:
+  python3 ota_server.py --directory ../../../node_software --port 8080
+  python3 ota_loadgen.py --url http://localhost:8080 --nodes 2000 --spread 1.0
+
+'--spread 0' lets all nodes wake up at the same time.
+'''
+
+import os
+import sys
+import zlib
+import time
+import random
+import struct
+import asyncio
+import argparse
+import urllib.parse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'modules'))
+import portable_firmware_constants
+
+# See hw_rtc_mem.RING_RECORD
+strRING_RECORD = '<IIIBBH'
+iTELEMETRY_BATCH = 16
+
+class HttpConnection:
+  '''
+    HTTP/1.1 with keep-alive. Only 'Content-Length' delimited bodies: This is what the server sends.
+  '''
+  def __init__(self, strHost, iPort):
+    self.strHost = strHost
+    self.iPort = iPort
+    self.reader = None
+    self.writer = None
+
+  async def request(self, strMethod, strPath, dictHeaders=None, bytesBody=b''):
+    '''
+      Returns (iStatus, dictHeaders, bytesBody). Reconnects once if the server closed the idle connection.
+    '''
+    for bRetry in (True, False):
+      bReused = self.writer != None
+      if not bReused:
+        self.reader, self.writer = await asyncio.open_connection(self.strHost, self.iPort)
+      try:
+        return await self.__request(strMethod, strPath, dictHeaders or {}, bytesBody)
+      except (ConnectionError, asyncio.IncompleteReadError):
+        self.close()
+        if not (bRetry and bReused):
+          raise
+
+  async def __request(self, strMethod, strPath, dictHeaders, bytesBody):
+    listLines = ['%s %s HTTP/1.1' % (strMethod, strPath), 'Host: %s' % self.strHost]
+    for strKey, strValue in dictHeaders.items():
+      listLines.append('%s: %s' % (strKey, strValue))
+    if bytesBody:
+      listLines.append('Content-Length: %d' % len(bytesBody))
+    listLines.append('\r\n')
+    self.writer.write('\r\n'.join(listLines).encode('latin-1') + bytesBody)
+    await self.writer.drain()
+
+    strStatusLine = await self.reader.readline()
+    if not strStatusLine:
+      raise ConnectionError('Connection closed by the server')
+    iStatus = int(strStatusLine.split(None, 2)[1])
+    dictResponseHeaders = {}
+    while True:
+      strLine = await self.reader.readline()
+      if strLine in (b'\r\n', b''):
+        break
+      strKey, strValue = strLine.decode('latin-1').split(':', 1)
+      dictResponseHeaders[strKey.strip().lower()] = strValue.strip()
+    iLength = int(dictResponseHeaders.get('content-length', '0'))
+    bytesResponse = await self.reader.readexactly(iLength) if (iLength > 0 and strMethod != 'HEAD') else b''
+    if dictResponseHeaders.get('connection', '').lower() == 'close':
+      self.close()
+    return iStatus, dictResponseHeaders, bytesResponse
+
+  def close(self):
+    if self.writer != None:
+      self.writer.close()
+    self.reader = self.writer = None
+
+class Statistics:
+  def __init__(self):
+    self.dictLatencies_s = {}
+    self.dictErrors = {}
+    self.iBytesReceived = 0
+
+  def add(self, strName, fLatency_s, iBytes):
+    self.dictLatencies_s.setdefault(strName, []).append(fLatency_s)
+    self.iBytesReceived += iBytes
+
+  def error(self, strName):
+    self.dictErrors[strName] = self.dictErrors.get(strName, 0) + 1
+
+  def __str__(self):
+    listLines = ['%-22s %7s %9s %9s %9s %9s' % ('request', 'count', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms')]
+    for strName, listLatencies_s in sorted(self.dictLatencies_s.items()):
+      listLatencies_s.sort()
+      funcPercentile = lambda fPercent: listLatencies_s[min(len(listLatencies_s) - 1, int(len(listLatencies_s) * fPercent))] * 1000.0
+      listLines.append('%-22s %7d %9.1f %9.1f %9.1f %9.1f' % (strName, len(listLatencies_s), funcPercentile(0.5), funcPercentile(0.9), funcPercentile(0.99), listLatencies_s[-1] * 1000.0))
+    for strName, iCount in sorted(self.dictErrors.items()):
+      listLines.append('%-22s %7d errors' % (strName, iCount))
+    return '\n'.join(listLines)
+
+class Node:
+  def __init__(self, args, iNode, objStatistics):
+    self.args = args
+    self.objStatistics = objStatistics
+    self.strMac = '%012X' % (0x240AC4000000 + iNode)
+    self.strVersion = args.version
+    self.strETag = None
+    self.strVersionGit = None
+    self.dictManifest = None
+    self.objUrl = urllib.parse.urlsplit(args.url)
+    self.objConnection = HttpConnection(self.objUrl.hostname, self.objUrl.port or 80)
+    self.iSequence = 0
+
+  def __path(self, strFunction, strExtra=''):
+    return '%s%s?%s=%s&%s=%s%s' % (self.objUrl.path.rstrip('/'), strFunction, portable_firmware_constants.strHTTP_ARG_MAC, self.strMac, portable_firmware_constants.strHTTP_ARG_VERSION, self.strVersion, strExtra)
+
+  async def __request(self, strName, strMethod, strPath, dictHeaders=None, bytesBody=b''):
+    fStart_s = time.monotonic()
+    try:
+      tupleResponse = await self.objConnection.request(strMethod, strPath, dictHeaders, bytesBody)
+    except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+      self.objStatistics.error(strName)
+      return None
+    self.objStatistics.add(strName, time.monotonic() - fStart_s, len(tupleResponse[2]))
+    return tupleResponse
+
+  async def versionCheck(self):
+    '''Returns the version of the server or None.'''
+    dictHeaders = {}
+    if self.strETag != None:
+      dictHeaders['If-None-Match'] = self.strETag
+    strExtra = '&%s=%s' % (portable_firmware_constants.strHTTP_ARG_ENCODING, portable_firmware_constants.strHTTP_ENCODING_GZIP)
+    tupleResponse = await self.__request('versioncheck', 'GET', self.__path(portable_firmware_constants.strHTTP_PATH_VERSIONCHECK, strExtra), dictHeaders)
+    if tupleResponse == None:
+      return None
+    iStatus, dictResponseHeaders, bytesBody = tupleResponse
+    if iStatus == 304:
+      return self.strVersionGit
+    if iStatus != 200:
+      self.objStatistics.error('versioncheck %d' % iStatus)
+      return None
+    self.strETag = dictResponseHeaders.get('etag', None)
+    self.strVersionGit = bytesBody.decode('utf-8')
+    return self.strVersionGit
+
+  async def updateFull(self):
+    tupleResponse = await self.__request('softwareupdate', 'GET', self.__path(portable_firmware_constants.strHTTP_PATH_SOFTWAREUPDATE), {'Accept-Encoding': portable_firmware_constants.strHTTP_ENCODING_GZIP})
+    if tupleResponse == None or tupleResponse[0] != 200:
+      self.objStatistics.error('softwareupdate')
+      return False
+    iStatus, dictResponseHeaders, bytesBody = tupleResponse
+    if dictResponseHeaders.get('content-encoding', None) == portable_firmware_constants.strHTTP_ENCODING_GZIP and self.args.verify:
+      # Decompress with the window of the node
+      zlib.decompressobj(16 + portable_firmware_constants.iHTTP_GZIP_WBITS).decompress(bytesBody)
+    return True
+
+  async def updateDelta(self):
+    '''Returns None if the server doesn't provide a manifest.'''
+    tupleResponse = await self.__request('manifest', 'GET', self.__path(portable_firmware_constants.strHTTP_PATH_MANIFEST))
+    if tupleResponse == None:
+      return False
+    if tupleResponse[0] == 404:
+      return None
+    dictManifest = {}
+    for strLine in tupleResponse[2].decode('utf-8').splitlines():
+      strSha256, strSize, strFilename = strLine.split(' ', 2)
+      dictManifest[strFilename] = strSha256
+    for strFilename, strSha256 in dictManifest.items():
+      if self.dictManifest != None and self.dictManifest.get(strFilename, None) == strSha256:
+        continue
+      if self.dictManifest == None and random.random() >= self.args.changed:
+        # The first update of a simulated node: Only a part of the files changed
+        continue
+      strExtra = '&%s=%s' % (portable_firmware_constants.strHTTP_ARG_FILENAME, urllib.parse.quote(strFilename))
+      tupleFile = await self.__request('softwareupdate file', 'GET', self.__path(portable_firmware_constants.strHTTP_PATH_SOFTWAREUPDATE, strExtra))
+      if tupleFile == None or tupleFile[0] != 200:
+        return False
+    self.dictManifest = dictManifest
+    return True
+
+  async def uploadTelemetry(self):
+    listRecords = []
+    for i in range(iTELEMETRY_BATCH):
+      self.iSequence = (self.iSequence + 1) & 0xFFFF
+      listRecords.append(struct.pack(strRING_RECORD, int(time.time()), 0, 100000, 1, 0, self.iSequence))
+    tupleResponse = await self.__request('telemetry', 'POST', self.__path(portable_firmware_constants.strHTTP_PATH_TELEMETRY), {'Content-Type': 'application/octet-stream'}, b''.join(listRecords))
+    if tupleResponse != None and tupleResponse[0] != 200:
+      self.objStatistics.error('telemetry %d' % tupleResponse[0])
+
+  async def wakeUp(self):
+    strVersionGit = await self.versionCheck()
+    if strVersionGit != None and strVersionGit != self.strVersion:
+      bUpdated = None
+      if not self.args.full:
+        bUpdated = await self.updateDelta()
+      if bUpdated == None:
+        bUpdated = await self.updateFull()
+      if bUpdated:
+        self.strVersion = strVersionGit
+        # The node reboots after the update: The ETag is bound to the old version
+        self.strETag = None
+    await self.uploadTelemetry()
+
+async def runNode(objNode, args, objSemaphore):
+  for iRound in range(args.rounds):
+    await asyncio.sleep(random.uniform(0.0, args.spread))
+    async with objSemaphore:
+      await objNode.wakeUp()
+    if not args.keepalive:
+      objNode.objConnection.close()
+    await asyncio.sleep(args.interval)
+  objNode.objConnection.close()
+
+async def main(args):
+  objStatistics = Statistics()
+  objSemaphore = asyncio.Semaphore(args.concurrency)
+  listNodes = [Node(args, i, objStatistics) for i in range(args.nodes)]
+  fStart_s = time.monotonic()
+  await asyncio.gather(*[runNode(objNode, args, objSemaphore) for objNode in listNodes])
+  fDuration_s = time.monotonic() - fStart_s
+  print(objStatistics)
+  print('%d nodes, %d rounds in %0.2fs, %d bytes received' % (args.nodes, args.rounds, fDuration_s, objStatistics.iBytesReceived))
+  iUpdated = len([objNode for objNode in listNodes if objNode.strVersion != args.version])
+  print('%d nodes updated' % iUpdated)
+
+def parseArgs(listArgs=None):
+  parser = argparse.ArgumentParser(description='Simulates a fleet of nodes polling the software update server.')
+  parser.add_argument('--url', default='http://localhost:8080')
+  parser.add_argument('--nodes', type=int, default=100)
+  parser.add_argument('--rounds', type=int, default=2, help='Wake ups per node: The second round hits the ETag')
+  parser.add_argument('--spread', type=float, default=1.0, help='The nodes wake up within this many seconds')
+  parser.add_argument('--interval', type=float, default=0.0, help='Seconds between the rounds of a node')
+  parser.add_argument('--concurrency', type=int, default=1000, help='Maximal number of nodes talking to the server at the same time')
+  parser.add_argument('--version', default='old', help='The software version the nodes start with')
+  parser.add_argument('--changed', type=float, default=0.2, help='Fraction of the files a delta update downloads')
+  parser.add_argument('--full', action='store_true', help='Skip the delta update')
+  parser.add_argument('--keepalive', action='store_true', help='Keep the connection between the rounds')
+  parser.add_argument('--verify', action='store_true', help='Decompress the gzip download')
+  return parser.parse_args(listArgs)
+
+if __name__ == '__main__':
+  asyncio.run(main(parseArgs()))
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Reference implementation of the server side of the software update protocol.
+See modules/portable_firmware_constants.py, modules/hw_utils.py and modules/hw_update_ota.py
+
+  GET  /versioncheck?mac=..&version=..      The version of the software: 'ETag', 'If-None-Match'
+  GET  /softwareupdate?mac=..&version=..    The software as tarball: 'Range', 'Accept-Encoding: gzip', 'X-Tar-Length'
+  GET  /softwareupdate?..&filename=..       One file of the software (delta update)
+  GET  /manifest?mac=..&version=..          '<sha256> <size> <filename>' for every file
+  POST /telemetry?mac=..&version=..         Records of the telemetry ring buffer
+  POST /bootprofile?mac=..&version=..       Table of the boot phases
+
+The software is read from a directory which has to contain 'VERSION.TXT'.
+The tarball, its compressed variant and the manifest are built once per version and served from memory.
+A changed directory is detected within '--rescan' seconds.
+
+Usage:
+  python3 ota_server.py --directory ../../../node_software --port 8080
+  python3 ota_loadgen.py --url http://localhost:8080 --nodes 2000
+'''
+
+import os
+import io
+import sys
+import zlib
+import time
+import struct
+import asyncio
+import hashlib
+import logging
+import tarfile
+import argparse
+import urllib.parse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'modules'))
+import portable_firmware_constants
+
+logger = logging.getLogger('ota_server')
+
+# See hw_rtc_mem.RING_RECORD
+strRING_RECORD = '<IIIBBH'
+iRING_RECORD_SIZE = struct.calcsize(strRING_RECORD)
+
+iMAX_HEADER_LINES = 64
+iMAX_BODY_SIZE = 0x10000
+
+dictREASONS = {
+  200: 'OK',
+  206: 'Partial Content',
+  304: 'Not Modified',
+  400: 'Bad Request',
+  404: 'Not Found',
+  405: 'Method Not Allowed',
+  413: 'Payload Too Large',
+  416: 'Range Not Satisfiable',
+}
+
+def compressGzip(data):
+  '''
+    The node decompresses with uzlib.DecompIO(f, 16+iHTTP_GZIP_WBITS):
+    The window of the compressor must not be bigger.
+  '''
+  objCompress = zlib.compressobj(9, zlib.DEFLATED, 16 + portable_firmware_constants.iHTTP_GZIP_WBITS)
+  return objCompress.compress(data) + objCompress.flush()
+
+class Software:
+  '''
+    One version of the software, built in memory.
+  '''
+  def __init__(self, strDirectory):
+    self.dictFiles = {}
+    for strRoot, listDirs, listFiles in os.walk(strDirectory):
+      listDirs.sort()
+      for strFile in sorted(listFiles):
+        strFilename = os.path.join(strRoot, strFile)
+        strName = os.path.relpath(strFilename, strDirectory).replace(os.sep, '/')
+        with open(strFilename, 'rb') as fIn:
+          self.dictFiles[strName] = fIn.read()
+    if portable_firmware_constants.strFILENAME_VERSION not in self.dictFiles:
+      raise ValueError('%s missing in %s' % (portable_firmware_constants.strFILENAME_VERSION, strDirectory))
+    self.strVersion = self.dictFiles[portable_firmware_constants.strFILENAME_VERSION].decode('utf-8').strip()
+    self.bytesVersion = self.strVersion.encode('utf-8')
+    self.strVersionETag = '"%s"' % hashlib.sha256(self.bytesVersion).hexdigest()[:16]
+    self.bytesTar = self.__buildTar()
+    self.bytesTarGzip = compressGzip(self.bytesTar)
+    self.strTarETag = '"%s"' % hashlib.sha256(self.bytesTar).hexdigest()[:16]
+    self.bytesManifest = ''.join(['%s %d %s\n' % (hashlib.sha256(data).hexdigest(), len(data), strName) for strName, data in sorted(self.dictFiles.items())]).encode('utf-8')
+
+  def __buildTar(self):
+    '''
+      VERSION.TXT is the last member: The node considers the update finished if it exists.
+    '''
+    listNames = sorted(self.dictFiles)
+    listNames.remove(portable_firmware_constants.strFILENAME_VERSION)
+    listNames.append(portable_firmware_constants.strFILENAME_VERSION)
+    f = io.BytesIO()
+    # upip_utarfile only understands plain ustar headers
+    with tarfile.open(fileobj=f, mode='w', format=tarfile.USTAR_FORMAT) as tar:
+      for strName in listNames:
+        data = self.dictFiles[strName]
+        info = tarfile.TarInfo(strName)
+        info.size = len(data)
+        info.mtime = 0
+        tar.addfile(info, io.BytesIO(data))
+    return f.getvalue()
+
+  def __str__(self):
+    return 'version %s: %d files, tar %d bytes, gzip %d bytes' % (self.strVersion, len(self.dictFiles), len(self.bytesTar), len(self.bytesTarGzip))
+
+class SoftwareCache:
+  '''
+    Rebuilds the software only if a file in the directory changed.
+    The directory is scanned at most every fRescan_s seconds: Thousands of polls cost nothing.
+  '''
+  def __init__(self, strDirectory, fRescan_s=5.0):
+    self.strDirectory = strDirectory
+    self.fRescan_s = fRescan_s
+    self.fNextScan_s = 0.0
+    self.tupleSignature = None
+    self.objSoftware = None
+
+  def __signature(self):
+    listSignature = []
+    for strRoot, listDirs, listFiles in os.walk(self.strDirectory):
+      for strFile in listFiles:
+        objStat = os.stat(os.path.join(strRoot, strFile))
+        listSignature.append((strRoot, strFile, objStat.st_size, objStat.st_mtime_ns))
+    return tuple(sorted(listSignature))
+
+  def get(self):
+    fNow_s = time.monotonic()
+    if fNow_s < self.fNextScan_s:
+      return self.objSoftware
+    self.fNextScan_s = fNow_s + self.fRescan_s
+    tupleSignature = self.__signature()
+    if tupleSignature != self.tupleSignature:
+      self.objSoftware = Software(self.strDirectory)
+      self.tupleSignature = tupleSignature
+      logger.info('Built %s', self.objSoftware)
+    return self.objSoftware
+
+class Statistics:
+  def __init__(self):
+    self.dictRequests = {}
+    self.iConnections = 0
+    self.iConnectionsMax = 0
+    self.iBytesSent = 0
+
+  def count(self, strPath, iStatus):
+    key = (strPath, iStatus)
+    self.dictRequests[key] = self.dictRequests.get(key, 0) + 1
+
+  def __str__(self):
+    listLines = ['connections %d (max %d), %d bytes sent' % (self.iConnections, self.iConnectionsMax, self.iBytesSent)]
+    for (strPath, iStatus), iCount in sorted(self.dictRequests.items()):
+      listLines.append('  %-16s %d: %d' % (strPath, iStatus, iCount))
+    return '\n'.join(listLines)
+
+class Request:
+  def __init__(self, strMethod, strPath, dictArgs, dictHeaders, bytesBody):
+    self.strMethod = strMethod
+    self.strPath = strPath
+    self.dictArgs = dictArgs
+    self.dictHeaders = dictHeaders
+    self.bytesBody = bytesBody
+
+  @property
+  def strMac(self):
+    return self.dictArgs.get(portable_firmware_constants.strHTTP_ARG_MAC, '?')
+
+class Response:
+  def __init__(self, iStatus, bytesBody=b'', dictHeaders=None):
+    self.iStatus = iStatus
+    self.bytesBody = bytesBody
+    self.dictHeaders = dictHeaders or {}
+
+class HttpError(Exception):
+  def __init__(self, iStatus):
+    Exception.__init__(self, iStatus)
+    self.iStatus = iStatus
+
+def parseRange(strRange, iSize):
+  '''
+    Only 'bytes=<start>-' and 'bytes=<start>-<end>' are supported: This is what the node sends.
+    Returns (iStart, iEnd) with iEnd exclusive or None to ignore the header.
+  '''
+  if not strRange.startswith('bytes='):
+    return None
+  strSpec = strRange[len('bytes='):]
+  if ',' in strSpec:
+    return None
+  try:
+    strStart, strEnd = strSpec.split('-', 1)
+    iStart = int(strStart)
+    iEnd = iSize if strEnd.strip() == '' else int(strEnd) + 1
+  except ValueError:
+    return None
+  if iStart >= iSize or iEnd <= iStart:
+    raise HttpError(416)
+  return iStart, min(iEnd, iSize)
+
+class OtaServer:
+  def __init__(self, objCache, strTelemetryDirectory=None, bManifest=True):
+    self.objCache = objCache
+    self.strTelemetryDirectory = strTelemetryDirectory
+    self.bManifest = bManifest
+    self.objStatistics = Statistics()
+    self.dictHandlers = {
+      portable_firmware_constants.strHTTP_PATH_VERSIONCHECK: self.handleVersionCheck,
+      portable_firmware_constants.strHTTP_PATH_SOFTWAREUPDATE: self.handleSoftwareUpdate,
+      portable_firmware_constants.strHTTP_PATH_MANIFEST: self.handleManifest,
+      portable_firmware_constants.strHTTP_PATH_TELEMETRY: self.handleTelemetry,
+      portable_firmware_constants.strHTTP_PATH_BOOTPROFILE: self.handleBootProfile,
+    }
+
+  #
+  # Handlers
+  #
+  def handleVersionCheck(self, objRequest):
+    objSoftware = self.objCache.get()
+    dictHeaders = {'ETag': objSoftware.strVersionETag}
+    if objRequest.dictHeaders.get('if-none-match', None) == objSoftware.strVersionETag:
+      return Response(304, dictHeaders=dictHeaders)
+    return Response(200, objSoftware.bytesVersion, dictHeaders)
+
+  def handleSoftwareUpdate(self, objRequest):
+    objSoftware = self.objCache.get()
+    strFilename = objRequest.dictArgs.get(portable_firmware_constants.strHTTP_ARG_FILENAME, None)
+    if strFilename != None:
+      data = objSoftware.dictFiles.get(strFilename, None)
+      if data == None:
+        raise HttpError(404)
+      return Response(200, data)
+
+    logger.info('%s: software update from %s to %s', objRequest.strMac, objRequest.dictArgs.get(portable_firmware_constants.strHTTP_ARG_VERSION, '?'), objSoftware.strVersion)
+    dictHeaders = {'ETag': objSoftware.strTarETag, 'Accept-Ranges': 'bytes'}
+    strRange = objRequest.dictHeaders.get('range', None)
+    if strRange != None:
+      tupleRange = parseRange(strRange, len(objSoftware.bytesTar))
+      if tupleRange != None:
+        iStart, iEnd = tupleRange
+        dictHeaders['Content-Range'] = 'bytes %d-%d/%d' % (iStart, iEnd - 1, len(objSoftware.bytesTar))
+        return Response(206, memoryview(objSoftware.bytesTar)[iStart:iEnd], dictHeaders)
+    strAcceptEncoding = objRequest.dictHeaders.get('accept-encoding', '')
+    if portable_firmware_constants.strHTTP_ENCODING_GZIP in strAcceptEncoding:
+      dictHeaders['Content-Encoding'] = portable_firmware_constants.strHTTP_ENCODING_GZIP
+      dictHeaders[portable_firmware_constants.strHTTP_HEADER_TAR_LENGTH] = str(len(objSoftware.bytesTar))
+      return Response(200, objSoftware.bytesTarGzip, dictHeaders)
+    return Response(200, objSoftware.bytesTar, dictHeaders)
+
+  def handleManifest(self, objRequest):
+    if not self.bManifest:
+      # The node falls back to a full update
+      raise HttpError(404)
+    return Response(200, self.objCache.get().bytesManifest)
+
+  def handleTelemetry(self, objRequest):
+    if objRequest.strMethod != 'POST':
+      raise HttpError(405)
+    if len(objRequest.bytesBody) % iRING_RECORD_SIZE != 0:
+      raise HttpError(400)
+    listLines = []
+    for iOffset in range(0, len(objRequest.bytesBody), iRING_RECORD_SIZE):
+      listLines.append('%d %d %d %d %d %d' % struct.unpack_from(strRING_RECORD, objRequest.bytesBody, iOffset))
+    logger.debug('%s: %d telemetry records', objRequest.strMac, len(listLines))
+    self.__appendToLog(objRequest.strMac, 'telemetry', listLines)
+    return Response(200)
+
+  def handleBootProfile(self, objRequest):
+    if objRequest.strMethod != 'POST':
+      raise HttpError(405)
+    strTable = objRequest.bytesBody.decode('utf-8', 'replace')
+    logger.info('%s: boot profile\n%s', objRequest.strMac, strTable)
+    self.__appendToLog(objRequest.strMac, 'bootprofile', [strTable])
+    return Response(200)
+
+  def __appendToLog(self, strMac, strKind, listLines):
+    if self.strTelemetryDirectory == None:
+      return
+    strFilename = os.path.join(self.strTelemetryDirectory, '%s_%s.txt' % (os.path.basename(strMac), strKind))
+    with open(strFilename, 'a') as fOut:
+      for strLine in listLines:
+        fOut.write(strLine)
+        fOut.write('\n')
+
+  #
+  # HTTP
+  #
+  async def readRequest(self, reader):
+    '''
+      Returns None if the client closed the connection.
+    '''
+    strLine = await reader.readline()
+    if not strLine:
+      return None
+    listRequestLine = strLine.decode('latin-1').split()
+    if len(listRequestLine) != 3:
+      raise HttpError(400)
+    strMethod, strTarget, strVersion = listRequestLine
+    dictHeaders = {'_version': strVersion}
+    for i in range(iMAX_HEADER_LINES):
+      strLine = await reader.readline()
+      if strLine in (b'\r\n', b'\n', b''):
+        break
+      strKey, strValue = strLine.decode('latin-1').split(':', 1)
+      dictHeaders[strKey.strip().lower()] = strValue.strip()
+    else:
+      raise HttpError(400)
+    iContentLength = int(dictHeaders.get('content-length', '0'))
+    if iContentLength > iMAX_BODY_SIZE:
+      raise HttpError(413)
+    bytesBody = await reader.readexactly(iContentLength) if iContentLength > 0 else b''
+    objUrl = urllib.parse.urlsplit(strTarget)
+    dictArgs = dict(urllib.parse.parse_qsl(objUrl.query))
+    return Request(strMethod, objUrl.path, dictArgs, dictHeaders, bytesBody)
+
+  def handle(self, objRequest):
+    if objRequest.strMethod not in ('GET', 'HEAD', 'POST'):
+      raise HttpError(405)
+    funcHandler = self.dictHandlers.get(objRequest.strPath, None)
+    if funcHandler == None:
+      raise HttpError(404)
+    return funcHandler(objRequest)
+
+  async def writeResponse(self, writer, objResponse, bHead, bKeepAlive):
+    listLines = ['HTTP/1.1 %d %s' % (objResponse.iStatus, dictREASONS.get(objResponse.iStatus, ''))]
+    for strKey, strValue in objResponse.dictHeaders.items():
+      listLines.append('%s: %s' % (strKey, strValue))
+    if objResponse.iStatus != 304:
+      listLines.append('Content-Length: %d' % len(objResponse.bytesBody))
+    if not bKeepAlive:
+      listLines.append('Connection: close')
+    listLines.append('\r\n')
+    writer.write('\r\n'.join(listLines).encode('latin-1'))
+    if not bHead and objResponse.iStatus != 304:
+      # The body is a bytes object of the cache: Not copied
+      writer.write(objResponse.bytesBody)
+      self.objStatistics.iBytesSent += len(objResponse.bytesBody)
+    await writer.drain()
+
+  async def serveConnection(self, reader, writer):
+    self.objStatistics.iConnections += 1
+    self.objStatistics.iConnectionsMax = max(self.objStatistics.iConnectionsMax, self.objStatistics.iConnections)
+    try:
+      while True:
+        try:
+          objRequest = await self.readRequest(reader)
+          if objRequest == None:
+            break
+          bKeepAlive = objRequest.dictHeaders['_version'] == 'HTTP/1.1' and objRequest.dictHeaders.get('connection', '').lower() != 'close'
+          try:
+            objResponse = self.handle(objRequest)
+          except HttpError as e:
+            objResponse = Response(e.iStatus)
+          self.objStatistics.count(objRequest.strPath, objResponse.iStatus)
+          await self.writeResponse(writer, objResponse, objRequest.strMethod == 'HEAD', bKeepAlive)
+          if not bKeepAlive:
+            break
+        except HttpError as e:
+          # The request could not be parsed: The connection is out of sync
+          await self.writeResponse(writer, Response(e.iStatus), False, False)
+          break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+      logger.debug('Connection failed: %s', e)
+    finally:
+      self.objStatistics.iConnections -= 1
+      writer.close()
+
+  async def logStatistics(self, fInterval_s):
+    while True:
+      await asyncio.sleep(fInterval_s)
+      logger.info('%s', self.objStatistics)
+
+async def main(args):
+  objCache = SoftwareCache(args.directory, args.rescan)
+  logger.info('Serving %s', objCache.get())
+  objServer = OtaServer(objCache, args.telemetry, not args.no_manifest)
+  server = await asyncio.start_server(objServer.serveConnection, args.host, args.port, backlog=args.backlog)
+  logger.info('Listening on %s:%d', args.host, args.port)
+  if args.statistics > 0:
+    asyncio.ensure_future(objServer.logStatistics(args.statistics))
+  async with server:
+    await server.serve_forever()
+
+def parseArgs(listArgs=None):
+  parser = argparse.ArgumentParser(description='Software update server for the nodes.')
+  parser.add_argument('--directory', required=True, help='The software: Must contain %s' % portable_firmware_constants.strFILENAME_VERSION)
+  parser.add_argument('--host', default='0.0.0.0')
+  parser.add_argument('--port', type=int, default=80)
+  parser.add_argument('--backlog', type=int, default=1024, help='Many nodes wake up at the same time')
+  parser.add_argument('--rescan', type=float, default=5.0, help='Seconds between checks for a changed directory')
+  parser.add_argument('--telemetry', default=None, help='Directory to append the telemetry and boot profiles')
+  parser.add_argument('--no-manifest', action='store_true', help='Answer 404 to %s: Forces full updates' % portable_firmware_constants.strHTTP_PATH_MANIFEST)
+  parser.add_argument('--statistics', type=float, default=0.0, help='Seconds between statistics in the log')
+  parser.add_argument('--verbose', action='store_true')
+  return parser.parse_args(listArgs)
+
+if __name__ == '__main__':
+  args = parseArgs()
+  logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+  try:
+    asyncio.run(main(args))
+  except KeyboardInterrupt:
+    pass
@@ -0,0 +1,36 @@
+# hw_update_ota.parseManifest(): The MANIFEST of the firmware files
+
+import sys
+sys.path.append(sys.path[0] + '/stubs')
+import esp32_stubs
+import hw_update_ota
+
+def show(d):
+    for strFilename in sorted(d):
+        print(repr(strFilename), d[strFilename])
+
+# empty or missing MANIFEST
+print(hw_update_ota.parseManifest(''))
+print(hw_update_ota.parseManifest('\n\n'))
+
+# one line per file: sha256 size filename
+show(hw_update_ota.parseManifest(
+    'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855 0 empty.py\n'
+    '2c26b46b68ffc68ff99b453c1d30413413422d706483bfa0f98a5e886266e7ae 3 lib/foo.py\n'
+))
+
+# surrounding whitespace, blank lines and CRLF are ignored
+show(hw_update_ota.parseManifest('\r\n  abc 12 main.py  \r\n\n def 7 boot.py\n'))
+
+# the filename may contain spaces
+show(hw_update_ota.parseManifest('abc 12 my file.txt'))
+
+# the last entry for a filename wins
+show(hw_update_ota.parseManifest('abc 1 main.py\ndef 2 main.py'))
+
+# malformed lines
+for strManifest in ('abc main.py', 'abc', 'abc size main.py'):
+    try:
+        hw_update_ota.parseManifest(strManifest)
+    except ValueError:
+        print('ValueError')
@@ -0,0 +1,84 @@
+# hw_rtc_mem.RtcMem: The dictionary stored as binary TLV in the RTC SLOW memory
+
+import sys
+sys.path.append(sys.path[0] + '/stubs')
+import esp32_stubs
+import ustruct
+import hw_rtc_mem
+
+def length(m):
+    return ustruct.unpack_from('<I', m.mem, hw_rtc_mem.OFFSET_LENGTH_BYTES)[0]
+
+def show(d):
+    for key in sorted(d, key=str):
+        print(repr(key), repr(d[key]))
+
+m = hw_rtc_mem.RtcMem(bytearray(256))
+
+# uninitialized memory
+print(m.readRtcMemDict())
+print(m.readRtcMem('default'))
+
+# round trip of all types
+d = {
+    'none': None, 'true': True, 'false': False,
+    'int32': -0x80000000, 'int64': 1 << 40, 'negative64': -(1 << 40),
+    'float': 0.5, 'str': 'Hällo', 'bytes': b'\x00\xff',
+    'list': [1, 'a', []], 'tuple': (1, (2, 3)), 'dict': {1: 2},
+    4711: 'int key',
+}
+m.writeRtcMemDict(d)
+print(m.readRtcMemDict() == d)
+show(m.readRtcMemDict())
+print(hw_rtc_mem._sizeOf(d) == length(m))
+
+# a corrupt payload is detected by the crc
+m.mem[hw_rtc_mem.OFFSET_PAYLOAD_BYTES + 5] ^= 0xff
+print(m.readRtcMemDict())
+m.mem[hw_rtc_mem.OFFSET_PAYLOAD_BYTES + 5] ^= 0xff
+print(m.readRtcMemDict() == d)
+
+# an impossible length
+mem = bytearray(m.mem)
+ustruct.pack_into('<I', m.mem, hw_rtc_mem.OFFSET_LENGTH_BYTES, 1000)
+print(m.readRtcMemDict())
+m.mem[:] = mem
+
+# update in place: the encoded value keeps its size, the other bytes are untouched
+m.writeRtcMemDict({'a': 1, 'b': 'xyz', 'c': (1 << 40)})
+l = length(m)
+mem = bytearray(m.mem)
+m.updateRtcMemDict('b', 'abc')
+m.updateRtcMemDict('a', -2)
+print(length(m) == l)
+# 'xyz' -> 'abc' and 1 -> -2: 7 bytes of the payload
+print(len([i for i in range(hw_rtc_mem.OFFSET_PAYLOAD_BYTES, len(mem)) if mem[i] != m.mem[i]]))
+show(m.readRtcMemDict())
+
+# update with a new size: the dictionary is rewritten
+m.updateRtcMemDict('b', 'longer')
+m.updateRtcMemDict('a', 1 << 40)
+m.updateRtcMemDict('new', None)
+print(length(m) - l)
+show(m.readRtcMemDict())
+
+# update of invalid memory: a new dictionary
+m.mem[:] = bytearray(len(m.mem))
+m.updateRtcMemDict('x', 1)
+show(m.readRtcMemDict())
+
+# errors
+try:
+    m.writeRtcMemDict({'big': 'x' * 300})
+except ValueError as e:
+    print('ValueError', e)
+try:
+    m.writeRtcMemDict({'set': set()})
+except TypeError:
+    print('TypeError')
+show(m.readRtcMemDict())
+
+# strings
+m.writeRtcMem('Hallo')
+print(m.readRtcMem())
+print(m.readRtcMemDict())
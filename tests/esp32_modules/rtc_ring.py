@@ -0,0 +1,55 @@
+# hw_rtc_mem.RtcRing: The telemetry ring buffer in the RTC SLOW memory
+
+import sys
+sys.path.append(sys.path[0] + '/stubs')
+import esp32_stubs
+import ustruct
+import hw_rtc_mem
+
+def show(b):
+    # time and ticks differ from run to run
+    print([ustruct.unpack_from(hw_rtc_mem.RING_RECORD, b, i)[2:] for i in range(0, len(b), hw_rtc_mem.RING_RECORD_SIZE)])
+
+# space for 4 records
+r = hw_rtc_mem.RtcRing(bytearray(hw_rtc_mem.RING_OFFSET_RECORDS + 4 * hw_rtc_mem.RING_RECORD_SIZE))
+print(r.iCapacity)
+
+# after power on, the memory contains garbage
+r.mem[:] = b'\xa5' * len(r.mem)
+print(r.isValid(), r.count())
+show(r.readBatch(10))
+
+# append() initializes the buffer
+r.append(1, hw_rtc_mem.EVENT_BOOT, 1000)
+print(r.isValid(), r.count())
+r.append(4, hw_rtc_mem.EVENT_OTA_START, 1001)
+show(r.readBatch(10))
+show(r.readBatch(1))
+
+# remove the oldest record
+r.remove(1)
+print(r.count())
+show(r.readBatch(10))
+
+# wraparound: the oldest records are overwritten
+for i in range(5):
+    r.append(4, hw_rtc_mem.EVENT_WLAN_FAILED, 2000 + i)
+print(r.count())
+show(r.readBatch(10))
+r.remove(3)
+show(r.readBatch(10))
+r.remove(10)
+print(r.count())
+show(r.readBatch(10))
+r.append(4, hw_rtc_mem.EVENT_OTA_SUCCESS, 3000)
+show(r.readBatch(10))
+
+# clear() on power on: the sequence starts again
+r.clear()
+print(r.isValid(), r.count())
+r.append(1, hw_rtc_mem.EVENT_BOOT, 4000)
+show(r.readBatch(10))
+
+# an invalid header is not trusted
+r.mem[hw_rtc_mem.RING_OFFSET_COUNT] = 5
+print(r.isValid(), r.count())
@@ -0,0 +1,55 @@
+# Stand-ins for the modules of the esp32 port, so that the Python modules of
+# ports/esp32/modules can be tested on the unix port.  Import this module
+# before the module under test.
+
+import sys
+
+# sys.path[0] is the directory of the test
+sys.path.append(sys.path[0] + '/../../ports/esp32/modules')
+
+
+class _Module:
+    pass
+
+
+class _Mem32:
+    # machine.mem32: Words which were not written read as 0
+    def __init__(self):
+        self.words = {}
+
+    def __getitem__(self, addr):
+        return self.words.get(addr, 0)
+
+    def __setitem__(self, addr, value):
+        self.words[addr] = value
+
+
+# uctypes.bytearray_at(): The RTC SLOW memory is a plain bytearray
+uctypes = _Module()
+uctypes.bytearray_at = lambda addr, size: bytearray(size)
+
+machine = _Module()
+machine.PWRON_RESET = 1
+machine.HARD_RESET = 2
+machine.WDT_RESET = 3
+machine.DEEPSLEEP_RESET = 4
+machine.SOFT_RESET = 5
+machine.mem32 = _Mem32()
+machine.reset_cause = lambda: machine.DEEPSLEEP_RESET
+machine.unique_id = lambda: b'\x24\x0a\xc4\x00\x01\x02'
+
+network = _Module()
+
+# utime: The esp32 port has no floats in utime.time()
+import utime as _utime
+utime = _Module()
+utime.time = lambda: int(_utime.time())
+utime.sleep = _utime.sleep
+utime.sleep_ms = _utime.sleep_ms
+utime.ticks_ms = _utime.ticks_ms
+utime.ticks_diff = _utime.ticks_diff
+
+sys.modules['uctypes'] = uctypes
+sys.modules['machine'] = machine
+sys.modules['network'] = network
+sys.modules['utime'] = utime
@@ -0,0 +1,324 @@
+# Tests of the host side of tools/pyboard.py which don't need a board.
+# Run with CPython: python3 -m unittest discover -s tests/tools
+
+import os
+import sys
+import io
+import struct
+import hashlib
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'tools'))
+import pyboard
+
+
+class FakeSerial:
+    # returns the chunks one after the other, as they arrive on a serial line
+    def __init__(self, chunks):
+        self.chunks = [bytes(c) for c in chunks]
+        self.written = bytearray()
+
+    def read(self, size):
+        data = b''
+        while len(data) < size and self.chunks:
+            n = size - len(data)
+            data += self.chunks[0][:n]
+            self.chunks[0] = self.chunks[0][n:]
+            if not self.chunks[0]:
+                self.chunks.pop(0)
+        return data
+
+    def inWaiting(self):
+        return len(self.chunks[0]) if self.chunks else 0
+
+    def write(self, data):
+        self.written.extend(data)
+        return len(data)
+
+
+def fake_pyboard(chunks):
+    pyb = pyboard.Pyboard.__new__(pyboard.Pyboard)
+    pyb.rx_buf = bytearray()
+    pyb.serial = FakeSerial(chunks)
+    pyb.wait_readable = lambda timeout: None
+    return pyb
+
+
+class ReadUntilTest(unittest.TestCase):
+    def test_ending_in_one_chunk(self):
+        pyb = fake_pyboard([b'abc>'])
+        self.assertEqual(pyb.read_until(1, b'>'), b'abc>')
+
+    def test_ending_across_chunks(self):
+        pyb = fake_pyboard([b'OK', b'out\x04', b'\x04>'])
+        self.assertEqual(pyb.read_until(1, b'\x04\x04>'), b'OKout\x04\x04>')
+
+    def test_bytes_after_the_ending_are_kept(self):
+        pyb = fake_pyboard([b'one\x04two\x04', b'three'])
+        self.assertEqual(pyb.read_until(1, b'\x04'), b'one\x04')
+        self.assertEqual(pyb.read_until(1, b'\x04'), b'two\x04')
+        self.assertEqual(pyb.read(5), b'three')
+
+    def test_data_consumer(self):
+        # the consumer gets the data up to the ending, once
+        received = []
+        pyb = fake_pyboard([b'ab', b'c\x04d'])
+        self.assertEqual(pyb.read_until(1, b'\x04', data_consumer=received.append), b'abc\x04')
+        self.assertEqual(b''.join(received), b'abc\x04')
+        self.assertEqual(bytes(pyb.rx_buf), b'd')
+
+    def test_timeout(self):
+        pyb = fake_pyboard([b'no ending'])
+        self.assertEqual(pyb.read_until(1, b'>', timeout=0), b'no ending')
+
+
+class SyncBoard(pyboard.Pyboard):
+    # the board side of fs_sync: remote is the result of fs_hashes, the
+    # operations on the board are recorded
+    def __init__(self, remote):
+        self.remote = remote
+        self.ops = []
+
+    def fs_hashes(self, src=''):
+        return dict((path, entry) for path, entry in self.remote.items()
+            if not src or path.startswith(src.rstrip('/') + '/'))
+
+    def fs_put(self, src, dest, chunk_size=256, compress=False):
+        self.ops.append(('put', os.path.relpath(src, self.src_dir).replace(os.sep, '/'), dest))
+
+    def fs_mkdir(self, dir):
+        self.ops.append(('mkdir', dir))
+
+    def fs_makedirs(self, dir):
+        self.ops.append(('makedirs', dir))
+
+    def fs_rm(self, src):
+        self.ops.append(('rm', src))
+
+    def fs_rmdir(self, dir):
+        self.ops.append(('rmdir', dir))
+
+    def sync(self, src_dir, dest_dir='', **kwargs):
+        self.src_dir = src_dir
+        return self.fs_sync(src_dir, dest_dir, **kwargs)
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class SyncTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.src = self.tmp.name
+        self.write('main.py', b'print(1)')
+        self.write('lib/a.py', b'a = 1')
+        self.write('lib/sub/b.py', b'')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, path, data):
+        path = os.path.join(self.src, *path.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def test_local_hashes(self):
+        self.assertEqual(pyboard._local_hashes(self.src), {
+            'main.py': (8, sha256(b'print(1)')),
+            'lib': (-1, None),
+            'lib/a.py': (5, sha256(b'a = 1')),
+            'lib/sub': (-1, None),
+            'lib/sub/b.py': (0, sha256(b'')),
+        })
+
+    def test_empty_board(self):
+        pyb = SyncBoard({})
+        copied, deleted = pyb.sync(self.src)
+        self.assertEqual(copied, ['lib', 'lib/a.py', 'lib/sub', 'lib/sub/b.py', 'main.py'])
+        self.assertEqual(deleted, [])
+        # the parent directories are created first
+        self.assertEqual(pyb.ops, [
+            ('mkdir', 'lib'),
+            ('put', 'lib/a.py', 'lib/a.py'),
+            ('mkdir', 'lib/sub'),
+            ('put', 'lib/sub/b.py', 'lib/sub/b.py'),
+            ('put', 'main.py', 'main.py'),
+        ])
+
+    def test_only_changed_files(self):
+        pyb = SyncBoard({
+            'main.py': (8, sha256(b'print(2)')),
+            'lib': (-1, None),
+            'lib/a.py': (5, sha256(b'a = 1')),
+            'lib/sub': (-1, None),
+            'lib/sub/b.py': (0, sha256(b'')),
+            'boot.py': (3, sha256(b'abc')),
+        })
+        copied, deleted = pyb.sync(self.src)
+        self.assertEqual(copied, ['main.py'])
+        # nothing is deleted without delete=True
+        self.assertEqual(deleted, [])
+        self.assertEqual(pyb.ops, [('put', 'main.py', 'main.py')])
+
+    def test_delete(self):
+        pyb = SyncBoard({
+            'lib': (-1, None),
+            'lib/a.py': (5, sha256(b'a = 1')),
+            'lib/old': (-1, None),
+            'lib/old/deep': (-1, None),
+            'lib/old/deep/c.py': (1, sha256(b'c')),
+            'boot.py': (3, sha256(b'abc')),
+        })
+        copied, deleted = pyb.sync(self.src, delete=True)
+        self.assertEqual(copied, ['lib/sub', 'lib/sub/b.py', 'main.py'])
+        # files first, then the directories from the deepest on
+        self.assertEqual(deleted, ['lib/old/deep/c.py', 'boot.py', 'lib/old/deep', 'lib/old'])
+        self.assertEqual(pyb.ops[-4:], [
+            ('rm', 'lib/old/deep/c.py'),
+            ('rm', 'boot.py'),
+            ('rmdir', 'lib/old/deep'),
+            ('rmdir', 'lib/old'),
+        ])
+
+    def test_dest_dir(self):
+        # a missing dest_dir is created, the paths are below dest_dir
+        pyb = SyncBoard({'other.py': (1, sha256(b'x'))})
+        copied, deleted = pyb.sync(self.src, '/flash/app/', delete=True)
+        self.assertEqual(copied, ['/flash/app/lib', '/flash/app/lib/a.py', '/flash/app/lib/sub',
+            '/flash/app/lib/sub/b.py', '/flash/app/main.py'])
+        # files outside of dest_dir are kept
+        self.assertEqual(deleted, [])
+        self.assertEqual(pyb.ops[0], ('makedirs', '/flash/app/'))
+
+    def test_dry_run(self):
+        pyb = SyncBoard({'boot.py': (3, sha256(b'abc'))})
+        copied, deleted = pyb.sync(self.src, delete=True, dry_run=True)
+        self.assertEqual(len(copied), 5)
+        self.assertEqual(deleted, ['boot.py'])
+        self.assertEqual(pyb.ops, [])
+
+    def test_sync_command(self):
+        pyb = SyncBoard({'boot.py': (3, sha256(b'abc'))})
+        pyb.src_dir = self.src
+        out = []
+        self.assertEqual(pyboard.filesystem_command(pyb, ['sync', self.src], data_consumer=out.append), 0)
+        self.assertEqual(out[-1], b'5 copied, 0 deleted\n')
+        self.assertEqual(pyboard.filesystem_command(pyb, ['sync', self.src, ':'], delete=True, data_consumer=out.append), 0)
+        self.assertIn(b'rm :boot.py\n', out)
+        self.assertEqual(out[-1], b'5 copied, 1 deleted\n')
+
+
+def pack_args(*args):
+    # the arguments of a request of the remote mount: s32 or length prefixed
+    out = b''
+    for arg in args:
+        if isinstance(arg, int):
+            out += struct.pack('<i', arg)
+        else:
+            if not isinstance(arg, bytes):
+                arg = arg.encode('utf8')
+            out += struct.pack('<i', len(arg)) + arg
+    return out
+
+
+class RemoteFsHostTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, 'root')
+        os.makedirs(os.path.join(self.root, 'lib'))
+        with open(os.path.join(self.root, 'main.py'), 'wb') as f:
+            f.write(b'print(1)\n')
+        with open(os.path.join(self.tmp.name, 'secret'), 'wb') as f:
+            f.write(b'x')
+        self.host = pyboard.RemoteFsHost(self.root)
+
+    def tearDown(self):
+        self.host.close()
+        self.tmp.cleanup()
+
+    def call(self, cmd, *args):
+        answer = bytearray()
+        self.host.handle(cmd, io.BytesIO(pack_args(*args)).read, answer.extend)
+        return bytes(answer)
+
+    def s32(self, cmd, *args):
+        return struct.unpack('<i', self.call(cmd, *args))[0]
+
+    def test_stat(self):
+        result, mode, size, mtime = struct.unpack('<iiii', self.call(1, '/main.py'))
+        self.assertEqual((result, mode, size), (0, 0x8000, 9))
+        result, mode, size, mtime = struct.unpack('<iiii', self.call(1, 'lib'))
+        self.assertEqual((result, mode), (0, 0x4000))
+        self.assertEqual(self.s32(1, 'missing.py'), -2)
+
+    def test_ilistdir(self):
+        self.assertEqual(self.call(2, '/'), struct.pack('<i', 2)
+            + pack_args('lib', 0x4000) + pack_args('main.py', 0x8000))
+
+    def test_read(self):
+        fd = self.s32(3, 'main.py', 'rb')
+        self.assertGreater(fd, 0)
+        self.assertEqual(self.call(5, fd, 6, 100), pack_args(b'1)\n'))
+        self.assertEqual(self.call(5, fd, 0, 5), pack_args(b'print'))
+        self.assertEqual(self.s32(4, fd), 0)
+        # the fd is closed
+        self.assertEqual(self.s32(5, fd, 0, 5), -9)
+
+    def test_write(self):
+        fd = self.s32(3, 'lib/new.py', 'w')
+        self.assertEqual(self.s32(6, fd, b'x = 1'), 5)
+        self.assertEqual(self.s32(4, fd), 0)
+        with open(os.path.join(self.root, 'lib', 'new.py'), 'rb') as f:
+            self.assertEqual(f.read(), b'x = 1')
+
+    def test_files_and_directories(self):
+        self.assertEqual(self.s32(9, 'dir'), 0)
+        self.assertEqual(self.s32(9, 'dir'), -17)
+        self.assertEqual(self.s32(8, 'main.py', 'dir/main.py'), 0)
+        self.assertEqual(self.s32(10, 'dir'), -39)
+        self.assertEqual(self.s32(7, 'dir/main.py'), 0)
+        self.assertEqual(self.s32(7, 'dir/main.py'), -2)
+        self.assertEqual(self.s32(10, 'dir'), 0)
+        self.assertEqual(os.listdir(self.root), ['lib'])
+
+    def test_outside_of_root(self):
+        self.assertEqual(self.s32(1, '../secret'), -13)
+        self.assertEqual(self.s32(3, '/lib/../../secret', 'rb'), -13)
+        self.assertEqual(self.s32(7, '../secret'), -13)
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, 'secret')))
+
+    def test_malformed_arguments(self):
+        answer = bytearray()
+        self.host.handle(1, io.BytesIO(b'\x05\x00').read, answer.extend)
+        self.assertEqual(bytes(answer), struct.pack('<i', -22))
+        self.assertEqual(self.s32(1, b'\xff\xfe'), -22)
+
+    def test_intercept(self):
+        # a request in the output of the board is answered and removed, a
+        # CTRL-X without the framing is output
+        request = b'\x18\xfe\x01' + struct.pack('<i', len(pack_args('main.py'))) + pack_args('main.py')
+        serial = FakeSerial([b'out\x18put', request, b'end\x04'])
+        intercept = pyboard.SerialIntercept(serial, self.host)
+        data = b''
+        while not data.endswith(b'\x04'):
+            data += intercept.read(max(1, intercept.inWaiting()))
+        self.assertEqual(data, b'out\x18putend\x04')
+        self.assertEqual(struct.unpack('<ii', serial.written[:8]), (0, 0x8000))
+
+    def test_intercept_pacing(self):
+        # the answer is sent in chunks, the board asks for each one after the first
+        request = b'\x18\xfe\x05' + struct.pack('<i', 12)
+        fd = self.s32(3, 'main.py', 'rb')
+        with open(os.path.join(self.root, 'main.py'), 'wb') as f:
+            f.write(b'x' * 300)
+        serial = FakeSerial([request + pack_args(fd, 0, 300)[:12], b'\x06', b'\x06', b'>'])
+        intercept = pyboard.SerialIntercept(serial, self.host)
+        self.assertEqual(intercept.read(1), b'>')
+        self.assertEqual(bytes(serial.written), pack_args(b'x' * 300))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -64,11 +64,34 @@ Or:
 
     python pyboard.py test.py
 
+To keep the board open between invocations (no reset by opening the serial
+port, no soft reset rerunning boot.py), serve it from a daemon:
+
+    ./pyboard.py --device /dev/ttyUSB0 --serve localhost:9999
+    ./pyboard.py --device socket:localhost:9999 --no-soft-reset test.py
+
+To run code from a directory of the host without copying it to the board,
+mount the directory as /remote on the board:
+
+    ./pyboard.py --mount src -c 'import main'
+
+To run on a fleet of boards in parallel, repeat --device:
+
+    ./pyboard.py --device /dev/ttyUSB0 --device /dev/ttyUSB1 -f sync node_software
+
 """
 
 import sys
 import time
 import os
+import ast
+import io
+import zlib
+import errno
+import select
+import struct
+import hashlib
+import binascii
 
 try:
     stdout = sys.stdout.buffer
@@ -135,6 +158,9 @@ class TelnetToSerial:
         self.tn.write(data)
         return len(data)
 
+    def fileno(self):
+        return self.tn.fileno()
+
     def inWaiting(self):
         n_waiting = len(self.fifo)
         if not n_waiting:
@@ -180,11 +206,23 @@ class ProcessToSerial:
         self.subp.stdin.write(data)
         return len(data)
 
+    def fileno(self):
+        return self.subp.stdout.fileno()
+
     def inWaiting(self):
         #res = self.sel.select(0)
         res = self.poll.poll(0)
         if res:
-            return 1
+            # number of bytes in the pipe, so that they can be read in one call
+            try:
+                import fcntl
+                import termios
+                import array
+                n = array.array('i', [0])
+                fcntl.ioctl(self.subp.stdout.fileno(), termios.FIONREAD, n)
+                return max(1, n[0])
+            except (ImportError, IOError, OSError):
+                return 1
         return 0
 
 
@@ -220,16 +258,256 @@ class ProcessPtyToTerminal:
     def write(self, data):
         return self.ser.write(data)
 
+    def fileno(self):
+        return self.ser.fileno()
+
     def inWaiting(self):
         return self.ser.inWaiting()
 
 
+class SocketToSerial:
+    "Connect to a 'pyboard.py --serve' daemon which keeps the board open."
+
+    def __init__(self, addr):
+        import socket
+        host, port = addr.rsplit(':', 1)
+        try:
+            self.sock = socket.create_connection((host, int(port)), timeout=15)
+        except socket.error as er:
+            raise PyboardError('failed to connect to {}: {}'.format(addr, er))
+        self.sock.settimeout(None)
+
+    def close(self):
+        self.sock.close()
+
+    def read(self, size=1):
+        data = b''
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise PyboardError('connection to the daemon closed')
+            data += chunk
+        return data
+
+    def write(self, data):
+        self.sock.sendall(data)
+        return len(data)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def inWaiting(self):
+        import socket
+        if not select.select([self.sock], [], [], 0)[0]:
+            return 0
+        # a readable socket without data is closed: let read() raise
+        return max(1, len(self.sock.recv(4096, socket.MSG_PEEK)))
+
+
+class RemoteFsHost:
+    "Answers the requests of the remote mount of the board, see _MOUNT_SCRIPT."
+
+    # errno values of MicroPython, which may differ from the host
+    ERRNO = {'EPERM': 1, 'ENOENT': 2, 'EIO': 5, 'EBADF': 9, 'EACCES': 13, 'EEXIST': 17,
+        'ENOTDIR': 20, 'EISDIR': 21, 'EINVAL': 22, 'ENOSPC': 28, 'ENOTEMPTY': 39}
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.files = {}
+        self.next_fd = 1
+
+    def path(self, path):
+        # the path on the host; '..' can't leave the root
+        path = os.path.normpath(os.path.join(self.root, path.lstrip('/')))
+        if path != self.root and not path.startswith(os.path.join(self.root, '')):
+            raise OSError(errno.EACCES, path)
+        return path
+
+    def error(self, er):
+        for name, value in self.ERRNO.items():
+            if getattr(errno, name, None) == er.errno:
+                return -value
+        return -self.ERRNO['EIO']
+
+    # the commands 1 to 10, see handle()
+    COMMANDS = range(1, 11)
+
+    def handle(self, cmd, read, write):
+        # read() returns the arguments of the request, write() collects the answer
+        rd_s32 = lambda: struct.unpack('<i', read(4))[0]
+        rd_str = lambda: read(rd_s32()).decode('utf8')
+        wr_s32 = lambda value: write(struct.pack('<i', value))
+        try:
+            if cmd == 1:
+                # stat(path): result, mode, size, mtime
+                path = self.path(rd_str())
+                st = os.stat(path)
+                mode = 0x4000 if os.path.isdir(path) else 0x8000
+                write(struct.pack('<iiii', 0, mode, st.st_size, int(st.st_mtime)))
+            elif cmd == 2:
+                # ilistdir(path): count, (name, type) * count
+                path = self.path(rd_str())
+                names = sorted(os.listdir(path))
+                out = [struct.pack('<i', len(names))]
+                for name in names:
+                    data = name.encode('utf8')
+                    kind = 0x4000 if os.path.isdir(os.path.join(path, name)) else 0x8000
+                    out.append(struct.pack('<i', len(data)) + data + struct.pack('<i', kind))
+                write(b''.join(out))
+            elif cmd == 3:
+                # open(path, mode): fd
+                path, mode = rd_str(), rd_str()
+                path = self.path(path)
+                mode = mode.replace('t', '').replace('b', '') + 'b'
+                fd = self.next_fd
+                self.files[fd] = open(path, mode)
+                self.next_fd += 1
+                wr_s32(fd)
+            elif cmd == 4:
+                # close(fd)
+                f = self.files.pop(rd_s32(), None)
+                if f is not None:
+                    f.close()
+                wr_s32(0)
+            elif cmd == 5:
+                # read(fd, offset, size): data
+                fd, offset, size = rd_s32(), rd_s32(), rd_s32()
+                f = self.files[fd]
+                f.seek(offset)
+                data = f.read(size)
+                write(struct.pack('<i', len(data)) + data)
+            elif cmd == 6:
+                # write(fd, data): size
+                fd = rd_s32()
+                data = read(rd_s32())
+                wr_s32(self.files[fd].write(data) or 0)
+            elif cmd == 7:
+                os.remove(self.path(rd_str()))
+                wr_s32(0)
+            elif cmd == 8:
+                old, new = rd_str(), rd_str()
+                os.rename(self.path(old), self.path(new))
+                wr_s32(0)
+            elif cmd == 9:
+                os.mkdir(self.path(rd_str()))
+                wr_s32(0)
+            elif cmd == 10:
+                os.rmdir(self.path(rd_str()))
+                wr_s32(0)
+        except OSError as er:
+            wr_s32(self.error(er))
+        except KeyError:
+            wr_s32(-self.ERRNO['EBADF'])
+        except (struct.error, UnicodeError):
+            # malformed arguments
+            wr_s32(-self.ERRNO['EINVAL'])
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+
+class SerialIntercept:
+    """Wraps the transport of a Pyboard: the requests of the remote mount
+    are served and removed from the output.  A request starts with CTRL-X,
+    0xfe (never part of UTF-8 text), a known command and the length of the
+    arguments; anything else is output of the board."""
+
+    # the size of the chunks of an answer: the stdin buffer of the board holds 256 bytes
+    CHUNK = 128
+    # the maximum length of the arguments of a request
+    MAX_ARGS = 1 << 24
+
+    def __init__(self, serial, handler):
+        self.orig = serial
+        self.handler = handler
+        # output of the board, requests removed
+        self.buf = bytearray()
+        # received, but not yet checked for requests
+        self.pending = bytearray()
+
+    def _read_raw(self, size):
+        # exactly size bytes, bypassing the interception: the arguments of a request
+        data = bytes(self.pending[:size])
+        del self.pending[:size]
+        if len(data) < size:
+            data += self.orig.read(size - len(data))
+        return data
+
+    def _write_paced(self, data):
+        # the board asks for every chunk after the first with CTRL-F
+        for i in range(0, len(data), self.CHUNK):
+            if i and self._read_raw(1) != b'\x06':
+                raise PyboardError('remote mount: lost synchronisation with the board')
+            self.orig.write(data[i:i + self.CHUNK])
+
+    def _process(self):
+        while self.pending:
+            i = self.pending.find(b'\x18')
+            if i < 0:
+                self.buf.extend(self.pending)
+                self.pending = bytearray()
+                break
+            self.buf.extend(self.pending[:i])
+            del self.pending[:i]
+            header = self.pending[:7]
+            if (len(header) > 1 and header[1] != 0xfe) or (len(header) > 2 and header[2] not in self.handler.COMMANDS):
+                # not a request
+                self.buf.append(0x18)
+                del self.pending[:1]
+                continue
+            if len(header) < 7:
+                # wait for the rest of the header
+                break
+            size = struct.unpack('<i', header[3:7])[0]
+            if not 0 <= size <= self.MAX_ARGS:
+                self.buf.append(0x18)
+                del self.pending[:1]
+                continue
+            del self.pending[:7]
+            args = io.BytesIO(self._read_raw(size))
+            answer = bytearray()
+            self.handler.handle(header[2], args.read, answer.extend)
+            self._write_paced(answer)
+
+    def close(self):
+        self.handler.close()
+        self.orig.close()
+
+    def read(self, size=1):
+        while len(self.buf) < size:
+            self.pending.extend(self.orig.read(max(1, self.orig.inWaiting())))
+            self._process()
+        data = bytes(self.buf[:size])
+        del self.buf[:size]
+        return data
+
+    def write(self, data):
+        return self.orig.write(data)
+
+    def fileno(self):
+        return self.orig.fileno()
+
+    def inWaiting(self):
+        n = self.orig.inWaiting()
+        if n > 0:
+            self.pending.extend(self.orig.read(n))
+            self._process()
+        return len(self.buf)
+
+
 class Pyboard:
     def __init__(self, device, baudrate=115200, user='micro', password='python', wait=0):
+        self.use_raw_paste = True
+        # bytes received after the ending searched by read_until
+        self.rx_buf = bytearray()
         if device.startswith("exec:"):
             self.serial = ProcessToSerial(device[len("exec:"):])
         elif device.startswith("execpty:"):
             self.serial = ProcessPtyToTerminal(device[len("qemupty:"):])
+        elif device.startswith("socket:"):
+            self.serial = SocketToSerial(device[len("socket:"):])
         elif device and device[0].isdigit() and device[-1].isdigit() and device.count('.') == 3:
             # device looks like an IP address
             self.serial = TelnetToSerial(device, user, password, read_timeout=10)
@@ -259,47 +537,86 @@ class Pyboard:
     def close(self):
         self.serial.close()
 
+    def read(self, size):
+        # read from the bytes left over by read_until first
+        if not self.rx_buf:
+            return self.serial.read(size)
+        data = bytes(self.rx_buf[:size])
+        del self.rx_buf[:size]
+        if len(data) < size:
+            data += self.serial.read(size - len(data))
+        return data
+
+    def in_waiting(self):
+        return len(self.rx_buf) + self.serial.inWaiting()
+
+    def wait_readable(self, timeout):
+        try:
+            select.select([self.serial], [], [], timeout)
+        except (TypeError, ValueError, AttributeError, select.error, OSError, IOError):
+            # no file descriptor to wait on (eg pyserial on Windows): poll
+            time.sleep(0.01)
+
     def read_until(self, min_num_bytes, ending, timeout=10, data_consumer=None):
-        data = self.serial.read(min_num_bytes)
-        if data_consumer:
-            data_consumer(data)
-        timeout_count = 0
+        # timeout: seconds without receiving data
+        data = bytearray()
+        new_data = self.read(min_num_bytes)
+        timeout_end = None if timeout is None else time.time() + timeout
         while True:
-            if data.endswith(ending):
+            # search incrementally: the ending may start in the previous data
+            search_start = max(0, len(data) - len(ending) + 1)
+            data.extend(new_data)
+            index = data.find(ending, search_start)
+            if index >= 0:
+                # keep the bytes following the ending for the next read
+                end = index + len(ending)
+                self.rx_buf[0:0] = data[end:]
+                new_data = new_data[:len(new_data) - (len(data) - end)]
+                del data[end:]
+            if data_consumer and new_data:
+                data_consumer(bytes(new_data))
+            if index >= 0:
                 break
-            elif self.serial.inWaiting() > 0:
-                new_data = self.serial.read(1)
-                data = data + new_data
-                if data_consumer:
-                    data_consumer(new_data)
-                timeout_count = 0
+            n = self.in_waiting()
+            if n > 0:
+                # read everything available in one call
+                new_data = self.read(n)
+                if timeout is not None:
+                    timeout_end = time.time() + timeout
+                continue
+            new_data = b''
+            if timeout is None:
+                self.wait_readable(None)
             else:
-                timeout_count += 1
-                if timeout is not None and timeout_count >= 100 * timeout:
+                remaining = timeout_end - time.time()
+                if remaining <= 0:
                     break
-                time.sleep(0.01)
-        return data
+                self.wait_readable(remaining)
+        return bytes(data)
 
-    def enter_raw_repl(self):
+    def enter_raw_repl(self, soft_reset=True):
+        # soft_reset=False keeps the state of the board: boot.py doesn't run
+        # again and the modules imported stay imported
         self.serial.write(b'\r\x03\x03') # ctrl-C twice: interrupt any running program
 
         # flush input (without relying on serial.flushInput())
-        n = self.serial.inWaiting()
+        n = self.in_waiting()
         while n > 0:
-            self.serial.read(n)
-            n = self.serial.inWaiting()
+            self.read(n)
+            n = self.in_waiting()
 
         self.serial.write(b'\r\x01') # ctrl-A: enter raw REPL
-        data = self.read_until(1, b'raw REPL; CTRL-B to exit\r\n>')
-        if not data.endswith(b'raw REPL; CTRL-B to exit\r\n>'):
-            print(data)
-            raise PyboardError('could not enter raw repl')
-
-        self.serial.write(b'\x04') # ctrl-D: soft reset
-        data = self.read_until(1, b'soft reboot\r\n')
-        if not data.endswith(b'soft reboot\r\n'):
-            print(data)
-            raise PyboardError('could not enter raw repl')
+        if soft_reset:
+            data = self.read_until(1, b'raw REPL; CTRL-B to exit\r\n>')
+            if not data.endswith(b'raw REPL; CTRL-B to exit\r\n>'):
+                print(data)
+                raise PyboardError('could not enter raw repl')
+
+            self.serial.write(b'\x04') # ctrl-D: soft reset
+            data = self.read_until(1, b'soft reboot\r\n')
+            if not data.endswith(b'soft reboot\r\n'):
+                print(data)
+                raise PyboardError('could not enter raw repl')
         # By splitting this into 2 reads, it allows boot.py to print stuff,
         # which will show up after the soft reboot and before the raw REPL.
         data = self.read_until(1, b'raw REPL; CTRL-B to exit\r\n')
@@ -326,6 +643,39 @@ class Pyboard:
         # return normal and error output
         return data, data_err
 
+    def raw_paste_write(self, command_bytes):
+        # read initial header, with window size
+        data = self.read(2)
+        window_size = bytearray(data)[0] | bytearray(data)[1] << 8
+        window_remain = window_size
+
+        # write out the command, as fast as the device grants windows
+        i = 0
+        while i < len(command_bytes):
+            while window_remain == 0 or self.in_waiting():
+                data = self.read(1)
+                if data == b'\x01':
+                    # device indicated that a new window of data can be sent
+                    window_remain += window_size
+                elif data == b'\x04':
+                    # device indicated abrupt end (eg compile error), acknowledge it and finish
+                    self.serial.write(b'\x04')
+                    return
+                else:
+                    raise PyboardError('unexpected read during raw paste: {}'.format(data))
+            b = command_bytes[i:min(i + window_remain, len(command_bytes))]
+            self.serial.write(b)
+            window_remain -= len(b)
+            i += len(b)
+
+        # indicate end of data
+        self.serial.write(b'\x04')
+
+        # wait for device to acknowledge end of data
+        data = self.read_until(1, b'\x04')
+        if not data.endswith(b'\x04'):
+            raise PyboardError('could not complete raw paste: {}'.format(data))
+
     def exec_raw_no_follow(self, command):
         if isinstance(command, bytes):
             command_bytes = command
@@ -337,6 +687,22 @@ class Pyboard:
         if not data.endswith(b'>'):
             raise PyboardError('could not enter raw repl')
 
+        if self.use_raw_paste:
+            # try to enter raw-paste mode
+            self.serial.write(b'\x05A\x01')
+            data = self.read(2)
+            if data == b'R\x01':
+                # device supports raw-paste mode: flow controlled, no sleeps
+                return self.raw_paste_write(command_bytes)
+            elif data != b'R\x00':
+                # device doesn't know raw-paste mode: CTRL-A reset the raw REPL
+                data = self.read_until(1, b'w REPL; CTRL-B to exit\r\n>')
+                if not data.endswith(b'w REPL; CTRL-B to exit\r\n>'):
+                    print(data)
+                    raise PyboardError('could not enter raw repl')
+            # don't try raw-paste mode again on this connection
+            self.use_raw_paste = False
+
         # write command
         for i in range(0, len(command_bytes), 256):
             self.serial.write(command_bytes[i:min(i + 256, len(command_bytes))])
@@ -344,7 +710,7 @@ class Pyboard:
         self.serial.write(b'\x04')
 
         # check if we could exec command
-        data = self.serial.read(2)
+        data = self.read(2)
         if data != b'OK':
             raise PyboardError('could not exec command (response: %r)' % data)
 
@@ -372,10 +738,502 @@ class Pyboard:
         t = str(self.eval('pyb.RTC().datetime()'), encoding='utf8')[1:-1].split(', ')
         return int(t[4]) * 3600 + int(t[5]) * 60 + int(t[6])
 
+    def fs_hashes(self, src=''):
+        # returns {path: (size, sha256)} of the files and {path: (-1, None)} of the
+        # directories below src, computed on the board in one exec
+        ret, ret_err = self.exec_raw(_FS_HASH_SCRIPT % (src,), timeout=None)
+        if ret_err:
+            raise PyboardError('exception', ret, ret_err)
+        entries = {}
+        for line in ret.decode('utf-8').splitlines():
+            path, size, digest = ast.literal_eval(line)
+            entries[path] = (size, digest and digest.decode('ascii'))
+        return entries
+
+    def fs_put(self, src, dest, chunk_size=256, compress=False):
+        if compress:
+            return self.fs_put_compressed(src, dest)
+        self.exec_("f=open(%r,'wb')\nw=f.write" % (dest,))
+        with open(src, 'rb') as f:
+            while True:
+                data = f.read(chunk_size)
+                if not data:
+                    break
+                self.exec_('w(' + _bytes_repr(data) + ')')
+        self.exec_('f.close()')
+
+    def fs_put_compressed(self, src, dest, chunk_size=144, wbits=10):
+        # the board inflates the data with uzlib.DecompIO straight into the file:
+        # it asks for every chunk with CTRL-F, the chunks are base64 lines which
+        # fit into the stdin buffer of the board
+        # wbits: the board allocates a window of 2**wbits bytes
+        with open(src, 'rb') as f:
+            data = f.read()
+        # gzip: uzlib.DecompIO gets the window size of the zlib format wrong
+        z = zlib.compressobj(9, zlib.DEFLATED, 16 + wbits)
+        data = z.compress(data) + z.flush()
+        self.exec_raw_no_follow(_FS_PUT_COMPRESSED_SCRIPT % (16 + wbits, dest))
+        offset = 0
+        while True:
+            c = self.read(1)
+            if c != b'\x06':
+                # end of the script: let follow() read the output
+                self.rx_buf[0:0] = c
+                break
+            self.serial.write(binascii.b2a_base64(data[offset:offset + chunk_size]))
+            offset += chunk_size
+        ret, ret_err = self.follow(timeout=10)
+        if ret_err:
+            raise PyboardError('exception', ret, ret_err)
+
+    def fs_get(self, src, dest, chunk_size=256):
+        self.exec_("f=open(%r,'rb')\nr=f.read" % (src,))
+        with open(dest, 'wb') as f:
+            while True:
+                data = ast.literal_eval(self.exec_('print(r(%u))' % chunk_size).decode('ascii'))
+                if not data:
+                    break
+                f.write(data)
+        self.exec_('f.close()')
+
+    def fs_mkdir(self, dir):
+        self.exec_("import uos\nuos.mkdir(%r)" % (dir,))
+
+    def fs_makedirs(self, dir):
+        # creates dir and its missing parents on the board
+        self.exec_(_FS_MAKEDIRS_SCRIPT % (dir,))
+
+    def fs_rm(self, src):
+        self.exec_("import uos\nuos.remove(%r)" % (src,))
+
+    def fs_rmdir(self, dir):
+        self.exec_("import uos\nuos.rmdir(%r)" % (dir,))
+
+    def fs_sync(self, src_dir, dest_dir='', delete=False, dry_run=False, progress=None, compress=False):
+        # copies the files of src_dir which are new or changed on the board
+        # delete: also removes the files and directories below dest_dir on the
+        # board which don't exist in src_dir
+        # compress: see fs_put_compressed
+        # returns (copied, deleted) lists of paths on the board
+        progress = progress or (lambda action, path: None)
+        local = _local_hashes(src_dir)
+        remote = self.fs_hashes(dest_dir)
+        join = lambda path: dest_dir.rstrip('/') + '/' + path if dest_dir else path
+        if dest_dir and not remote and not dry_run:
+            # dest_dir is empty or doesn't exist yet
+            self.fs_makedirs(dest_dir)
+
+        copied = []
+        for path in sorted(local):
+            size, digest = local[path]
+            if remote.get(join(path)) == (size, digest):
+                continue
+            progress('cp' if size >= 0 else 'mkdir', join(path))
+            if not dry_run:
+                if size < 0:
+                    if join(path) not in remote:
+                        self.fs_mkdir(join(path))
+                else:
+                    self.fs_put(os.path.join(src_dir, *path.split('/')), join(path), compress=compress)
+            copied.append(join(path))
+
+        deleted = []
+        if delete:
+            stale = set(remote) - set(join(path) for path in local)
+            # files first, then the directories from the deepest on
+            for path in sorted(stale, key=lambda path: (remote[path][0] < 0, -path.count('/'), path)):
+                progress('rm', path)
+                if not dry_run:
+                    if remote[path][0] < 0:
+                        self.fs_rmdir(path)
+                    else:
+                        self.fs_rm(path)
+                deleted.append(path)
+        return copied, deleted
+
+    def mount_local(self, src_dir, mount_point='/remote'):
+        # mounts src_dir of the host on the board and changes into it: the
+        # board imports and opens the files of the host while a command runs
+        self.serial = SerialIntercept(self.serial, RemoteFsHost(src_dir))
+        self.exec_(_MOUNT_SCRIPT % (mount_point, mount_point))
+        self.mount_point = mount_point
+
+    def umount_local(self):
+        self.exec_("import uos\nuos.chdir('/')\nuos.umount(%r)" % (self.mount_point,))
+        self.serial.handler.close()
+        self.serial = self.serial.orig
+
 # in Python2 exec is a keyword so one must use "exec_"
 # but for Python3 we want to provide the nicer version "exec"
 setattr(Pyboard, "exec", Pyboard.exec_)
 
+# prints one line (path, size, sha256) per file and (path, -1, None) per directory
+_FS_HASH_SCRIPT = """
+import uos, uhashlib, ubinascii
+def _h(d):
+    b = bytearray(512)
+    for e in uos.ilistdir(d) if d else uos.ilistdir():
+        if e[0] in ('.', '..'):
+            continue
+        p = d + '/' + e[0] if d else e[0]
+        if e[1] & 0x4000:
+            print(repr((p, -1, None)))
+            _h(p)
+            continue
+        h = uhashlib.sha256()
+        n = 0
+        with open(p, 'rb') as f:
+            while True:
+                k = f.readinto(b)
+                if not k:
+                    break
+                h.update(memoryview(b)[:k])
+                n += k
+        print(repr((p, n, ubinascii.hexlify(h.digest()))))
+try:
+    _h(%r)
+except OSError:
+    pass
+del _h
+"""
+
+# like os.makedirs(dir, exist_ok=True)
+_FS_MAKEDIRS_SCRIPT = """
+import uos
+_p = ''
+for _n in %r.split('/'):
+    _p += _n
+    if _n:
+        try:
+            uos.stat(_p)
+        except OSError:
+            uos.mkdir(_p)
+    _p += '/'
+del _p, _n
+"""
+
+# inflates base64 lines from stdin into a file, CTRL-F requests the next line
+_FS_PUT_COMPRESSED_SCRIPT = """
+import sys, uio, uzlib, ubinascii
+class _R(uio.IOBase):
+    def __init__(self):
+        self.b = b''
+        self.i = 0
+    def readinto(self, buf):
+        if self.i >= len(self.b):
+            sys.stdout.write('\\x06')
+            self.b = ubinascii.a2b_base64(sys.stdin.readline())
+            self.i = 0
+        n = min(len(buf), len(self.b) - self.i)
+        buf[:n] = self.b[self.i:self.i + n]
+        self.i += n
+        return n
+_d = uzlib.DecompIO(_R(), %d)
+_b = bytearray(256)
+with open(%r, 'wb') as _f:
+    while True:
+        _n = _d.readinto(_b)
+        if not _n:
+            break
+        _f.write(memoryview(_b)[:_n])
+del _R, _d, _b, _f, _n
+"""
+
+# the board side of the remote mount: every request is CTRL-X, the command
+# and its arguments on stdout, the host answers on stdin, see RemoteFsHost
+_MOUNT_SCRIPT = """
+import sys, uos, uio, ustruct, micropython
+class _RemoteCmd:
+    def __init__(self):
+        self.fin = getattr(sys.stdin, 'buffer', sys.stdin)
+        self.fout = getattr(sys.stdout, 'buffer', sys.stdout)
+        self.buf4 = bytearray(4)
+        self.avail = 0
+    def begin(self, cmd, *args):
+        # the request: CTRL-X, 0xfe, cmd, the length of the arguments and the
+        # arguments, each an s32 or a length prefixed string
+        args = [a.encode('utf8') if isinstance(a, str) else a for a in args]
+        n = 0
+        for a in args:
+            n += 4 if isinstance(a, int) else 4 + len(a)
+        # the answer is binary: no KeyboardInterrupt on CTRL-C
+        micropython.kbd_intr(-1)
+        self.fout.write(ustruct.pack('<BBBi', 0x18, 0xfe, cmd, n))
+        for a in args:
+            if isinstance(a, int):
+                self.wr_s32(a)
+            else:
+                self.wr_s32(len(a))
+                self.fout.write(a)
+        # the host sends the answer in chunks of 128 bytes which fit into the
+        # stdin buffer, CTRL-F asks for the next one
+        self.avail = 128
+    def end(self):
+        micropython.kbd_intr(3)
+    def rd_into(self, buf, n):
+        mv = memoryview(buf)
+        i = 0
+        while i < n:
+            if not self.avail:
+                self.fout.write(b'\x06')
+                self.avail = 128
+            k = self.fin.readinto(mv[i:min(n, i + self.avail)])
+            i += k
+            self.avail -= k
+    def rd_s32(self):
+        self.rd_into(self.buf4, 4)
+        return ustruct.unpack('<i', self.buf4)[0]
+    def rd_str(self):
+        b = bytearray(self.rd_s32())
+        self.rd_into(b, len(b))
+        return str(b, 'utf8')
+    def wr_s32(self, i):
+        self.fout.write(ustruct.pack('<i', i))
+    def result(self):
+        # the caller reads the rest of the answer, then calls end()
+        r = self.rd_s32()
+        if r < 0:
+            self.end()
+            raise OSError(-r)
+        return r
+class _RemoteFile(uio.IOBase):
+    def __init__(self, cmd, fd, is_text):
+        self.cmd = cmd
+        self.fd = fd
+        self.is_text = is_text
+        # block cache: the importer reads 24 bytes at a time
+        self.block = bytearray(512)
+        self.block_pos = 0
+        self.block_len = 0
+        self.pos = 0
+    def ioctl(self, request, arg):
+        if request == 4:
+            self.close()
+        return 0
+    def close(self):
+        if self.fd is not None:
+            self.cmd.begin(4, self.fd)
+            self.fd = None
+            self.cmd.result()
+            self.cmd.end()
+    def __enter__(self):
+        return self
+    def __exit__(self, a, b, c):
+        self.close()
+    def readinto(self, buf):
+        # fills buf unless at the end of the file: the importer takes a
+        # short read for the end
+        done = 0
+        while done < len(buf):
+            off = self.pos - self.block_pos
+            if off < 0 or off >= self.block_len:
+                if not self._read_block():
+                    break
+                off = self.pos - self.block_pos
+            n = min(len(buf) - done, self.block_len - off)
+            buf[done:done + n] = memoryview(self.block)[off:off + n]
+            self.pos += n
+            done += n
+        return done
+    def _read_block(self):
+        # one request for the block containing pos, False at the end of the file
+        if self.fd is None:
+            raise OSError(9)
+        c = self.cmd
+        self.block_pos = self.pos - self.pos %% len(self.block)
+        c.begin(5, self.fd, self.block_pos, len(self.block))
+        n = c.rd_s32()
+        if n >= 0:
+            c.rd_into(self.block, n)
+        c.end()
+        if n < 0:
+            raise OSError(-n)
+        self.block_len = n
+        return self.pos - self.block_pos < n
+    def read(self, n=-1):
+        out = bytearray()
+        buf = bytearray(len(self.block))
+        while n < 0 or len(out) < n:
+            k = self.readinto(memoryview(buf)[:len(buf) if n < 0 else min(len(buf), n - len(out))])
+            if not k:
+                break
+            out.extend(memoryview(buf)[:k])
+        return str(out, 'utf8') if self.is_text else bytes(out)
+    def readline(self):
+        out = bytearray()
+        buf = bytearray(1)
+        while self.readinto(buf) and buf[0] != 10:
+            out.extend(buf)
+        if buf[0] == 10:
+            out.extend(buf)
+        return str(out, 'utf8') if self.is_text else bytes(out)
+    def write(self, buf):
+        if self.fd is None:
+            raise OSError(9)
+        if isinstance(buf, str):
+            buf = buf.encode('utf8')
+        c = self.cmd
+        c.begin(6, self.fd, buf)
+        self.block_len = 0
+        n = c.result()
+        c.end()
+        return n
+class _RemoteFS:
+    def __init__(self, cmd):
+        self.cmd = cmd
+        self.cwd = '/'
+    def mount(self, readonly, mkfs):
+        pass
+    def umount(self):
+        pass
+    def _abs(self, path):
+        if not path.startswith('/'):
+            path = self.cwd.rstrip('/') + '/' + path
+        return path
+    def _call(self, cmd, *args):
+        self.cmd.begin(cmd, *args)
+        return self.cmd.result()
+    def _do(self, cmd, *args):
+        self._call(cmd, *args)
+        self.cmd.end()
+    def chdir(self, path):
+        path = self._abs(path)
+        if not self.stat(path)[0] & 0x4000:
+            raise OSError(20)
+        self.cwd = path
+    def getcwd(self):
+        return self.cwd
+    def stat(self, path):
+        self._call(1, self._abs(path))
+        c = self.cmd
+        mode, size, mtime = c.rd_s32(), c.rd_s32(), c.rd_s32()
+        c.end()
+        return (mode, 0, 0, 0, 0, 0, size, mtime, mtime, mtime)
+    def ilistdir(self, path='.'):
+        n = self._call(2, self._abs(path))
+        c = self.cmd
+        entries = [(c.rd_str(), c.rd_s32(), 0) for i in range(n)]
+        c.end()
+        return iter(entries)
+    def open(self, path, mode='r'):
+        fd = self._call(3, self._abs(path), mode)
+        self.cmd.end()
+        return _RemoteFile(self.cmd, fd, 'b' not in mode)
+    def remove(self, path):
+        self._do(7, self._abs(path))
+    def rename(self, old, new):
+        self._do(8, self._abs(old), self._abs(new))
+    def mkdir(self, path):
+        self._do(9, self._abs(path))
+    def rmdir(self, path):
+        self._do(10, self._abs(path))
+uos.mount(_RemoteFS(_RemoteCmd()), %r)
+uos.chdir(%r)
+"""
+
+def _bytes_repr(data):
+    # Python2 doesn't prefix the repr of bytes
+    r = repr(data)
+    return r if r.startswith('b') else 'b' + r
+
+def _local_hashes(src_dir):
+    # same format as Pyboard.fs_hashes, paths relative to src_dir
+    entries = {}
+    for root, dirs, files in os.walk(src_dir):
+        rel = os.path.relpath(root, src_dir).replace(os.sep, '/')
+        rel = '' if rel == '.' else rel + '/'
+        for d in dirs:
+            entries[rel + d] = (-1, None)
+        for name in files:
+            with open(os.path.join(root, name), 'rb') as f:
+                data = f.read()
+            entries[rel + name] = (len(data), hashlib.sha256(data).hexdigest())
+    return entries
+
+def filesystem_command(pyb, args, compress=False, delete=False, data_consumer=stdout_write_bytes):
+    # cp [:]src [:]dest: a ':' prefix is a path on the board
+    # sync local_dir [:dest_dir], delete: see Pyboard.fs_sync
+    # returns the exit status
+    def fname_remote(src):
+        if src.startswith(':'):
+            src = src[1:]
+        return src
+
+    def write_line(line):
+        data_consumer(bytes(line + '\n', 'utf8'))
+
+    def progress(action, path):
+        write_line('{} :{}'.format(action, path))
+
+    cmd = args[0] if args else None
+    try:
+        if cmd == 'cp' and len(args) == 3:
+            src, dest = args[1:]
+            if src.startswith(':') and not dest.startswith(':'):
+                pyb.fs_get(fname_remote(src), dest)
+            elif dest.startswith(':') and not src.startswith(':'):
+                pyb.fs_put(src, fname_remote(dest), compress=compress)
+            else:
+                raise PyboardError('cp: exactly one of source and destination must start with ":"')
+        elif cmd == 'sync' and len(args) in (2, 3):
+            dest = fname_remote(args[2]) if len(args) == 3 else ''
+            copied, deleted = pyb.fs_sync(args[1], dest, delete=delete, progress=progress, compress=compress)
+            write_line('{} copied, {} deleted'.format(len(copied), len(deleted)))
+        else:
+            raise PyboardError('usage: -f cp [:]src [:]dest | -f sync local_dir [:dest_dir]')
+    except PyboardError as er:
+        write_line(str(er))
+        return 1
+    return 0
+
+def serve(pyb, addr):
+    # keeps the connection to the board open and forwards it to one client
+    # at a time: the clients use the device 'socket:<addr>'
+    # the output of the board while no client is connected is printed
+    import socket
+    host, port = addr.rsplit(':', 1)
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, int(port)))
+    listener.listen(1)
+    print('serving the board on socket:{}'.format(addr))
+    conn = None
+    try:
+        while True:
+            waiting = [pyb.serial, conn or listener]
+            readable = select.select(waiting, [], [], 0.1)[0]
+            if listener in readable:
+                conn = listener.accept()[0]
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            elif conn in readable:
+                try:
+                    data = conn.recv(4096)
+                except socket.error:
+                    data = b''
+                if data:
+                    pyb.serial.write(data)
+                else:
+                    conn.close()
+                    conn = None
+            # the transport may buffer data without its fd being readable
+            n = pyb.in_waiting()
+            if n > 0:
+                data = pyb.read(n)
+                if conn is None:
+                    stdout_write_bytes(data)
+                else:
+                    try:
+                        conn.sendall(data)
+                    except socket.error:
+                        conn.close()
+                        conn = None
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if conn is not None:
+            conn.close()
+        listener.close()
+
 def execfile(filename, device='/dev/ttyACM0', baudrate=115200, user='micro', password='python'):
     pyb = Pyboard(device, baudrate, user, password)
     pyb.enter_raw_repl()
@@ -387,78 +1245,170 @@ def execfile(filename, device='/dev/ttyACM0', baudrate=115200, user='micro', pas
 def main():
     import argparse
     cmd_parser = argparse.ArgumentParser(description='Run scripts on the pyboard.')
-    cmd_parser.add_argument('--device', default='/dev/ttyACM0', help='the serial device or the IP address of the pyboard')
+    cmd_parser.add_argument('--device', action='append', help='the serial device or the IP address of the pyboard, repeat it to run on a fleet of boards in parallel [default /dev/ttyACM0]')
+    cmd_parser.add_argument('-j', '--jobs', type=int, default=0, help='the number of boards of a fleet to run at the same time [default all]')
     cmd_parser.add_argument('-b', '--baudrate', default=115200, help='the baud rate of the serial device')
     cmd_parser.add_argument('-u', '--user', default='micro', help='the telnet login username')
     cmd_parser.add_argument('-p', '--password', default='python', help='the telnet login password')
     cmd_parser.add_argument('-c', '--command', help='program passed in as string')
     cmd_parser.add_argument('-w', '--wait', default=0, type=int, help='seconds to wait for USB connected board to become available')
     cmd_parser.add_argument('--follow', action='store_true', help='follow the output after running the scripts [default if no scripts given]')
+    cmd_parser.add_argument('-f', '--filesystem', action='store_true', help='perform a filesystem action: cp [:]src [:]dest, sync local_dir [:dest_dir]')
+    cmd_parser.add_argument('--delete', action='store_true', help='sync: remove the files on the board which don\'t exist in local_dir')
+    cmd_parser.add_argument('-z', '--compress', action='store_true', help='compress the files copied to the board (needs uzlib on the board)')
+    cmd_parser.add_argument('--no-soft-reset', action='store_true', help='enter the raw REPL without a soft reset: boot.py is not run again')
+    cmd_parser.add_argument('-m', '--mount', metavar='DIR', help='mount the local directory DIR as /remote on the board and change into it while running the command and files')
+    cmd_parser.add_argument('--serve', metavar='HOST:PORT', help='keep the board open and serve it to clients using --device socket:HOST:PORT')
     cmd_parser.add_argument('files', nargs='*', help='input files')
     args = cmd_parser.parse_args()
 
-    # open the connection to the pyboard
-    try:
-        pyb = Pyboard(args.device, args.baudrate, args.user, args.password, args.wait)
-    except PyboardError as er:
-        print(er)
-        sys.exit(1)
-
-    # run any command or file(s)
-    if args.command is not None or len(args.files):
-        # we must enter raw-REPL mode to execute commands
-        # this will do a soft-reset of the board
+    devices = args.device or ['/dev/ttyACM0']
+    # a board can only be opened once: drop repeated devices, keep the order
+    devices = [device for i, device in enumerate(devices) if device not in devices[:i]]
+    if len(devices) > 1:
+        if args.serve:
+            cmd_parser.error('--serve takes a single device')
+        if args.command is None and not args.files and not args.follow:
+            cmd_parser.error('a fleet of devices needs a command, files or -f')
+        sys.exit(run_fleet(args, devices))
+
+    if args.serve:
+        # open the connection to the pyboard
         try:
-            pyb.enter_raw_repl()
+            pyb = Pyboard(devices[0], args.baudrate, args.user, args.password, args.wait)
         except PyboardError as er:
             print(er)
-            pyb.close()
             sys.exit(1)
+        serve(pyb, args.serve)
+        pyb.close()
+        return
 
-        def execbuffer(buf):
-            try:
-                ret, ret_err = pyb.exec_raw(buf, timeout=None, data_consumer=stdout_write_bytes)
-            except PyboardError as er:
-                print(er)
-                pyb.close()
-                sys.exit(1)
-            except KeyboardInterrupt:
-                sys.exit(1)
-            if ret_err:
-                pyb.exit_raw_repl()
-                pyb.close()
-                stdout_write_bytes(ret_err)
-                sys.exit(1)
-
-        # run the command, if given
-        if args.command is not None:
-            execbuffer(args.command.encode('utf-8'))
-
-        # run any files
-        for filename in args.files:
-            with open(filename, 'rb') as f:
-                pyfile = f.read()
-                execbuffer(pyfile)
-
-        # exiting raw-REPL just drops to friendly-REPL mode
-        pyb.exit_raw_repl()
-
-    # if asked explicitly, or no files given, then follow the output
-    if args.follow or (args.command is None and len(args.files) == 0):
-        try:
-            ret, ret_err = pyb.follow(timeout=None, data_consumer=stdout_write_bytes)
-        except PyboardError as er:
-            print(er)
-            sys.exit(1)
-        except KeyboardInterrupt:
-            sys.exit(1)
-        if ret_err:
-            pyb.close()
-            stdout_write_bytes(ret_err)
-            sys.exit(1)
+    try:
+        sys.exit(run_device(args, devices[0]))
+    except KeyboardInterrupt:
+        sys.exit(1)
 
-    # close the connection to the pyboard
-    pyb.close()
+def run_device(args, device, data_consumer=stdout_write_bytes):
+    # runs the command, files or filesystem action of the command line on one
+    # board, the output of the board and the errors go to data_consumer
+    # returns the exit status
+    def write_error(er):
+        data_consumer(bytes('{}\n'.format(er), 'utf8'))
+
+    # open the connection to the pyboard
+    try:
+        pyb = Pyboard(device, args.baudrate, args.user, args.password, args.wait)
+    except PyboardError as er:
+        write_error(er)
+        return 1
+
+    try:
+        # run any command or file(s)
+        files = args.files
+        if args.command is not None or len(files):
+            # we must enter raw-REPL mode to execute commands
+            # this will do a soft-reset of the board unless --no-soft-reset
+            pyb.enter_raw_repl(soft_reset=not args.no_soft_reset)
+
+            def execbuffer(buf):
+                ret, ret_err = pyb.exec_raw(buf, timeout=None, data_consumer=data_consumer)
+                if ret_err:
+                    data_consumer(ret_err)
+                    return False
+                return True
+
+            def run():
+                # run the command, if given
+                if args.command is not None:
+                    if not execbuffer(args.command.encode('utf-8')):
+                        return 1
+
+                if args.filesystem:
+                    # the files are the arguments of the filesystem action
+                    return filesystem_command(pyb, files, compress=args.compress, delete=args.delete, data_consumer=data_consumer)
+
+                # run any files
+                for filename in files:
+                    with open(filename, 'rb') as f:
+                        pyfile = f.read()
+                    if not execbuffer(pyfile):
+                        return 1
+                return 0
+
+            if args.mount:
+                pyb.mount_local(args.mount)
+                try:
+                    status = run()
+                finally:
+                    # the board must not wait for this process later
+                    pyb.umount_local()
+            else:
+                status = run()
+
+            # exiting raw-REPL just drops to friendly-REPL mode
+            pyb.exit_raw_repl()
+            if status:
+                return status
+            if args.filesystem:
+                files = []
+
+        # if asked explicitly, or no files given, then follow the output
+        if args.follow or (args.command is None and len(files) == 0 and not args.filesystem):
+            ret, ret_err = pyb.follow(timeout=None, data_consumer=data_consumer)
+            if ret_err:
+                data_consumer(ret_err)
+                return 1
+    except PyboardError as er:
+        write_error(er)
+        return 1
+    finally:
+        # close the connection to the pyboard
+        pyb.close()
+    return 0
+
+def run_fleet(args, devices):
+    # runs run_device() on all devices in parallel, at most args.jobs at a time
+    # the output of a board is printed as a block when the board is done
+    # returns the exit status: 1 if it failed on any board
+    # devices must not contain a device twice, the results are keyed by the device
+    import threading
+    results = {}
+    lock = threading.Lock()
+    jobs = threading.Semaphore(args.jobs or len(devices))
+
+    def worker(device):
+        with jobs:
+            output = bytearray()
+            start = time.time()
+            try:
+                status = run_device(args, device, data_consumer=output.extend)
+            except Exception as er:
+                # eg serial.SerialException: report it, the other boards go on
+                output.extend(bytes('{}: {}\n'.format(type(er).__name__, er), 'utf8'))
+                status = 1
+            duration = time.time() - start
+        with lock:
+            results[device] = (status, duration)
+            stdout_write_bytes(bytes('==== {} (exit {}, {:.1f}s)\n'.format(device, status, duration), 'utf8'))
+            stdout_write_bytes(bytes(output))
+
+    threads = [threading.Thread(target=worker, args=(device,)) for device in devices]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    try:
+        for thread in threads:
+            # a timeout keeps CTRL-C working while waiting
+            while thread.is_alive():
+                thread.join(0.5)
+    except KeyboardInterrupt:
+        return 1
+
+    failed = [device for device in devices if results[device][0]]
+    print('==== {} of {} boards ok, {:.1f}s max'.format(len(devices) - len(failed), len(devices), max(r[1] for r in results.values())))
+    for device in failed:
+        print('failed: {}'.format(device))
+    return 1 if failed else 0
 
 if __name__ == "__main__":
     main()
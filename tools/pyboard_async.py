@@ -0,0 +1,602 @@
+#!/usr/bin/env python3
+#
+# This file is part of the MicroPython project, http://micropython.org/
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2016 Damien P. George
+# Copyright (c) 2017 Paul Sokolovsky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+asyncio pyboard interface
+
+The same raw REPL protocol as pyboard.py, but every transport feeds an
+asyncio.StreamReader: one event loop can drive many boards and follow
+their output without polling.  Python 3.7 or newer.
+
+Transports, selected by the device string like in pyboard.py:
+
+    exec:<command>       a process, talking over its stdin/stdout
+    ws://<ip>[:port]     WebREPL (a websocket, port 8266 by default)
+    <ip>                 telnet
+    <serial device>      a serial port, needs pyserial (POSIX only)
+
+Example usage:
+
+    import asyncio
+    import pyboard_async
+
+    async def main():
+        pyb = await pyboard_async.connect('/dev/ttyUSB0')
+        await pyb.enter_raw_repl()
+        print(await pyb.eval('1 + 1'))
+        await pyb.exit_raw_repl()
+        await pyb.close()
+
+    asyncio.run(main())
+
+Without a board, the unix port runs the board side of the raw REPL:
+
+    ./pyboard_async.py --device 'exec:../ports/unix/micropython raw_repl_unix.py' -c 'print(1)'
+
+"""
+
+import os
+import sys
+import ast
+import zlib
+import time
+import struct
+import base64
+import asyncio
+import binascii
+
+from pyboard import PyboardError, stdout_write_bytes, _bytes_repr, _FS_HASH_SCRIPT, _FS_PUT_COMPRESSED_SCRIPT
+
+
+class ProcessTransport:
+    "Execute a process and talk to it using its stdin/stdout."
+
+    def __init__(self, cmd):
+        self.cmd = cmd
+
+    async def open(self):
+        self.proc = await asyncio.create_subprocess_shell(self.cmd,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, start_new_session=True)
+        self.reader = self.proc.stdout
+
+    async def write(self, data):
+        self.proc.stdin.write(data)
+        await self.proc.stdin.drain()
+
+    async def close(self):
+        import signal
+        if self.proc.returncode is None:
+            os.killpg(os.getpgid(self.proc.pid), signal.SIGTERM)
+        await self.proc.wait()
+
+
+class TelnetTransport:
+    "The telnet server of the board, logging in like TelnetToSerial."
+
+    def __init__(self, ip, user, password, port=23):
+        self.ip = ip
+        self.user = user
+        self.password = password
+        self.port = port
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.ip, self.port)
+        # the telnet options sent by the board are skipped with the prompts
+        await self._expect(b'Login as:')
+        await self.write(bytes(self.user, 'ascii') + b'\r\n')
+        await self._expect(b'Password:')
+        # needed because of internal implementation details of the telnet server
+        await asyncio.sleep(0.2)
+        await self.write(bytes(self.password, 'ascii') + b'\r\n')
+        await self._expect(b'for more information.')
+
+    async def _expect(self, ending, timeout=15):
+        try:
+            await asyncio.wait_for(self.reader.readuntil(ending), timeout)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+            raise PyboardError('Failed to establish a telnet connection with the board')
+
+    async def write(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def close(self):
+        self.writer.close()
+
+
+class WebREPLTransport:
+    "WebREPL: the terminal is carried in websocket text frames."
+
+    def __init__(self, url, password):
+        hostport = url[len('ws://'):].split('/', 1)[0]
+        if ':' in hostport:
+            self.host, port = hostport.rsplit(':', 1)
+            self.port = int(port)
+        else:
+            self.host, self.port = hostport, 8266
+        self.password = password
+
+    async def open(self):
+        self.ws_reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        key = base64.b64encode(os.urandom(16))
+        self.writer.write(b'GET / HTTP/1.1\r\nHost: ' + bytes(self.host, 'ascii') +
+            b'\r\nConnection: Upgrade\r\nUpgrade: websocket\r\nSec-WebSocket-Key: ' + key +
+            b'\r\nSec-WebSocket-Version: 13\r\n\r\n')
+        await self.writer.drain()
+        headers = await asyncio.wait_for(self.ws_reader.readuntil(b'\r\n\r\n'), 15)
+        if b' 101 ' not in headers.split(b'\r\n', 1)[0]:
+            raise PyboardError('WebREPL handshake failed: {}'.format(headers.split(b'\r\n', 1)[0]))
+
+        # the frames are unpacked in the background into the reader
+        self.reader = asyncio.StreamReader()
+        self.receiver = asyncio.ensure_future(self._receive())
+
+        try:
+            await asyncio.wait_for(self.reader.readuntil(b'Password: '), 15)
+            await self.write(bytes(self.password, 'utf8') + b'\r')
+            data = await asyncio.wait_for(self.reader.readuntil(b'\r\n>>> '), 15)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+            raise PyboardError('WebREPL login failed')
+        if b'Access denied' in data:
+            raise PyboardError('WebREPL: access denied')
+
+    async def _receive(self):
+        try:
+            while True:
+                header = await self.ws_reader.readexactly(2)
+                opcode = header[0] & 0x0f
+                length = header[1] & 0x7f
+                if length == 126:
+                    length = struct.unpack('>H', await self.ws_reader.readexactly(2))[0]
+                elif length == 127:
+                    length = struct.unpack('>Q', await self.ws_reader.readexactly(8))[0]
+                mask = await self.ws_reader.readexactly(4) if header[1] & 0x80 else None
+                payload = await self.ws_reader.readexactly(length)
+                if mask:
+                    payload = _mask(payload, mask)
+                if opcode == 8:
+                    # close frame
+                    break
+                if opcode in (0, 1, 2):
+                    self.reader.feed_data(payload)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        self.reader.feed_eof()
+
+    async def write(self, data):
+        # frames of a client are masked, the terminal is written in text frames
+        mask = os.urandom(4)
+        if len(data) < 126:
+            header = struct.pack('>BB', 0x81, 0x80 | len(data))
+        elif len(data) < 0x10000:
+            header = struct.pack('>BBH', 0x81, 0x80 | 126, len(data))
+        else:
+            header = struct.pack('>BBQ', 0x81, 0x80 | 127, len(data))
+        self.writer.write(header + mask + _mask(data, mask))
+        await self.writer.drain()
+
+    async def close(self):
+        self.receiver.cancel()
+        self.writer.close()
+
+
+def _mask(data, mask):
+    # XOR with the mask repeated, as one big integer operation
+    n = len(data)
+    key = (mask * (n // 4 + 1))[:n]
+    return (int.from_bytes(data, 'big') ^ int.from_bytes(key, 'big')).to_bytes(n, 'big')
+
+
+class SerialTransport:
+    "A serial port: pyserial without timeout, woken up by the event loop."
+
+    def __init__(self, device, baudrate=115200):
+        self.device = device
+        self.baudrate = baudrate
+
+    async def open(self):
+        import serial
+        self.serial = serial.Serial(self.device, baudrate=self.baudrate, timeout=0)
+        self.reader = asyncio.StreamReader()
+        self.loop = asyncio.get_event_loop()
+        # add_reader() needs a file descriptor: not available on Windows
+        self.loop.add_reader(self.serial.fileno(), self._on_readable)
+
+    def _on_readable(self):
+        try:
+            data = self.serial.read(self.serial.in_waiting or 1)
+        except (OSError, IOError):
+            self.loop.remove_reader(self.serial.fileno())
+            self.reader.feed_eof()
+            return
+        if data:
+            self.reader.feed_data(data)
+
+    async def write(self, data):
+        # pyserial blocks until the data is sent: don't block the event loop
+        await self.loop.run_in_executor(None, self.serial.write, data)
+
+    async def close(self):
+        self.loop.remove_reader(self.serial.fileno())
+        self.serial.close()
+
+
+class AsyncPyboard:
+    def __init__(self, transport):
+        self.transport = transport
+        self.use_raw_paste = True
+        # bytes received after the ending searched by read_until
+        self.rx_buf = bytearray()
+
+    async def close(self):
+        await self.transport.close()
+
+    async def _receive(self, timeout=None):
+        data = await asyncio.wait_for(self.transport.reader.read(4096), timeout)
+        if not data:
+            raise PyboardError('connection to the board closed')
+        return data
+
+    async def read(self, size):
+        while len(self.rx_buf) < size:
+            self.rx_buf.extend(await self._receive())
+        data = bytes(self.rx_buf[:size])
+        del self.rx_buf[:size]
+        return data
+
+    async def read_until(self, ending, timeout=10, data_consumer=None):
+        # timeout: seconds without receiving data, None waits forever
+        # returns the data up to the ending, or all data received on timeout
+        data = self.rx_buf
+        self.rx_buf = bytearray()
+        consumed = 0
+        search_start = 0
+        while True:
+            index = data.find(ending, search_start)
+            if index >= 0:
+                # keep the bytes following the ending for the next read
+                end = index + len(ending)
+                self.rx_buf = data[end:]
+                del data[end:]
+            if data_consumer and consumed < len(data):
+                data_consumer(bytes(data[consumed:]))
+                consumed = len(data)
+            if index >= 0:
+                break
+            # the ending may start in the data already received
+            search_start = max(0, len(data) - len(ending) + 1)
+            try:
+                data.extend(await self._receive(timeout))
+            except asyncio.TimeoutError:
+                break
+        return bytes(data)
+
+    async def enter_raw_repl(self, soft_reset=True):
+        await self.transport.write(b'\r\x03\x03') # ctrl-C twice: interrupt any running program
+
+        # flush input: drop what arrives until the board is quiet
+        self.rx_buf = bytearray()
+        try:
+            while True:
+                await self._receive(0.1)
+        except asyncio.TimeoutError:
+            pass
+
+        await self.transport.write(b'\r\x01') # ctrl-A: enter raw REPL
+        if soft_reset:
+            data = await self.read_until(b'raw REPL; CTRL-B to exit\r\n>')
+            if not data.endswith(b'raw REPL; CTRL-B to exit\r\n>'):
+                raise PyboardError('could not enter raw repl: {}'.format(data))
+
+            await self.transport.write(b'\x04') # ctrl-D: soft reset
+            data = await self.read_until(b'soft reboot\r\n')
+            if not data.endswith(b'soft reboot\r\n'):
+                raise PyboardError('could not enter raw repl: {}'.format(data))
+        # boot.py may print stuff after the soft reboot and before the raw REPL
+        data = await self.read_until(b'raw REPL; CTRL-B to exit\r\n')
+        if not data.endswith(b'raw REPL; CTRL-B to exit\r\n'):
+            raise PyboardError('could not enter raw repl: {}'.format(data))
+
+    async def exit_raw_repl(self):
+        await self.transport.write(b'\r\x02') # ctrl-B: enter friendly REPL
+
+    async def follow(self, timeout, data_consumer=None):
+        # wait for normal output
+        data = await self.read_until(b'\x04', timeout=timeout, data_consumer=data_consumer)
+        if not data.endswith(b'\x04'):
+            raise PyboardError('timeout waiting for first EOF reception')
+        data = data[:-1]
+
+        # wait for error output
+        data_err = await self.read_until(b'\x04', timeout=timeout)
+        if not data_err.endswith(b'\x04'):
+            raise PyboardError('timeout waiting for second EOF reception')
+        data_err = data_err[:-1]
+
+        # return normal and error output
+        return data, data_err
+
+    async def raw_paste_write(self, command_bytes):
+        # read initial header, with window size
+        data = await self.read(2)
+        window_size = data[0] | data[1] << 8
+        window_remain = window_size
+
+        # write out the command, as fast as the device grants windows
+        i = 0
+        while i < len(command_bytes):
+            while window_remain == 0 or self.rx_buf:
+                data = await self.read(1)
+                if data == b'\x01':
+                    # device indicated that a new window of data can be sent
+                    window_remain += window_size
+                elif data == b'\x04':
+                    # device indicated abrupt end (eg compile error), acknowledge it and finish
+                    await self.transport.write(b'\x04')
+                    return
+                else:
+                    raise PyboardError('unexpected read during raw paste: {}'.format(data))
+            b = command_bytes[i:min(i + window_remain, len(command_bytes))]
+            await self.transport.write(b)
+            window_remain -= len(b)
+            i += len(b)
+
+        # indicate end of data
+        await self.transport.write(b'\x04')
+
+        # wait for device to acknowledge end of data
+        data = await self.read_until(b'\x04')
+        if not data.endswith(b'\x04'):
+            raise PyboardError('could not complete raw paste: {}'.format(data))
+
+    async def exec_raw_no_follow(self, command):
+        if isinstance(command, bytes):
+            command_bytes = command
+        else:
+            command_bytes = bytes(command, encoding='utf8')
+
+        # check we have a prompt
+        data = await self.read_until(b'>')
+        if not data.endswith(b'>'):
+            raise PyboardError('could not enter raw repl')
+
+        if self.use_raw_paste:
+            # try to enter raw-paste mode
+            await self.transport.write(b'\x05A\x01')
+            data = await self.read(2)
+            if data == b'R\x01':
+                # device supports raw-paste mode: flow controlled
+                return await self.raw_paste_write(command_bytes)
+            elif data != b'R\x00':
+                # device doesn't know raw-paste mode: CTRL-A reset the raw REPL
+                data = await self.read_until(b'w REPL; CTRL-B to exit\r\n>')
+                if not data.endswith(b'w REPL; CTRL-B to exit\r\n>'):
+                    raise PyboardError('could not enter raw repl')
+            # don't try raw-paste mode again on this connection
+            self.use_raw_paste = False
+
+        # write command
+        for i in range(0, len(command_bytes), 256):
+            await self.transport.write(command_bytes[i:min(i + 256, len(command_bytes))])
+            await asyncio.sleep(0.01)
+        await self.transport.write(b'\x04')
+
+        # check if we could exec command
+        data = await self.read(2)
+        if data != b'OK':
+            raise PyboardError('could not exec command (response: %r)' % data)
+
+    async def exec_raw(self, command, timeout=10, data_consumer=None):
+        await self.exec_raw_no_follow(command)
+        return await self.follow(timeout, data_consumer)
+
+    async def eval(self, expression):
+        ret = await self.exec_('print({})'.format(expression))
+        return ret.strip()
+
+    async def exec_(self, command, timeout=10):
+        ret, ret_err = await self.exec_raw(command, timeout)
+        if ret_err:
+            raise PyboardError('exception', ret, ret_err)
+        return ret
+
+    async def execfile(self, filename):
+        with open(filename, 'rb') as f:
+            pyfile = f.read()
+        return await self.exec_(pyfile)
+
+    # file operations, see the Pyboard.fs_* of pyboard.py
+
+    async def fs_hashes(self, src=''):
+        entries = {}
+        for line in (await self.exec_(_FS_HASH_SCRIPT % (src,), timeout=None)).decode('utf-8').splitlines():
+            path, size, digest = ast.literal_eval(line)
+            entries[path] = (size, digest and digest.decode('ascii'))
+        return entries
+
+    async def fs_put(self, src, dest, chunk_size=256, compress=False):
+        if compress:
+            return await self.fs_put_compressed(src, dest)
+        await self.exec_("f=open(%r,'wb')\nw=f.write" % (dest,))
+        with open(src, 'rb') as f:
+            while True:
+                data = f.read(chunk_size)
+                if not data:
+                    break
+                await self.exec_('w(' + _bytes_repr(data) + ')')
+        await self.exec_('f.close()')
+
+    async def fs_put_compressed(self, src, dest, chunk_size=144, wbits=10):
+        with open(src, 'rb') as f:
+            data = f.read()
+        z = zlib.compressobj(9, zlib.DEFLATED, 16 + wbits)
+        data = z.compress(data) + z.flush()
+        await self.exec_raw_no_follow(_FS_PUT_COMPRESSED_SCRIPT % (16 + wbits, dest))
+        offset = 0
+        while True:
+            c = await self.read(1)
+            if c != b'\x06':
+                # end of the script: let follow() read the output
+                self.rx_buf[0:0] = c
+                break
+            await self.transport.write(binascii.b2a_base64(data[offset:offset + chunk_size]))
+            offset += chunk_size
+        ret, ret_err = await self.follow(timeout=10)
+        if ret_err:
+            raise PyboardError('exception', ret, ret_err)
+
+    async def fs_get(self, src, dest, chunk_size=256):
+        await self.exec_("f=open(%r,'rb')\nr=f.read" % (src,))
+        with open(dest, 'wb') as f:
+            while True:
+                data = ast.literal_eval((await self.exec_('print(r(%u))' % chunk_size)).decode('ascii'))
+                if not data:
+                    break
+                f.write(data)
+        await self.exec_('f.close()')
+
+    async def fs_mkdir(self, dir):
+        await self.exec_("import uos\nuos.mkdir(%r)" % (dir,))
+
+    async def fs_rm(self, src):
+        await self.exec_("import uos\nuos.remove(%r)" % (src,))
+
+    async def fs_rmdir(self, dir):
+        await self.exec_("import uos\nuos.rmdir(%r)" % (dir,))
+
+# "exec" is a keyword in Python2 only, see pyboard.py
+setattr(AsyncPyboard, "exec", AsyncPyboard.exec_)
+
+
+async def connect(device, baudrate=115200, user='micro', password='python'):
+    if device.startswith('exec:'):
+        transport = ProcessTransport(device[len('exec:'):])
+    elif device.startswith('ws://'):
+        transport = WebREPLTransport(device, password)
+    elif device and device[0].isdigit() and device[-1].isdigit() and device.count('.') == 3:
+        # device looks like an IP address
+        transport = TelnetTransport(device, user, password)
+    else:
+        transport = SerialTransport(device, baudrate)
+    try:
+        await transport.open()
+    except (OSError, ImportError, asyncio.TimeoutError) as er:
+        raise PyboardError('failed to access {}: {}'.format(device, er))
+    return AsyncPyboard(transport)
+
+
+async def run_device(args, device, data_consumer):
+    # runs the command and files on one board, returns the exit status
+    # errors are reported to data_consumer: the other boards go on
+    try:
+        pyb = await connect(device, args.baudrate, args.user, args.password)
+    except PyboardError as er:
+        data_consumer(bytes('{}\n'.format(er), 'utf8'))
+        return 1
+    try:
+        sources = []
+        if args.command is not None:
+            sources.append(args.command.encode('utf-8'))
+        for filename in args.files:
+            with open(filename, 'rb') as f:
+                sources.append(f.read())
+        if sources:
+            await pyb.enter_raw_repl(soft_reset=not args.no_soft_reset)
+            for source in sources:
+                ret, ret_err = await pyb.exec_raw(source, timeout=None, data_consumer=data_consumer)
+                if ret_err:
+                    data_consumer(ret_err)
+                    return 1
+            await pyb.exit_raw_repl()
+        if args.follow or not sources:
+            ret, ret_err = await pyb.follow(timeout=None, data_consumer=data_consumer)
+            if ret_err:
+                data_consumer(ret_err)
+                return 1
+    except PyboardError as er:
+        data_consumer(bytes('{}\n'.format(er), 'utf8'))
+        return 1
+    finally:
+        await pyb.close()
+    return 0
+
+
+class LinePrefixer:
+    "Writes complete lines prefixed by the device: the output of the boards doesn't mix within a line."
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.pending = b''
+
+    def __call__(self, data):
+        lines = (self.pending + data.replace(b'\x04', b'')).split(b'\n')
+        self.pending = lines.pop()
+        for line in lines:
+            stdout_write_bytes(self.prefix + line + b'\n')
+
+    def flush(self):
+        if self.pending:
+            self(b'\n')
+
+
+async def main_async(args):
+    devices = args.device or ['/dev/ttyACM0']
+    if len(devices) == 1:
+        return await run_device(args, devices[0], stdout_write_bytes)
+
+    start = time.time()
+    consumers = [LinePrefixer(bytes('{}: '.format(device), 'utf8')) for device in devices]
+    statuses = await asyncio.gather(*[run_device(args, device, consumer)
+        for device, consumer in zip(devices, consumers)])
+    for consumer in consumers:
+        consumer.flush()
+    failed = [device for device, status in zip(devices, statuses) if status]
+    print('==== {} of {} boards ok in {:.1f}s'.format(len(devices) - len(failed), len(devices), time.time() - start))
+    for device in failed:
+        print('failed: {}'.format(device))
+    return 1 if failed else 0
+
+
+def main():
+    import argparse
+    cmd_parser = argparse.ArgumentParser(description='Run scripts on one or many boards, using asyncio.')
+    cmd_parser.add_argument('--device', action='append', help='the serial device, IP address, ws://IP or exec:command of a board, repeat it for many boards [default /dev/ttyACM0]')
+    cmd_parser.add_argument('-b', '--baudrate', default=115200, help='the baud rate of the serial device')
+    cmd_parser.add_argument('-u', '--user', default='micro', help='the telnet login username')
+    cmd_parser.add_argument('-p', '--password', default='python', help='the telnet login or WebREPL password')
+    cmd_parser.add_argument('-c', '--command', help='program passed in as string')
+    cmd_parser.add_argument('--follow', action='store_true', help='follow the output after running the scripts [default if no scripts given]')
+    cmd_parser.add_argument('--no-soft-reset', action='store_true', help='enter the raw REPL without a soft reset')
+    cmd_parser.add_argument('files', nargs='*', help='input files')
+    args = cmd_parser.parse_args()
+    try:
+        sys.exit(asyncio.run(main_async(args)))
+    except KeyboardInterrupt:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
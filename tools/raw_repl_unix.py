@@ -0,0 +1,76 @@
+# Raw REPL for the unix port, so that pyboard.py and pyboard_async.py can be
+# tested without a board.  The unix port has no raw REPL of its own: this
+# script implements the board side of it on stdin/stdout.
+#
+#   ./pyboard.py --device 'exec:../ports/unix/micropython raw_repl_unix.py' test.py
+#
+# CTRL-D on an empty line simulates the soft reset by clearing the globals.
+# Raw-paste mode is declined with 'R\x00', the host falls back to the
+# normal raw REPL.
+
+import sys
+
+
+def read_char(buf=bytearray(1)):
+    if not sys.stdin.readinto(buf):
+        sys.exit(0)
+    return buf[0]
+
+
+def write(data):
+    # stdout of the unix port is not buffered
+    sys.stdout.write(data)
+
+
+def execute(source, globals_):
+    try:
+        exec(str(source, 'utf8'), globals_)
+    except BaseException as e:
+        write(b'\x04')
+        sys.print_exception(e, sys.stdout)
+    else:
+        write(b'\x04')
+    write(b'\x04')
+
+
+def main():
+    # like on a board, import from the current directory, not the one of this script
+    sys.path[0] = ''
+    globals_ = {'__name__': '__main__'}
+    raw = False
+    line = bytearray()
+    while True:
+        c = read_char()
+        if c == 1:
+            # CTRL-A: enter the raw REPL, or the raw-paste request '\x05A\x01'
+            if raw and line == b'\x05A':
+                write(b'R\x00')
+            else:
+                write(b'raw REPL; CTRL-B to exit\r\n>')
+            raw = True
+            line = bytearray()
+        elif not raw:
+            # the friendly REPL is not implemented
+            continue
+        elif c == 2:
+            # CTRL-B: exit the raw REPL
+            write(b'\r\n')
+            raw = False
+        elif c == 3:
+            # CTRL-C: clear the line
+            line = bytearray()
+        elif c == 4:
+            # CTRL-D: execute, or soft reset on an empty line
+            write(b'OK')
+            if not line:
+                globals_ = {'__name__': '__main__'}
+                write(b'\r\nsoft reboot\r\nraw REPL; CTRL-B to exit\r\n>')
+                continue
+            execute(line, globals_)
+            line = bytearray()
+            write(b'>')
+        else:
+            line.append(c)
+
+
+main()